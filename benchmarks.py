@@ -0,0 +1,289 @@
+# benchmarks.py
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from bson.json_util import dumps
+from pymongo import UpdateOne
+from database import get_client
+from distance_matrix import HospitalDistanceMatrix
+from donor_index import DonorSpatialIndex
+from donor_stats import COMPLETE_BLOOD_TYPES, update_secondary_data, apply_donor_delta, apply_inventory_deltas
+from hospital_data import get_complete_hospital_data, get_complete_hospital_data_with_location
+from hospital_matching import (
+    match_surplus_for_shortage,
+    match_shortage_for_surplus,
+    match_donors_for_shortage,
+    match_donors_for_surplus
+)
+from managmentAuth import update_hospital_inventory, update_inventory_batch
+from session_tokens import issue_token
+from synthetic_data import generate_dataset
+
+BENCHMARK_DB = "gotbloodBenchmark"
+RESULTS_DIR = "benchmark_results"
+# name -> (hospitals, donors, blood bags)
+SCALES = {
+    "small": (200, 10000, 40000),
+    "medium": (1000, 100000, 400000),
+    "large": (5000, 500000, 2000000)
+}
+DEFAULT_SCALES = ["small", "medium", "large"]
+FLAG_RATIO = 0.15       # Share of (hospital, bloodType) pairs flagged surplus, and again shortage.
+QUERIES_PER_ROUND = 20  # Matching and write benchmarks run this many calls per timed round.
+
+#######################################
+# Dataset
+#######################################
+
+def seed_scale(db, hospitals, donors, bags, seed=42):
+    """
+    Loads a synthetic dataset and gives every hospital seeded surplus/shortage flags
+    (via locations.flagSettings, which the full rebuild picks up), so the matching
+    benchmarks have hospitals to find.
+    """
+    generate_dataset(db, hospitals, donors, bags, seed=seed, with_passwords=False, build_stats=False)
+    rng = random.Random(seed)
+    operations = []
+    for loc in db.locations.find({}, {"_id": 1}):
+        flag_settings = {}
+        for bt in COMPLETE_BLOOD_TYPES:
+            roll = rng.random()
+            flag_settings[bt] = {"surplus": roll < FLAG_RATIO, "shortage": FLAG_RATIO <= roll < 2 * FLAG_RATIO}
+        operations.append(UpdateOne({"_id": loc["_id"]}, {"$set": {"flagSettings": flag_settings}}))
+    if operations:
+        db.locations.bulk_write(operations, ordered=False)
+    update_secondary_data(db)
+
+def sample_hospitals(db, count, seed=42):
+    hospitals = [(loc["name"], loc["city"]) for loc in db.locations.find({}, {"_id": 0, "name": 1, "city": 1})]
+    return random.Random(seed).sample(hospitals, min(count, len(hospitals)))
+
+#######################################
+# Baseline Reader
+#######################################
+
+def n_plus_one_reader(db):
+    """
+    The previous get_complete_hospital_data_with_location, unchanged: one
+    locations.find_one per donorStats record. Kept here only as the 'before' baseline
+    of the read_hospital_data_with_location benchmarks.
+    """
+    complete_blood_types = ["O+", "A+", "B+", "AB+", "O-", "A-", "B-", "AB-"]
+    records = list(db.donorStats.find())
+    results = []
+    
+    for rec in records:
+        hospital_name = rec.get("hospital")
+        city = rec.get("city")
+        # Retrieve hospital's coordinates from the locations collection.
+        loc = db.locations.find_one({"name": hospital_name, "city": city})
+        coordinates = loc.get("coordinates") if loc and "coordinates" in loc else {}
+        
+        inv_lookup = {inv.get("bloodType"): inv.get("totalBloodCC", 0)
+                      for inv in rec.get("inventoryStats", [])}
+        flag_lookup = {bt.get("bloodType"): {"surplus": bt.get("surplus", False),
+                                             "shortage": bt.get("shortage", False)}
+                       for bt in rec.get("bloodTypeStats", [])}
+        
+        blood_data = []
+        for bt in complete_blood_types:
+            blood_data.append({
+                "bloodType": bt,
+                "totalBloodCC": inv_lookup.get(bt, 0),
+                "surplus": flag_lookup.get(bt, {}).get("surplus", False),
+                "shortage": flag_lookup.get(bt, {}).get("shortage", False)
+            })
+        
+        results.append({
+            "hospital": hospital_name,
+            "city": city,
+            "coordinates": coordinates,
+            "bloodData": blood_data
+        })
+    return results
+
+#######################################
+# Benchmarks
+#######################################
+
+def build_benchmarks(db, seed=42):
+    """
+    Returns {name: callable} for everything the suite times. Each callable runs one
+    round; write benchmarks undo their own changes within the round so repeated
+    rounds see the same data.
+
+    Matching is timed twice: "_endpoint" runs what the Flask routes run, answering from
+    a distance matrix and donor index built once up front (outside the timed rounds),
+    and "_db" queries the database directly, the fallback used without them.
+
+    The /hospital/data/loc payload is timed as read only and as read plus the JSON
+    serialization the route does ("serve_"), each also with the old N+1 reader. The app
+    itself is never imported: it would index, backfill and watch the configured database.
+    """
+    rng = random.Random(seed)
+    hospitals = sample_hospitals(db, QUERIES_PER_ROUND, seed)
+    queries = [(hospital, city, rng.choice(COMPLETE_BLOOD_TYPES)) for hospital, city in hospitals]
+    tokens = {(hospital, city): issue_token(hospital, city) for hospital, city in hospitals}
+    distance_matrix = HospitalDistanceMatrix.build(db)
+    donor_index = DonorSpatialIndex()
+    donor_index.build(db)
+
+    def matching(match, **kwargs):
+        def run():
+            for hospital, city, blood_type in queries:
+                match(db, hospital, city, blood_type, max_results=5, **kwargs)
+        return run
+
+    def incremental_rebuild():
+        for hospital, city, blood_type in queries:
+            apply_donor_delta(db, hospital, city, blood_type, 1)
+        apply_inventory_deltas(db, {query: 450 for query in queries})
+        for hospital, city, blood_type in queries:
+            apply_donor_delta(db, hospital, city, blood_type, -1)
+        apply_inventory_deltas(db, {query: -450 for query in queries})
+
+    def inventory_update():
+        for hospital, city, blood_type in queries:
+            token = tokens[(hospital, city)]
+            update_hospital_inventory(db, hospital, city, blood_type, 1, token=token)
+            update_hospital_inventory(db, hospital, city, blood_type, -1, token=token)
+
+    def inventory_batch():
+        for delta in (1, -1):
+            update_inventory_batch(db, [
+                {"hospital": hospital, "city": city, "bloodType": blood_type, "delta_count": delta,
+                 "token": tokens[(hospital, city)]}
+                for hospital, city, blood_type in queries
+            ])
+
+    return {
+        "match_surplus_for_shortage_endpoint": matching(match_surplus_for_shortage, distance_matrix=distance_matrix),
+        "match_surplus_for_shortage_db": matching(match_surplus_for_shortage),
+        "match_shortage_for_surplus_endpoint": matching(match_shortage_for_surplus, distance_matrix=distance_matrix),
+        "match_shortage_for_surplus_db": matching(match_shortage_for_surplus),
+        "match_donors_for_shortage_endpoint": matching(match_donors_for_shortage, donor_index=donor_index),
+        "match_donors_for_shortage_db": matching(match_donors_for_shortage),
+        "match_donors_for_surplus_endpoint": matching(match_donors_for_surplus, donor_index=donor_index),
+        "match_donors_for_surplus_db": matching(match_donors_for_surplus),
+        "build_distance_matrix": lambda: HospitalDistanceMatrix.build(db),
+        "rebuild_full": lambda: update_secondary_data(db),
+        "rebuild_incremental": incremental_rebuild,
+        "inventory_update": inventory_update,
+        "inventory_batch": inventory_batch,
+        "read_hospital_data": lambda: get_complete_hospital_data(db),
+        "read_hospital_data_with_location": lambda: get_complete_hospital_data_with_location(db),
+        "read_hospital_data_with_location_n_plus_one": lambda: n_plus_one_reader(db),
+        "serve_hospital_data_with_location": lambda: dumps(get_complete_hospital_data_with_location(db)),
+        "serve_hospital_data_with_location_n_plus_one": lambda: dumps(n_plus_one_reader(db))
+    }
+
+def time_benchmark(run, repeat):
+    """
+    Runs one untimed warm-up round, then repeat timed rounds; returns ms statistics.
+    """
+    run()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "min_ms": round(min(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "mean_ms": round(statistics.mean(samples), 3),
+        "rounds": repeat
+    }
+
+def run_suite(client, scales, repeat=5, only=None, seed=42):
+    """
+    Seeds each scale into BENCHMARK_DB and times every benchmark (or those in only).
+    Returns {scale: {"size": {...}, "benchmarks": {name: stats}}}.
+    """
+    db = client[BENCHMARK_DB]
+    results = {}
+    for scale in scales:
+        hospitals, donors, bags = SCALES[scale]
+        print(f"Seeding '{scale}': {hospitals} hospitals, {donors} donors, {bags} blood bags...")
+        seed_scale(db, hospitals, donors, bags, seed)
+        timings = {}
+        for name, run in build_benchmarks(db, seed).items():
+            if only and name not in only:
+                continue
+            timings[name] = time_benchmark(run, repeat)
+            print(f"  {scale:8} {name:46} median {timings[name]['median_ms']:10.1f} ms")
+        results[scale] = {"size": {"hospitals": hospitals, "donors": donors, "bags": bags}, "benchmarks": timings}
+    client.drop_database(BENCHMARK_DB)
+    return results
+
+#######################################
+# Results and Regression Check
+#######################################
+
+def current_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def find_regressions(results, baseline, threshold, min_delta_ms):
+    """
+    Compares median times against a baseline results file. A benchmark regresses when
+    it is more than threshold (e.g. 0.15 = 15%) and more than min_delta_ms slower.
+    Returns [(scale, name, baseline_ms, current_ms)].
+    """
+    regressions = []
+    for scale, entry in results.items():
+        base_entry = baseline.get("scales", {}).get(scale, {})
+        if base_entry.get("size") != entry["size"]:
+            continue
+        for name, stats in entry["benchmarks"].items():
+            base = base_entry.get("benchmarks", {}).get(name)
+            if not base:
+                continue
+            before, after = base["median_ms"], stats["median_ms"]
+            if after > before * (1 + threshold) and after - before > min_delta_ms:
+                regressions.append((scale, name, before, after))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Time matching, donorStats rebuilds, inventory writes and "
+                                                 "hospital data readers at several data scales.")
+    parser.add_argument("--scale", choices=list(SCALES), action="append", dest="scales")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed rounds per benchmark.")
+    parser.add_argument("--only", action="append", help="Run only this benchmark (repeatable).")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help=f"Results file (default {RESULTS_DIR}/<commit>.json).")
+    parser.add_argument("--baseline", help="Results file of an earlier run to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown vs. the baseline (0.15 = 15%%).")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="Ignore slowdowns smaller than this.")
+    args = parser.parse_args()
+
+    commit = current_commit()
+    results = run_suite(get_client(), args.scales or DEFAULT_SCALES, args.repeat, args.only, args.seed)
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"commit": commit, "timestamp": datetime.now().isoformat(timespec="seconds"),
+                   "repeat": args.repeat, "seed": args.seed, "scales": results}, f, indent=2)
+    print(f"Results written to {output}.")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.threshold, args.min_delta_ms)
+        for scale, name, before, after in regressions:
+            print(f"REGRESSION {scale} {name}: {before:.1f} ms -> {after:.1f} ms (+{(after / before - 1) * 100:.0f}%)")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {baseline.get('commit', args.baseline)} "
+              f"(threshold {args.threshold:.0%}).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# compatibility.py
+import math
+from donor_stats import COMPLETE_BLOOD_TYPES
+
+BLOOD_TYPE_INDEX = {bt: i for i, bt in enumerate(COMPLETE_BLOOD_TYPES)}
+
+# Share of the (US) population with each blood type, used to rate how scarce a type is.
+BLOOD_TYPE_FREQUENCY = {
+    "O+": 0.374, "A+": 0.357, "B+": 0.085, "AB+": 0.034,
+    "O-": 0.066, "A-": 0.063, "B-": 0.015, "AB-": 0.006
+}
+
+# Ranking weights, in km-equivalents: how much farther away a candidate may be before a
+# scarcer donor type or a smaller stock makes it rank lower.
+SCARCITY_PENALTY_KM = 100
+INVENTORY_BONUS_KM = 50
+BAG_CC = 450
+
+def _antigens(blood_type):
+    abo = blood_type[:-1]
+    return set() if abo == "O" else set(abo), blood_type.endswith("+")
+
+def _red_cell_compatible(donor, recipient):
+    donor_abo, donor_rh = _antigens(donor)
+    recipient_abo, recipient_rh = _antigens(recipient)
+    return donor_abo <= recipient_abo and (recipient_rh or not donor_rh)
+
+# 8x8 red-cell compatibility table as one bitmask per recipient: bit i is set when
+# COMPLETE_BLOOD_TYPES[i] can donate to that recipient (O- sets every row's bit).
+RED_CELL_COMPATIBILITY = {
+    recipient: sum(1 << BLOOD_TYPE_INDEX[donor] for donor in COMPLETE_BLOOD_TYPES
+                   if _red_cell_compatible(donor, recipient))
+    for recipient in COMPLETE_BLOOD_TYPES
+}
+
+# Precomputed donor type lists, so matching never evaluates the table per request.
+COMPATIBLE_DONOR_TYPES = {
+    recipient: [donor for donor in COMPLETE_BLOOD_TYPES if mask >> BLOOD_TYPE_INDEX[donor] & 1]
+    for recipient, mask in RED_CELL_COMPATIBILITY.items()
+}
+
+def scarcity_penalty_km(donor_type):
+    """
+    Ranking penalty for using donor_type: -log(frequency), so rare types such as O-
+    (the universal donor) are only chosen when they are clearly closer or better stocked.
+    """
+    return SCARCITY_PENALTY_KM * -math.log(BLOOD_TYPE_FREQUENCY[donor_type])
+
+def inventory_bonus_km(total_blood_cc):
+    return INVENTORY_BONUS_KM * math.log1p(max(total_blood_cc, 0) / BAG_CC)
+
+def rank_score(distance_km, donor_type, total_blood_cc=0):
+    """
+    Lower is better: distance plus the scarcity penalty of the donor type, minus a
+    bonus for available stock.
+    """
+    return distance_km + scarcity_penalty_km(donor_type) - inventory_bonus_km(total_blood_cc)
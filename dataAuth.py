@@ -1,9 +1,10 @@
 # sampleData.py
-from pymongo import MongoClient
+from database import get_db, get_client
+from geo import geo_point, ensure_geo_index
+from indexes import ensure_indexes
 from datetime import datetime
 from random import randint
-client = MongoClient("mongodb://localhost:27017")
-db = client["americanRedCrossDB"]
+db = get_db()
 
 def generate_sample_hospitals(db):
     """
@@ -23,7 +24,10 @@ def generate_sample_hospitals(db):
         hosp["lid"] = "L{:04d}".format(i)
         from managmentAuth import register_auth0_user
         register_auth0_user(hosp["name"], hosp["password"])
+    for hosp in hospitals:
+        hosp["location"] = geo_point(hosp["coordinates"])
     db.locations.insert_many(hospitals)
+    ensure_geo_index(db)
     print(f"Inserted {len(hospitals)} sample hospitals.")
 
 def generate_sample_donors(db):
@@ -174,12 +178,12 @@ def set_manual_flags(db):
 
 def generate_all_sample_data():
     from managmentAuth import update_secondary_data, update_hospital_inventory
-    client = MongoClient("mongodb://localhost:27017")
-    db = client["americanRedCrossDB"]
+    db = get_db()
     wipe_database("americanRedCrossDB")
     generate_sample_hospitals(db)
     generate_sample_donors(db)
     generate_sample_inventory(db)
+    ensure_indexes(db)
     print("All sample data generated.")
     
     update_secondary_data(db)
@@ -192,8 +196,7 @@ def generate_all_sample_data():
     print("Final sample data generation complete.")
 
 def wipe_database(db_name="americanRedCrossDB"):
-    client = MongoClient("mongodb://localhost:27017")
-    client.drop_database(db_name)
+    get_client().drop_database(db_name)
     print(f"Database '{db_name}' has been wiped.")
 
 if __name__ == "__main__":
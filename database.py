@@ -0,0 +1,83 @@
+# database.py
+import os
+import threading
+from pymongo import MongoClient
+
+#######################################
+# Configuration
+#######################################
+
+# Every setting can be overridden from the environment, e.g. MONGO_URI=mongodb://db:27017.
+DEFAULT_URI = "mongodb://localhost:27017"
+DEFAULT_DB_NAME = "americanRedCrossDB"
+
+def client_settings():
+    """
+    MongoClient options read from the environment:
+      MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS,
+      MONGO_CONNECT_TIMEOUT_MS, MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS,
+      MONGO_READ_PREFERENCE (e.g. primary, primaryPreferred, secondaryPreferred),
+      MONGO_WRITE_CONCERN (w: a number or "majority") and MONGO_APP_NAME.
+    """
+    env = os.environ
+    write_concern = env.get("MONGO_WRITE_CONCERN", "1")
+    settings = {
+        "maxPoolSize": int(env.get("MONGO_MAX_POOL_SIZE", 50)),
+        "minPoolSize": int(env.get("MONGO_MIN_POOL_SIZE", 0)),
+        "maxIdleTimeMS": int(env.get("MONGO_MAX_IDLE_TIME_MS", 60000)),
+        "connectTimeoutMS": int(env.get("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+        "serverSelectionTimeoutMS": int(env.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+        "readPreference": env.get("MONGO_READ_PREFERENCE", "primary"),
+        "w": int(write_concern) if write_concern.isdigit() else write_concern,
+        "appname": env.get("MONGO_APP_NAME", "gotblood"),
+        # Don't open sockets until the first operation, so a client created before a
+        # pre-fork server forks never shares connections with its workers.
+        "connect": False
+    }
+    if "MONGO_SOCKET_TIMEOUT_MS" in env:
+        settings["socketTimeoutMS"] = int(env["MONGO_SOCKET_TIMEOUT_MS"])
+    return settings
+
+#######################################
+# Shared Client
+#######################################
+
+_lock = threading.Lock()
+_client = None
+_client_pid = None
+
+def get_client():
+    """
+    Returns the process-wide MongoClient, creating it on first use. A forked child
+    (e.g. a gunicorn worker) gets its own client instead of reusing the parent's pool.
+    """
+    global _client, _client_pid
+    with _lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = MongoClient(os.environ.get("MONGO_URI", DEFAULT_URI), **client_settings())
+            _client_pid = os.getpid()
+        return _client
+
+def get_db(db_name=None):
+    """
+    Returns a database handle on the shared client (MONGO_DB or americanRedCrossDB by default).
+    """
+    return get_client()[db_name or os.environ.get("MONGO_DB", DEFAULT_DB_NAME)]
+
+def close_client():
+    global _client, _client_pid
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+def _reset_after_fork():
+    # The inherited client belongs to the parent; drop the reference without closing it.
+    global _client, _client_pid, _lock
+    _lock = threading.Lock()
+    _client = None
+    _client_pid = None
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,4 +1,5 @@
-from pymongo import MongoClient
+from database import get_db
+from indexes import ensure_indexes
 from datetime import datetime
 
 def setup_primary_database(db):
@@ -290,11 +291,11 @@ def search_secondary(db, hospital, city):
 
 def main():
     # Connect to MongoDB (ensure your instance is running)
-    client = MongoClient("mongodb://localhost:27017")
-    primary_db = client["americanRedCrossDB"]
+    primary_db = get_db()
 
     # Setup primary database with sample data.
     setup_primary_database(primary_db)
+    ensure_indexes(primary_db)
     
     # Initial aggregation to build secondary collection.
     update_secondary_data(primary_db)
@@ -0,0 +1,317 @@
+# distance_matrix.py
+import json
+import os
+import threading
+import numpy as np
+from database import get_db
+from hospital_matching import haversine_distances
+from sequences import current_sequence
+
+DEFAULT_MATRIX_DIR = "distance_matrix"
+MAX_NEIGHBORS = 256            # Length of the pre-sorted neighbor list kept per hospital.
+BLOCK_ELEMENTS = 2_000_000     # Distances computed at once while building (bounds temporaries).
+
+def _top_neighbors(candidate_rows, candidate_distances):
+    """
+    For every row of candidate_distances (float32, inf for "no candidate") returns the
+    MAX_NEIGHBORS nearest candidates as (rows, distances), nearest first, padded with
+    -1 / inf when a row has fewer candidates.
+    """
+    n_rows, width = candidate_distances.shape
+    k = min(MAX_NEIGHBORS, width)
+    rows = np.full((n_rows, MAX_NEIGHBORS), -1, dtype=np.int32)
+    distances = np.full((n_rows, MAX_NEIGHBORS), np.inf, dtype=np.float32)
+    if k == 0:
+        return rows, distances
+    if k < width:
+        part = np.argpartition(candidate_distances, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(width), (n_rows, width))
+    part_distances = np.take_along_axis(candidate_distances, part, axis=1)
+    order = np.argsort(part_distances, axis=1, kind="stable")
+    part = np.take_along_axis(part, order, axis=1)
+    part_distances = np.take_along_axis(part_distances, order, axis=1)
+    part_rows = np.take_along_axis(candidate_rows, part, axis=1)
+    rows[:, :k] = np.where(np.isfinite(part_distances), part_rows, -1)
+    distances[:, :k] = part_distances
+    return rows, distances
+
+def _block_size(width):
+    return max(1, BLOCK_ELEMENTS // max(width, 1))
+
+def locations_stamp(db):
+    """
+    (lid sequence, locations count): changes whenever a hospital is added through any
+    add path (each reserves a lid) or locations are inserted or deleted directly.
+    """
+    return (current_sequence(db, "lid"), db.locations.estimated_document_count())
+
+class MatrixSnapshot:
+    """
+    One immutable version of the matrix: the hospitals (rows indexed by position) and,
+    per hospital, its MAX_NEIGHBORS nearest other hospitals with their float32 distances
+    in km. Full distance rows are never stored; row_distances() computes one on demand.
+    A request takes a single snapshot and uses it throughout, so a concurrent
+    add_hospitals() can never mix rows, neighbor lists and bitmaps of two versions.
+    stamp is the locations_stamp() the snapshot is known to be in sync with.
+    """
+
+    def __init__(self, lids, names, cities, lats, lons, neighbors, neighbor_distances, stamp=None):
+        self.stamp = stamp
+        self.lids = list(lids)
+        self.names = list(names)
+        self.cities = list(cities)
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.neighbors = neighbors
+        self.neighbor_distances = neighbor_distances
+        self.lid_to_row = {lid: row for row, lid in enumerate(self.lids)}
+        self.key_to_row = {(name, city): row for row, (name, city) in enumerate(zip(self.names, self.cities))}
+
+    @property
+    def size(self):
+        return len(self.lids)
+
+    def restamped(self, stamp):
+        return MatrixSnapshot(self.lids, self.names, self.cities, self.lats, self.lons,
+                              self.neighbors, self.neighbor_distances, stamp)
+
+    def row_distances(self, row):
+        """
+        Distances (km, float32) from hospital 'row' to every hospital in the snapshot.
+        """
+        return haversine_distances(self.lats[row], self.lons[row], self.lats, self.lons).astype(np.float32)
+
+    def flag_bitmap(self, db, blood_type, flag):
+        """
+        Returns a boolean array (one entry per row) marking hospitals whose
+        bloodTypeStats entry for blood_type has flag ("surplus" or "shortage") set.
+        """
+        bitmap = np.zeros(self.size, dtype=bool)
+        query = {"bloodTypeStats": {"$elemMatch": {"bloodType": blood_type, flag: True}}}
+        for rec in db.donorStats.find(query, {"_id": 0, "hospital": 1, "city": 1}):
+            row = self.key_to_row.get((rec.get("hospital"), rec.get("city")))
+            if row is not None:
+                bitmap[row] = True
+        return bitmap
+
+    def nearest_flagged(self, hospital, city, bitmap, max_results=5, max_distance_km=None):
+        """
+        Walks the hospital's pre-sorted neighbor list and returns the first max_results
+        neighbors set in bitmap (from flag_bitmap() of this same snapshot). Returns None
+        if the hospital is not in the snapshot.
+          { "hospital": <name>, "city": <city>, "distance_km": <distance> }
+        """
+        row = self.key_to_row.get((hospital, city))
+        if row is None:
+            return None
+        candidates = np.asarray(self.neighbors[row])
+        candidate_distances = np.asarray(self.neighbor_distances[row])
+        known = candidates >= 0
+        candidates, candidate_distances = candidates[known], candidate_distances[known]
+        flagged = bitmap[candidates]
+        selected, distances = candidates[flagged][:max_results], candidate_distances[flagged][:max_results]
+        # The neighbor list is truncated; fall back to a full row if it ran out early.
+        if len(selected) < max_results and len(candidates) < self.size - 1:
+            row_distances = self.row_distances(row)
+            row_distances[row] = np.inf
+            row_distances[~bitmap] = np.inf
+            order = np.argsort(row_distances, kind="stable")
+            selected = order[np.isfinite(row_distances[order])][:max_results]
+            distances = row_distances[selected]
+        matches = []
+        for col, distance in zip(selected.tolist(), distances.tolist()):
+            if max_distance_km is not None and distance > max_distance_km:
+                break
+            matches.append({"hospital": self.names[col], "city": self.cities[col],
+                            "distance_km": round(distance, 2)})
+        return matches
+
+class HospitalDistanceMatrix:
+    """
+    Pre-sorted nearest-neighbor lists between hospitals. Hospital coordinates almost
+    never change, so matching becomes a walk down the neighbor list filtered by a
+    surplus/shortage bitmap instead of a distance computation per request.
+
+    Readers use self.snapshot (one MatrixSnapshot, replaced by a single reference swap).
+    Lists can be saved to a directory and loaded back memory-mapped, and new hospitals
+    are merged in with add_hospitals() without recomputing the existing ones.
+    """
+
+    def __init__(self, snapshot):
+        self._lock = threading.Lock()  # Serializes writers; readers never take it.
+        self.snapshot = snapshot
+
+    @property
+    def size(self):
+        return self.snapshot.size
+
+    @classmethod
+    def build(cls, db):
+        """
+        Builds the neighbor lists for every hospital with coordinates, computing the
+        distances in float32 row blocks of BLOCK_ELEMENTS so memory stays O(n * MAX_NEIGHBORS).
+        """
+        stamp = locations_stamp(db)  # Taken before reading, so a racing insert moves it again.
+        lids, names, cities, lats, lons = [], [], [], [], []
+        for loc in db.locations.find({"coordinates": {"$exists": True}},
+                                     {"_id": 0, "lid": 1, "name": 1, "city": 1, "coordinates": 1}).sort("lid", 1):
+            lids.append(loc.get("lid"))
+            names.append(loc.get("name"))
+            cities.append(loc.get("city"))
+            lats.append(loc["coordinates"]["lat"])
+            lons.append(loc["coordinates"]["lon"])
+        lats = np.array(lats, dtype=float)
+        lons = np.array(lons, dtype=float)
+        n = len(lids)
+        neighbors = np.full((n, MAX_NEIGHBORS), -1, dtype=np.int32)
+        neighbor_distances = np.full((n, MAX_NEIGHBORS), np.inf, dtype=np.float32)
+        all_rows = np.arange(n, dtype=np.int32)
+        block = _block_size(n)
+        for start in range(0, n, block):
+            stop = min(n, start + block)
+            distances = haversine_distances(lats[start:stop, None], lons[start:stop, None],
+                                            lats[None, :], lons[None, :]).astype(np.float32)
+            # A hospital is never its own neighbor.
+            distances[np.arange(stop - start), np.arange(start, stop)] = np.inf
+            neighbors[start:stop], neighbor_distances[start:stop] = _top_neighbors(
+                np.broadcast_to(all_rows, distances.shape), distances)
+        return cls(MatrixSnapshot(lids, names, cities, lats, lons, neighbors, neighbor_distances, stamp))
+
+    def save(self, directory=DEFAULT_MATRIX_DIR):
+        snapshot = self.snapshot
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "neighbors.npy"), snapshot.neighbors)
+        np.save(os.path.join(directory, "neighbor_distances.npy"), snapshot.neighbor_distances)
+        with open(os.path.join(directory, "hospitals.json"), "w") as f:
+            json.dump({"maxNeighbors": MAX_NEIGHBORS, "locationCount": snapshot.size,
+                       "lids": snapshot.lids, "names": snapshot.names, "cities": snapshot.cities,
+                       "lats": snapshot.lats.tolist(), "lons": snapshot.lons.tolist()}, f)
+
+    @classmethod
+    def load(cls, directory=DEFAULT_MATRIX_DIR):
+        """
+        Loads saved neighbor lists memory-mapped read-only. Raises ValueError for files
+        written with a different layout.
+        """
+        with open(os.path.join(directory, "hospitals.json")) as f:
+            meta = json.load(f)
+        if meta.get("maxNeighbors") != MAX_NEIGHBORS or meta.get("locationCount") != len(meta["lids"]):
+            raise ValueError("saved distance matrix has an old layout")
+        neighbors = np.load(os.path.join(directory, "neighbors.npy"), mmap_mode="r")
+        neighbor_distances = np.load(os.path.join(directory, "neighbor_distances.npy"), mmap_mode="r")
+        return cls(MatrixSnapshot(meta["lids"], meta["names"], meta["cities"], meta["lats"], meta["lons"],
+                                  neighbors, neighbor_distances))
+
+    def add_hospitals(self, hospitals):
+        """
+        Merges new hospitals ({"lid", "name", "city", "coordinates"} dicts; lids already
+        present are skipped) into a new snapshot. Existing lists are merged with the
+        distances to the new hospitals only, so the cost is O(n * (MAX_NEIGHBORS + m))
+        for m new hospitals rather than a rebuild. Returns the number added.
+        """
+        with self._lock:
+            old = self.snapshot
+            seen = set(old.lid_to_row)
+            new = []
+            for hosp in hospitals:
+                if hosp.get("lid") in seen or not hosp.get("coordinates"):
+                    continue
+                seen.add(hosp["lid"])
+                new.append(hosp)
+            if not new:
+                return 0
+            n, m = old.size, len(new)
+            lats = np.concatenate([old.lats, [hosp["coordinates"]["lat"] for hosp in new]])
+            lons = np.concatenate([old.lons, [hosp["coordinates"]["lon"] for hosp in new]])
+            neighbors = np.empty((n + m, MAX_NEIGHBORS), dtype=np.int32)
+            neighbor_distances = np.empty((n + m, MAX_NEIGHBORS), dtype=np.float32)
+
+            # Existing rows: the true nearest lists are among the old list plus the new hospitals.
+            new_rows = np.arange(n, n + m, dtype=np.int32)
+            block = _block_size(MAX_NEIGHBORS + m)
+            for start in range(0, n, block):
+                stop = min(n, start + block)
+                to_new = haversine_distances(lats[start:stop, None], lons[start:stop, None],
+                                             lats[None, n:], lons[None, n:]).astype(np.float32)
+                candidate_rows = np.concatenate(
+                    [np.asarray(old.neighbors[start:stop]), np.broadcast_to(new_rows, to_new.shape)], axis=1)
+                candidate_distances = np.concatenate(
+                    [np.asarray(old.neighbor_distances[start:stop]), to_new], axis=1)
+                neighbors[start:stop], neighbor_distances[start:stop] = _top_neighbors(
+                    candidate_rows, candidate_distances)
+
+            # New rows: one distance row each against every hospital.
+            all_rows = np.arange(n + m, dtype=np.int32)
+            block = _block_size(n + m)
+            for start in range(n, n + m, block):
+                stop = min(n + m, start + block)
+                distances = haversine_distances(lats[start:stop, None], lons[start:stop, None],
+                                                lats[None, :], lons[None, :]).astype(np.float32)
+                distances[np.arange(stop - start), np.arange(start, stop)] = np.inf
+                neighbors[start:stop], neighbor_distances[start:stop] = _top_neighbors(
+                    np.broadcast_to(all_rows, distances.shape), distances)
+
+            self.snapshot = MatrixSnapshot(
+                old.lids + [hosp["lid"] for hosp in new],
+                old.names + [hosp["name"] for hosp in new],
+                old.cities + [hosp["city"] for hosp in new],
+                lats, lons, neighbors, neighbor_distances, old.stamp)
+            return m
+
+    def add_hospital(self, lid, name, city, coordinates):
+        return self.add_hospitals([{"lid": lid, "name": name, "city": city, "coordinates": coordinates}])
+
+    def sync(self, db):
+        """
+        Brings a loaded matrix up to date with 'locations': hospitals added since it was
+        saved are merged in. Returns False when locations were removed (the lists can
+        no longer be trusted and the caller should rebuild).
+        """
+        stamp = locations_stamp(db)
+        locations = list(db.locations.find({"coordinates": {"$exists": True}},
+                                           {"_id": 0, "lid": 1, "name": 1, "city": 1, "coordinates": 1}))
+        known = self.snapshot.lid_to_row
+        missing = [loc for loc in locations if loc.get("lid") not in known]
+        if len(locations) - len(missing) != self.size:
+            return False
+        if missing:
+            self.add_hospitals(missing)
+            print(f"Added {len(missing)} hospital(s) to the distance matrix.")
+        with self._lock:
+            self.snapshot = self.snapshot.restamped(stamp)
+        return True
+
+    def refresh(self, db):
+        """
+        Cheap freshness check for every request: syncs only when locations_stamp()
+        moved since the snapshot was last synced. Returns False when the caller
+        should rebuild (see sync).
+        """
+        if self.snapshot.stamp == locations_stamp(db):
+            return True
+        return self.sync(db)
+
+def load_or_build(db, directory=DEFAULT_MATRIX_DIR):
+    """
+    Returns the saved matrix from directory, synced with 'locations', or a freshly
+    built one when there is no usable saved matrix.
+    """
+    if os.path.isdir(directory):
+        try:
+            matrix = HospitalDistanceMatrix.load(directory)
+            if matrix.sync(db):
+                return matrix
+            print("Saved distance matrix is out of date; rebuilding.")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring saved distance matrix: {e}")
+    return HospitalDistanceMatrix.build(db)
+
+def main():
+    db = get_db()
+    matrix = HospitalDistanceMatrix.build(db)
+    matrix.save()
+    print(f"Saved distance matrix for {matrix.size} hospitals to '{DEFAULT_MATRIX_DIR}'.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+# donor_index.py
+import heapq
+import itertools
+import math
+import threading
+from pymongo.errors import PyMongoError
+from donor_stats import get_donors_version
+
+EARTH_RADIUS_KM = 6371  # Earth's radius in kilometers
+
+#######################################
+# Geometry Helpers
+#######################################
+
+def to_unit_vector(lat, lon):
+    """
+    Maps a latitude/longitude pair onto the unit sphere. Straight-line (chord) distance
+    between two such vectors grows with great-circle distance, so nearest-neighbour
+    order in 3-d is the same as nearest-neighbour order on the globe.
+    """
+    lat_r = math.radians(lat)
+    lon_r = math.radians(lon)
+    return (math.cos(lat_r) * math.cos(lon_r), math.cos(lat_r) * math.sin(lon_r), math.sin(lat_r))
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+def km_to_chord(km):
+    return 2 * math.sin(min(math.pi, km / EARTH_RADIUS_KM) / 2)
+
+#######################################
+# KD-Tree
+#######################################
+
+class _Node:
+    __slots__ = ("point", "key", "axis", "left", "right")
+
+    def __init__(self, point, key, axis):
+        self.point = point
+        self.key = key
+        self.axis = axis
+        self.left = None
+        self.right = None
+
+class KDTree:
+    """
+    3-d tree over unit vectors. Built balanced from an initial set of points;
+    later points are inserted without rebalancing.
+    """
+
+    def __init__(self, items=()):
+        items = list(items)
+        self.size = len(items)
+        self.root = self._build(items, 0)
+
+    def _build(self, items, depth):
+        if not items:
+            return None
+        axis = depth % 3
+        items.sort(key=lambda item: item[0][axis])
+        mid = len(items) // 2
+        node = _Node(items[mid][0], items[mid][1], axis)
+        node.left = self._build(items[:mid], depth + 1)
+        node.right = self._build(items[mid + 1:], depth + 1)
+        return node
+
+    def insert(self, point, key):
+        self.size += 1
+        if self.root is None:
+            self.root = _Node(point, key, 0)
+            return
+        node = self.root
+        while True:
+            side = "left" if point[node.axis] < node.point[node.axis] else "right"
+            child = getattr(node, side)
+            if child is None:
+                setattr(node, side, _Node(point, key, (node.axis + 1) % 3))
+                return
+            node = child
+
+    def nearest(self, point):
+        """
+        Yields (chord_distance, key) for every point in increasing distance order.
+        Best-first search: the generator only expands the nodes it needs, so taking
+        the first k results costs O(log n + k) on a reasonably balanced tree.
+        """
+        counter = itertools.count()
+        heap = [(0.0, next(counter), self.root, None)] if self.root else []
+        while heap:
+            bound, _, node, key = heapq.heappop(heap)
+            if node is None:
+                yield bound, key
+                continue
+            heapq.heappush(heap, (math.dist(point, node.point), next(counter), None, node.key))
+            diff = point[node.axis] - node.point[node.axis]
+            near, far = (node.left, node.right) if diff < 0 else (node.right, node.left)
+            if near is not None:
+                heapq.heappush(heap, (bound, next(counter), near, None))
+            if far is not None:
+                heapq.heappush(heap, (max(bound, abs(diff)), next(counter), far, None))
+
+#######################################
+# Donor Spatial Index
+#######################################
+
+class DonorSpatialIndex:
+    """
+    Memory-resident index of donors, keyed by blood type. Donors have no coordinates of
+    their own, so each blood type gets a KD-tree over the hospitals its donors belong
+    to, and each hospital keeps the list of its donors of that type.
+
+    The index is built once with build(db) and then kept fresh by watch(db), which
+    tails a change stream on 'persons' and 'locations'. Change streams need a replica
+    set; on a standalone mongod ensure_fresh(db) before every read compares the
+    persisted donors version and the persons/locations counts with the values the
+    index was built from, so writes from other workers and from bulk loaders are
+    picked up too.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._locations = {}   # (hospital, city) -> unit vector
+        self._donors = {}      # donor _id -> donor summary
+        self._buckets = {}     # bloodType -> {(hospital, city): {donor _id: donor summary}}
+        self._trees = {}       # bloodType -> KDTree of (hospital, city) keys
+        self._tree_keys = {}   # bloodType -> set of keys already in the tree
+        self._build_lock = threading.Lock()
+        self._fingerprint = None
+        self.stale = True
+        self.watching = False
+
+    @staticmethod
+    def _summary(doc):
+        return {
+            "pid": doc.get("pid"),
+            "firstName": doc.get("firstName"),
+            "lastName": doc.get("lastName"),
+            "hospital": doc.get("hospital"),
+            "city": doc.get("city"),
+            "bloodType": doc.get("donorDetails", {}).get("bloodType")
+        }
+
+    @staticmethod
+    def fingerprint(db):
+        """
+        (donors version, persons count, locations count): changes whenever a donor is
+        added or removed through the app or documents are inserted or deleted directly.
+        """
+        return (get_donors_version(db), db.persons.estimated_document_count(),
+                db.locations.estimated_document_count())
+
+    def build(self, db):
+        """
+        (Re)builds the whole index from 'locations' and 'persons'.
+        """
+        # Taken before reading, so a write racing the build changes it again.
+        fingerprint = self.fingerprint(db)
+        locations = {}
+        for loc in db.locations.find({"coordinates": {"$exists": True}}, {"name": 1, "city": 1, "coordinates": 1}):
+            locations[(loc.get("name"), loc.get("city"))] = to_unit_vector(loc["coordinates"]["lat"],
+                                                                           loc["coordinates"]["lon"])
+        donors = {}
+        buckets = {}
+        projection = {"pid": 1, "firstName": 1, "lastName": 1, "hospital": 1, "city": 1, "donorDetails.bloodType": 1}
+        for doc in db.persons.find({"role": "donor"}, projection):
+            summary = self._summary(doc)
+            donors[doc["_id"]] = summary
+            key = (summary["hospital"], summary["city"])
+            buckets.setdefault(summary["bloodType"], {}).setdefault(key, {})[doc["_id"]] = summary
+
+        trees = {}
+        tree_keys = {}
+        for blood_type, hospitals in buckets.items():
+            keys = [key for key in hospitals if key in locations]
+            trees[blood_type] = KDTree((locations[key], key) for key in keys)
+            tree_keys[blood_type] = set(keys)
+
+        with self._lock:
+            self._locations = locations
+            self._donors = donors
+            self._buckets = buckets
+            self._trees = trees
+            self._tree_keys = tree_keys
+            self._fingerprint = fingerprint
+            self.stale = False
+
+    def invalidate(self):
+        self.stale = True
+
+    def ensure_fresh(self, db):
+        """
+        Rebuilds the index if it was invalidated or, without a change stream, if the
+        data changed since it was built (see fingerprint). Concurrent callers share one build.
+        """
+        if not self.stale and self.watching:
+            return
+        with self._build_lock:
+            if self.stale or (not self.watching and self.fingerprint(db) != self._fingerprint):
+                self.build(db)
+
+    def _index_key(self, blood_type, key):
+        if key in self._locations and key not in self._tree_keys.setdefault(blood_type, set()):
+            self._trees.setdefault(blood_type, KDTree()).insert(self._locations[key], key)
+            self._tree_keys[blood_type].add(key)
+
+    def _add_donor(self, donor_id, summary):
+        self._donors[donor_id] = summary
+        key = (summary["hospital"], summary["city"])
+        self._buckets.setdefault(summary["bloodType"], {}).setdefault(key, {})[donor_id] = summary
+        self._index_key(summary["bloodType"], key)
+
+    def _remove_donor(self, donor_id):
+        # Hospitals left without donors stay in the tree and are skipped at query time.
+        summary = self._donors.pop(donor_id, None)
+        if summary:
+            key = (summary["hospital"], summary["city"])
+            self._buckets.get(summary["bloodType"], {}).get(key, {}).pop(donor_id, None)
+
+    def _add_location(self, doc):
+        if "coordinates" not in doc:
+            return
+        key = (doc.get("name"), doc.get("city"))
+        point = to_unit_vector(doc["coordinates"]["lat"], doc["coordinates"]["lon"])
+        if key in self._locations and self._locations[key] != point:
+            # KD-tree nodes cannot move; a relocated hospital needs a rebuild.
+            self.invalidate()
+            return
+        self._locations[key] = point
+        for blood_type, hospitals in self._buckets.items():
+            if key in hospitals:
+                self._index_key(blood_type, key)
+
+    def apply_change(self, change):
+        """
+        Applies one change stream event from 'persons' or 'locations'.
+        """
+        operation = change.get("operationType")
+        collection = change.get("ns", {}).get("coll")
+        if operation in ("drop", "rename", "dropDatabase", "invalidate"):
+            self.invalidate()
+            return
+        with self._lock:
+            if collection == "persons":
+                donor_id = change["documentKey"]["_id"]
+                self._remove_donor(donor_id)
+                doc = change.get("fullDocument")
+                if operation != "delete" and doc and doc.get("role") == "donor":
+                    self._add_donor(donor_id, self._summary(doc))
+            elif collection == "locations" and operation != "delete":
+                doc = change.get("fullDocument")
+                if doc:
+                    self._add_location(doc)
+
+    def watch(self, db):
+        """
+        Starts a daemon thread that tails the change stream and applies every event.
+        The stream is opened before the initial build, so nothing is missed in between.
+        """
+        def run():
+            pipeline = [{"$match": {"ns.coll": {"$in": ["persons", "locations"]}}}]
+            try:
+                with db.watch(pipeline, full_document="updateLookup") as stream:
+                    self.build(db)
+                    self.watching = True
+                    for change in stream:
+                        self.apply_change(change)
+            except PyMongoError as e:
+                print(f"Donor index change stream unavailable: {e}")
+            finally:
+                self.watching = False
+                self.invalidate()
+
+        thread = threading.Thread(target=run, name="donor-index-watch", daemon=True)
+        thread.start()
+        return thread
+
+    def _ranked_donors(self, origin_key, penalties, max_results, max_distance_km):
+        """
+        Merges the nearest-first donor streams of several blood types, ranking each donor
+        by distance_km + penalties[bloodType]. Every stream is lazy, so only as much of
+        each tree is walked as the first max_results donors need.
+        Returns a list of (score, distance_km, donor summary), or None for an unknown origin.
+        """
+        origin = self._locations.get(origin_key)
+        if origin is None:
+            return None
+        max_chord = km_to_chord(max_distance_km) if max_distance_km is not None else None
+
+        def stream(blood_type, penalty):
+            tree = self._trees.get(blood_type)
+            if tree is None:
+                return
+            hospitals = self._buckets.get(blood_type, {})
+            for chord, key in tree.nearest(origin):
+                if max_chord is not None and chord > max_chord:
+                    return
+                if key == origin_key:
+                    continue
+                distance = chord_to_km(chord)
+                for summary in hospitals.get(key, {}).values():
+                    yield distance + penalty, distance, summary
+
+        merged = heapq.merge(*(stream(bt, penalty) for bt, penalty in penalties.items()), key=lambda item: item[0])
+        return list(itertools.islice(merged, max_results))
+
+    def nearest_donors(self, hospital, city, blood_type, max_results=5, max_distance_km=None):
+        """
+        Returns up to max_results donors of blood_type from other hospitals, nearest to
+        (hospital, city) first, optionally limited to max_distance_km. Returns None when
+        the origin hospital has no known location.
+          { "pid": ..., "firstName": ..., "lastName": ..., "hospital": ..., "city": ..., "distance_km": ... }
+        """
+        with self._lock:
+            ranked = self._ranked_donors((hospital, city), {blood_type: 0}, max_results, max_distance_km)
+        if ranked is None:
+            return None
+        return [{
+            "pid": summary["pid"],
+            "firstName": summary["firstName"],
+            "lastName": summary["lastName"],
+            "hospital": summary["hospital"],
+            "city": summary["city"],
+            "distance_km": round(distance, 2)
+        } for _, distance, summary in ranked]
+
+    def ranked_donors(self, hospital, city, penalties, max_results=5, max_distance_km=None):
+        """
+        Like nearest_donors, but over several blood types at once: penalties maps each
+        acceptable blood type to a ranking penalty in km. Results include the donor's
+        bloodType and its score (lower is better). Returns None for an unknown origin.
+        """
+        with self._lock:
+            ranked = self._ranked_donors((hospital, city), penalties, max_results, max_distance_km)
+        if ranked is None:
+            return None
+        return [{
+            "pid": summary["pid"],
+            "firstName": summary["firstName"],
+            "lastName": summary["lastName"],
+            "hospital": summary["hospital"],
+            "city": summary["city"],
+            "bloodType": summary["bloodType"],
+            "distance_km": round(distance, 2),
+            "score": round(score, 2)
+        } for score, distance, summary in ranked]
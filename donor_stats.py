@@ -0,0 +1,435 @@
+# donor_stats.py
+from bson import ObjectId
+from pymongo import UpdateOne
+from database import get_db
+from datetime import datetime
+import time
+from sequences import reserve_sequence, current_sequence
+from unique_index import create_unique_index
+
+COMPLETE_BLOOD_TYPES = ["O+", "A+", "B+", "AB+", "O-", "A-", "B-", "AB-"]
+DATA_VERSION = "donorStatsVersion"  # Counter bumped on every donorStats change.
+DONORS_VERSION = "donorsVersion"     # Counter bumped on every donor added or removed through the app.
+
+#######################################
+# Data Version
+#######################################
+
+def bump_data_version(db):
+    """
+    Marks donorStats as changed. Readers that cache derived payloads compare
+    get_data_version() against the version their cache was built from.
+    """
+    return reserve_sequence(db, DATA_VERSION, 1)[0]
+
+def get_data_version(db):
+    return current_sequence(db, DATA_VERSION)
+
+def get_donors_version(db):
+    return current_sequence(db, DONORS_VERSION)
+
+#######################################
+# Full Rebuild (Reconcile)
+#######################################
+
+def aggregate_donor_data_by_location(db):
+    pipeline = [
+        {"$match": {"role": "donor"}},
+        {"$group": {
+            "_id": {"hospital": "$hospital", "city": "$city", "bloodType": "$donorDetails.bloodType"},
+            "donorCount": {"$sum": 1}
+        }},
+        {"$group": {
+            "_id": {"hospital": "$_id.hospital", "city": "$_id.city"},
+            "bloodTypeStats": {"$push": {
+                "bloodType": "$_id.bloodType",
+                "donorCount": "$donorCount",
+                "surplus": False,
+                "shortage": False
+            }}
+        }},
+        {"$project": {
+            "_id": 0,
+            "hospital": "$_id.hospital",
+            "city": "$_id.city",
+            "bloodTypeStats": 1
+        }}
+    ]
+    return list(db.persons.aggregate(pipeline))
+
+def aggregate_inventory_by_location(db):
+    pipeline = [
+        {"$lookup": {"from": "bloodBags", "localField": "bbid", "foreignField": "bbid", "as": "bag"}},
+        {"$unwind": "$bag"},
+        {"$lookup": {"from": "locations", "localField": "lid", "foreignField": "lid", "as": "loc"}},
+        {"$unwind": "$loc"},
+        {"$match": {"available": True}},
+        {"$group": {
+            "_id": {"hospital": "$loc.name", "city": "$loc.city", "bloodType": "$bag.bloodType"},
+            "totalBloodCC": {"$sum": "$bag.quantityCC"}
+        }},
+        {"$group": {
+            "_id": {"hospital": "$_id.hospital", "city": "$_id.city"},
+            "inventoryStats": {"$push": {
+                "bloodType": "$_id.bloodType",
+                "totalBloodCC": "$totalBloodCC"
+            }}
+        }},
+        {"$project": {"_id": 0, "hospital": "$_id.hospital", "city": "$_id.city", "inventoryStats": 1}}
+    ]
+    return list(db.globalInventory.aggregate(pipeline))
+
+def merge_secondary_data(donor_stats, inventory_stats):
+    """
+    Merges the donor_stats and inventory_stats based on hospital and city.
+    This version safely checks for the keys "hospital" and "city" in each document.
+    """
+    inv_lookup = {}
+    for doc in inventory_stats:
+        hospital = doc.get("hospital")
+        city = doc.get("city")
+        if hospital is not None and city is not None:
+            inv_lookup[(hospital, city)] = doc.get("inventoryStats", [])
+
+    merged = []
+    for stat in donor_stats:
+        hospital = stat.get("hospital")
+        city = stat.get("city")
+        key = (hospital, city)
+        # If keys don't exist, default to an empty list.
+        stat["inventoryStats"] = inv_lookup.get(key, [])
+        merged.append(stat)
+    return merged
+
+# Every rebuild stages into its own "donorStats_staging_<ObjectId>" collection, so two
+# concurrent rebuilds never drop each other's staging data (the last swap wins).
+STAGING_PREFIX = "donorStats_staging_"
+
+def create_stats_indexes(collection):
+    """
+    Indexes every donorStats collection needs: the unique (hospital, city) key, which
+    also serves keyset pagination (a plain index if duplicates already exist, see
+    unique_index.create_unique_index), (coordinates.lat, coordinates.lon) for bounding-box
+    queries, and (bloodType, flag) multikey indexes for the surplus/shortage $elemMatch
+    queries of hospital matching. Safe to call repeatedly.
+    """
+    create_unique_index(collection, [("hospital", 1), ("city", 1)], {"unique": True})
+    collection.create_index([("coordinates.lat", 1), ("coordinates.lon", 1)])
+    collection.create_index([("bloodTypeStats.bloodType", 1), ("bloodTypeStats.surplus", 1)])
+    collection.create_index([("bloodTypeStats.bloodType", 1), ("bloodTypeStats.shortage", 1)])
+
+def create_secondary_collection(db, merged_data):
+    """
+    Writes merged_data into a staging collection, builds its indexes there and then
+    swaps it in with a single renameCollection(dropTarget=True), so readers of
+    'donorStats' always see either the old or the new complete collection.
+    Returns the time spent (in ms) on the build and on the swap.
+
+    Incremental writes (apply_*_delta, apply_flag_update, ...) that land on the old
+    'donorStats' while the rebuild runs are not carried over by the swap. Counts
+    stay correct when the primary write happened before the rebuild's aggregation
+    read it, but flags or counts changed between that read and the swap are lost
+    until the next rebuild, so run rebuilds when writes are quiet.
+    """
+    build_start = time.perf_counter()
+    staging_name = f"{STAGING_PREFIX}{ObjectId()}"
+    staging = db[staging_name]
+    if merged_data:
+        staging.insert_many(merged_data)
+    else:
+        db.create_collection(staging_name)
+    create_stats_indexes(staging)
+    build_ms = (time.perf_counter() - build_start) * 1000
+
+    swap_start = time.perf_counter()
+    try:
+        staging.rename("donorStats", dropTarget=True)
+    except Exception:
+        staging.drop()
+        raise
+    swap_ms = (time.perf_counter() - swap_start) * 1000
+    return build_ms, swap_ms
+
+def record_rebuild_metric(db, record_count, aggregate_ms, build_ms, swap_ms):
+    """
+    Stores the duration of one full rebuild in the 'rebuildMetrics' collection,
+    so rebuild and swap times can be tracked against data size.
+    """
+    metric = {
+        "collection": "donorStats",
+        "finishedAt": datetime.utcnow(),
+        "recordCount": record_count,
+        "aggregateMs": round(aggregate_ms, 2),
+        "buildMs": round(build_ms, 2),
+        "swapMs": round(swap_ms, 2),
+        "totalMs": round(aggregate_ms + build_ms + swap_ms, 2)
+    }
+    db.rebuildMetrics.insert_one(metric)
+    return metric
+
+def update_secondary_data(db):
+    """
+    Rebuilds the whole 'donorStats' collection from persons, globalInventory and locations.
+    Writes keep donorStats current through the incremental functions below, so this
+    full rebuild is only needed as an explicit reconcile step (see main()). Incremental
+    writes made while it runs can be lost at the swap (see create_secondary_collection).
+    """
+    aggregate_start = time.perf_counter()
+    donor_stats = aggregate_donor_data_by_location(db)
+    inventory_stats = aggregate_inventory_by_location(db)
+    merged_data = merge_secondary_data(donor_stats, inventory_stats)
+
+    hospitals = list(db.locations.find())
+
+    # Build lookup only for records that have both 'hospital' and 'city'
+    merged_dict = {
+        (rec.get("hospital"), rec.get("city")): rec
+        for rec in merged_data
+        if rec.get("hospital") is not None and rec.get("city") is not None
+    }
+
+    # Preserve existing flags if any
+    existing_flags = {}
+    for rec in db.donorStats.find():
+        key = (rec.get("hospital"), rec.get("city"))
+        if not key[0] or not key[1]:
+            continue
+        flags = {}
+        for bt in rec.get("bloodTypeStats", []):
+            flags[bt.get("bloodType")] = (bt.get("surplus", False), bt.get("shortage", False))
+        existing_flags[key] = flags
+
+    for hosp in hospitals:
+        key = (hosp.get("name"), hosp.get("city"))
+        if key not in merged_dict:
+            merged_dict[key] = {"hospital": hosp.get("name"), "city": hosp.get("city"),
+                                "bloodTypeStats": [], "inventoryStats": []}
+        record = merged_dict[key]
+        # Denormalized so map readers do not need a locations lookup per hospital.
+        if "coordinates" in hosp:
+            record["coordinates"] = hosp["coordinates"]
+        new_bt_stats = []
+        # Use flagSettings from hospital document if available
+        flag_settings = hosp.get("flagSettings", {})  # e.g. {"A+": {"surplus": True, "shortage": False}, ...}
+        donor_counts = {item.get("bloodType"): item.get("donorCount", 0) for item in record.get("bloodTypeStats", [])}
+        inventory = {item.get("bloodType"): item.get("totalBloodCC", 0) for item in record.get("inventoryStats", [])}
+        for bt in COMPLETE_BLOOD_TYPES:
+            donorCount = donor_counts.get(bt, 0)
+            if bt in flag_settings:
+                flags = (flag_settings[bt].get("surplus", False), flag_settings[bt].get("shortage", False))
+            else:
+                flags = existing_flags.get(key, {}).get(bt, (False, False))
+            new_bt_stats.append({
+                "bloodType": bt,
+                "donorCount": donorCount,
+                "surplus": flags[0],
+                "shortage": flags[1]
+            })
+        record["bloodTypeStats"] = new_bt_stats
+
+        new_inv_stats = []
+        for bt in COMPLETE_BLOOD_TYPES:
+            new_inv_stats.append({
+                "bloodType": bt,
+                "totalBloodCC": inventory.get(bt, 0)
+            })
+        record["inventoryStats"] = new_inv_stats
+
+    completed_merged_data = list(merged_dict.values())
+    aggregate_ms = (time.perf_counter() - aggregate_start) * 1000
+    build_ms, swap_ms = create_secondary_collection(db, completed_merged_data)
+    bump_data_version(db)
+    metric = record_rebuild_metric(db, len(completed_merged_data), aggregate_ms, build_ms, swap_ms)
+    print("Secondary collection 'donorStats' updated with complete data.")
+    print(f"Rebuild of {metric['recordCount']} record(s) took {metric['totalMs']} ms "
+          f"(swap {metric['swapMs']} ms).")
+
+#######################################
+# Incremental Maintenance
+#######################################
+
+def empty_stats_record(hospital, city, flag_settings=None):
+    """
+    Returns a donorStats record with zero counts for all eight blood types.
+    Flags are taken from flag_settings (the hospital's 'flagSettings') when present.
+    """
+    flag_settings = flag_settings or {}
+    return {
+        "hospital": hospital,
+        "city": city,
+        "bloodTypeStats": [
+            {
+                "bloodType": bt,
+                "donorCount": 0,
+                "surplus": flag_settings.get(bt, {}).get("surplus", False),
+                "shortage": flag_settings.get(bt, {}).get("shortage", False)
+            }
+            for bt in COMPLETE_BLOOD_TYPES
+        ],
+        "inventoryStats": [{"bloodType": bt, "totalBloodCC": 0} for bt in COMPLETE_BLOOD_TYPES]
+    }
+
+def _upsert_update(hospital, city, flag_settings=None, coordinates=None):
+    """
+    Update document that creates an empty (hospital, city) record, flagged from
+    flag_settings, and (re)writes its coordinates; existing counts and flags are kept.
+    """
+    record = empty_stats_record(hospital, city, flag_settings)
+    update = {"$setOnInsert": {"bloodTypeStats": record["bloodTypeStats"],
+                               "inventoryStats": record["inventoryStats"]}}
+    if coordinates:
+        update["$set"] = {"coordinates": coordinates}
+    return update
+
+def _hospital_locations(db, keys):
+    """
+    Returns {(name, city): locations document (flagSettings and coordinates only)} for
+    the (hospital, city) pairs in keys, with one query.
+    """
+    if not keys:
+        return {}
+    return {
+        (loc.get("name"), loc.get("city")): loc
+        for loc in db.locations.find({"$or": [{"name": hospital, "city": city} for hospital, city in keys]},
+                                     {"_id": 0, "name": 1, "city": 1, "flagSettings": 1, "coordinates": 1})
+    }
+
+def ensure_stats_record(db, hospital, city, flag_settings=None, coordinates=None):
+    """
+    Creates the donorStats record for (hospital, city) if it does not exist yet.
+    Existing records keep their counts and flags; coordinates, when given, are
+    (re)written so readers can use them without a locations lookup. When neither
+    flag_settings nor coordinates are given, both are read from the hospital's
+    locations document.
+    """
+    if flag_settings is None and coordinates is None:
+        loc = _hospital_locations(db, [(hospital, city)]).get((hospital, city), {})
+        flag_settings, coordinates = loc.get("flagSettings"), loc.get("coordinates")
+    db.donorStats.update_one({"hospital": hospital, "city": city},
+                             _upsert_update(hospital, city, flag_settings, coordinates), upsert=True)
+    bump_data_version(db)
+
+def ensure_stats_records(db, hospitals):
+    """
+    Bulk version of ensure_stats_record for newly onboarded hospitals: one upsert per
+    hospital in a single bulk write and one data version bump. hospitals is a list of
+      {"name": ..., "city": ..., "flagSettings": {...}, "coordinates": {...}}
+    """
+    operations = [
+        UpdateOne({"hospital": hosp["name"], "city": hosp["city"]},
+                  _upsert_update(hosp["name"], hosp["city"], hosp.get("flagSettings"), hosp.get("coordinates")),
+                  upsert=True)
+        for hosp in hospitals
+    ]
+    if not operations:
+        return
+    db.donorStats.bulk_write(operations, ordered=False)
+    bump_data_version(db)
+
+def backfill_coordinates(db):
+    """
+    Copies hospital coordinates into donorStats records that do not have them yet
+    (records written before coordinates were denormalized). One query on each
+    collection plus one bulk write; returns the number of records updated.
+    """
+    missing = [{"name": rec.get("hospital"), "city": rec.get("city")}
+               for rec in db.donorStats.find({"coordinates": {"$exists": False}}, {"_id": 0, "hospital": 1, "city": 1})]
+    if not missing:
+        return 0
+    operations = [
+        UpdateOne({"hospital": loc.get("name"), "city": loc.get("city")}, {"$set": {"coordinates": loc["coordinates"]}})
+        for loc in db.locations.find({"$or": missing, "coordinates": {"$exists": True}},
+                                     {"_id": 0, "name": 1, "city": 1, "coordinates": 1})
+    ]
+    if not operations:
+        return 0
+    result = db.donorStats.bulk_write(operations, ordered=False)
+    bump_data_version(db)
+    return result.modified_count
+
+def _update_blood_type_entry(db, hospital, city, blood_type, update):
+    """
+    Applies an update that targets one blood type entry (via the 'elem' array filter)
+    of the (hospital, city) record. The record is created on first use, so the common
+    case costs a single round trip.
+    """
+    if not hospital or not city or blood_type not in COMPLETE_BLOOD_TYPES:
+        return
+    query = {"hospital": hospital, "city": city}
+    result = db.donorStats.update_one(query, update, array_filters=[{"elem.bloodType": blood_type}])
+    if result.matched_count == 0:
+        ensure_stats_record(db, hospital, city)
+        db.donorStats.update_one(query, update, array_filters=[{"elem.bloodType": blood_type}])
+    bump_data_version(db)
+
+def apply_donor_delta(db, hospital, city, blood_type, delta):
+    """
+    Adjusts the donorCount of one (hospital, city, bloodType) entry by delta. Every
+    donor write path calls this, so it also bumps the donors version that in-memory
+    donor indexes in other processes compare against.
+    """
+    _update_blood_type_entry(db, hospital, city, blood_type,
+                             {"$inc": {"bloodTypeStats.$[elem].donorCount": delta}})
+    reserve_sequence(db, DONORS_VERSION, 1)
+
+def apply_inventory_delta(db, hospital, city, blood_type, delta_cc):
+    """
+    Adjusts the totalBloodCC of one (hospital, city, bloodType) entry by delta_cc.
+    """
+    _update_blood_type_entry(db, hospital, city, blood_type,
+                             {"$inc": {"inventoryStats.$[elem].totalBloodCC": delta_cc}})
+
+def apply_inventory_deltas(db, deltas):
+    """
+    Applies many totalBloodCC changes at once: deltas maps (hospital, city, bloodType)
+    to delta_cc. Missing records are created first (with the flags and coordinates of
+    their locations document), then all increments go out in one bulk write and the
+    data version is bumped once.
+    """
+    deltas = {key: delta for key, delta in deltas.items()
+              if delta and key[0] and key[1] and key[2] in COMPLETE_BLOOD_TYPES}
+    if not deltas:
+        return
+    keys = {(key[0], key[1]) for key in deltas}
+    existing = {(rec.get("hospital"), rec.get("city"))
+                for rec in db.donorStats.find({"$or": [{"hospital": hospital, "city": city} for hospital, city in keys]},
+                                              {"_id": 0, "hospital": 1, "city": 1})}
+    missing = keys - existing
+    if missing:
+        locations = _hospital_locations(db, missing)
+        db.donorStats.bulk_write([
+            UpdateOne({"hospital": hospital, "city": city},
+                      _upsert_update(hospital, city, locations.get((hospital, city), {}).get("flagSettings"),
+                                     locations.get((hospital, city), {}).get("coordinates")),
+                      upsert=True)
+            for hospital, city in missing
+        ], ordered=False)
+    db.donorStats.bulk_write([
+        UpdateOne({"hospital": hospital, "city": city},
+                  {"$inc": {"inventoryStats.$[elem].totalBloodCC": delta}},
+                  array_filters=[{"elem.bloodType": blood_type}])
+        for (hospital, city, blood_type), delta in deltas.items()
+    ], ordered=False)
+    bump_data_version(db)
+
+def apply_flag_update(db, hospital, city, blood_type, surplus=None, shortage=None):
+    """
+    Sets the surplus and/or shortage flag of one (hospital, city, bloodType) entry.
+    """
+    update_doc = {}
+    if surplus is not None:
+        update_doc["bloodTypeStats.$[elem].surplus"] = surplus
+    if shortage is not None:
+        update_doc["bloodTypeStats.$[elem].shortage"] = shortage
+    if update_doc:
+        _update_blood_type_entry(db, hospital, city, blood_type, {"$set": update_doc})
+
+def main():
+    """
+    Reconcile command: rebuilds donorStats from the primary collections.
+    """
+    db = get_db()
+    update_secondary_data(db)
+
+if __name__ == "__main__":
+    main()
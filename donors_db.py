@@ -1,16 +1,15 @@
 # donors_db.py
-from pymongo import MongoClient
+import database
+from database import get_client
 from datetime import datetime
 
 def get_db(db_name="bloodDonationDB"):
     """Connects to MongoDB and returns the specified database."""
-    client = MongoClient("mongodb://localhost:27017")
-    return client[db_name]
+    return database.get_db(db_name)
 
 def wipe_database(db_name="bloodDonationDB"):
     """Drops the specified database."""
-    client = MongoClient("mongodb://localhost:27017")
-    client.drop_database(db_name)
+    get_client().drop_database(db_name)
     print(f"Database '{db_name}' has been wiped.")
 
 def create_donors_collection(db):
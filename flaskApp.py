@@ -1,13 +1,15 @@
 # flaskApp.py
-from flask import Flask, request, Response
+from flask import Flask, request, Response, stream_with_context
 from flask_cors import CORS
-from pymongo import MongoClient
+from database import get_db
 from bson.json_util import dumps
 from hospital_matching import (
     match_surplus_for_shortage,
     match_shortage_for_surplus,
     match_donors_for_shortage,
-    match_donors_for_surplus
+    match_donors_for_surplus,
+    match_compatible_surplus_for_shortage,
+    match_compatible_donors_for_shortage
 )
 
 from managmentAuth import (
@@ -15,18 +17,170 @@ from managmentAuth import (
     add_donor_and_update,
     remove_donor_and_update,
     update_hospital_inventory,
+    update_inventory_batch,
     update_inventory_flag,
-    update_secondary_data,
+    HOSPITAL_NOT_FOUND,
+    AUTHENTICATION_FAILED,
 )
 
-from hospital_data import get_complete_hospital_data, get_complete_hospital_data_with_location
-from managmentAuth import add_hospital, update_secondary_data, verify_auth0_user
+from hospital_data import (
+    get_complete_hospital_data,
+    get_complete_hospital_data_with_location,
+    iter_hospital_data,
+    encode_cursor,
+    decode_cursor,
+    DATA_FIELDS,
+    MAX_PAGE_SIZE
+)
+from managmentAuth import add_hospital, add_hospitals, login_hospital
+from indexes import ensure_indexes
+from donor_index import DonorSpatialIndex
+from distance_matrix import HospitalDistanceMatrix, load_or_build
+from rebalance import build_rebalance_plan, DEFAULT_TARGET_UNITS, DEFAULT_CANDIDATES
+from donor_stats import get_data_version, backfill_coordinates, COMPLETE_BLOOD_TYPES
+from response_cache import PayloadCache
+from live_updates import DonorStatsBroadcaster
+from map_tiles import TileCache, MAX_ZOOM
+from streaming import stream_format, streaming_response, json_response
+from session_tokens import require_session_secret
+import hashlib
+import threading
 
+# Session tokens must verify on every worker, so refuse to start without a shared key.
+require_session_secret()
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["X-Next-Cursor"])
 # Connect to MongoDB
-client = MongoClient("mongodb://localhost:27017")
-db = client["americanRedCrossDB"]
+db = get_db()
+# Idempotent: every hot-path query (including $geoNear's 2dsphere index) needs these.
+ensure_indexes(db)
+backfill_coordinates(db)
+# In-memory donor index for /donor/matching/*, kept fresh from the change stream.
+donor_index = DonorSpatialIndex()
+donor_index.watch(db)
+# Hospital neighbor lists for /hospital/matching/*, loaded on first use (get_distance_matrix).
+distance_matrix = None
+distance_matrix_lock = threading.Lock()
+# Serialized /hospital/data* payloads, rebuilt only when the donorStats version changes.
+payload_cache = PayloadCache()
+# Clustered map tiles, precomputed per zoom level and rebuilt after writes.
+tile_cache = TileCache()
+# One donorStats change stream tailer per process, fanned out to /hospital/stream clients.
+broadcaster = DonorStatsBroadcaster()
+broadcaster.start(db)
+
+def get_distance_matrix():
+    """
+    Returns the hospital distance matrix, loading the saved one from
+    `python distance_matrix.py` (synced with locations) or building it on first use.
+    Hospitals added since (by another worker or script) are merged in before it is used.
+    """
+    global distance_matrix
+    with distance_matrix_lock:
+        if distance_matrix is None:
+            distance_matrix = load_or_build(db)
+        elif not distance_matrix.refresh(db):
+            distance_matrix = HospitalDistanceMatrix.build(db)
+    return distance_matrix
+
+def cached_json_response(key, build, iterate=None):
+    """
+    Serves the cached JSON payload for key with an ETag derived from the donorStats
+    version, answering 304 Not Modified when the client's If-None-Match still matches.
+    When the client asks for a streamed response (see streaming.stream_format) and
+    iterate is given, the documents are serialized straight from iterate()'s cursor
+    instead of from the cached body.
+    """
+    version = get_data_version(db)
+    fmt = stream_format(request.accept_mimetypes) if iterate else None
+    etag = f"{key}-{fmt}-{version}" if fmt else f"{key}-{version}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif fmt:
+        response = streaming_response(iterate(), fmt)
+    else:
+        body = payload_cache.get(key, version, lambda: dumps(build()))
+        response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+def hospital_data_filters(with_location=False):
+    """
+    Parses the optional query parameters of /hospital/data and /hospital/dataLoc:
+      - bbox: min_lon,min_lat,max_lon,max_lat
+      - bloodType: only this blood type in bloodData
+      - fields: comma-separated subset of hospital, city, coordinates, bloodData
+        (coordinates only with_location, i.e. on /hospital/dataLoc)
+      - limit: page size (at most MAX_PAGE_SIZE)
+      - after: the X-Next-Cursor value of the previous page
+    Returns (filters, error message).
+    """
+    args = request.args
+    filters = {}
+    if "bbox" in args:
+        try:
+            bbox = [float(value) for value in args["bbox"].split(",")]
+        except ValueError:
+            bbox = []
+        if len(bbox) != 4:
+            return None, "bbox must be min_lon,min_lat,max_lon,max_lat"
+        filters["bbox"] = bbox
+    if "bloodType" in args:
+        if args["bloodType"] not in COMPLETE_BLOOD_TYPES:
+            return None, f"bloodType must be one of {', '.join(COMPLETE_BLOOD_TYPES)}"
+        filters["blood_type"] = args["bloodType"]
+    if "fields" in args:
+        fields = [field.strip() for field in args["fields"].split(",") if field.strip()]
+        allowed = [field for field in DATA_FIELDS if with_location or field != "coordinates"]
+        if not fields or any(field not in allowed for field in fields):
+            return None, f"fields must be a comma-separated subset of {', '.join(allowed)}"
+        filters["fields"] = fields
+    if "limit" in args:
+        try:
+            limit = int(args["limit"])
+        except ValueError:
+            return None, "limit must be an integer"
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            return None, f"limit must be between 1 and {MAX_PAGE_SIZE}"
+        filters["limit"] = limit
+    if "after" in args:
+        try:
+            filters["after"] = decode_cursor(args["after"])
+        except ValueError as e:
+            return None, str(e)
+    return filters, None
+
+def filtered_json_response(key, with_location, filters):
+    """
+    Serves a filtered or paginated hospital data view straight from the database.
+    These views are not cached, but still carry a version-based ETag (per query string),
+    and are streamed like the full payload when the Accept header asks for it. A full
+    page sets X-Next-Cursor; pass it back as 'after' to get the next one.
+    """
+    version = get_data_version(db)
+    fmt = stream_format(request.accept_mimetypes)
+    query = hashlib.sha1(request.query_string).hexdigest()[:12]
+    etag = f"{key}-{query}-{fmt}-{version}" if fmt else f"{key}-{query}-{version}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        docs = iter_hospital_data(db, with_location, **filters)
+        next_cursor = None
+        if "limit" in filters:
+            # A page is bounded by MAX_PAGE_SIZE, so it is read in full to find its last key.
+            docs = list(docs)
+            if len(docs) == filters["limit"]:
+                next_cursor = encode_cursor(docs[-1])
+        if fmt:
+            response = streaming_response(docs, fmt)
+        else:
+            response = Response(dumps(list(docs)), mimetype="application/json")
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
 @app.route("/hospital/matching/surplus", methods=["GET"])
 def matching_surplus():
@@ -36,6 +190,10 @@ def matching_surplus():
       - shortage_city: Its city.
       - blood_type: Blood type needed.
       - max_results: (Optional) Maximum number of matches (default 5).
+      - max_distance_km: (Optional) Only return hospitals within this radius.
+      - mode: (Optional) "exact" (default) matches blood_type only; "compatible" also
+              matches every red-cell compatible donor type, ranked by distance, stock
+              and scarcity.
       
     Returns JSON: list of surplus hospital matches.
     """
@@ -46,12 +204,27 @@ def matching_surplus():
         max_results = int(request.args.get("max_results", 5))
     except ValueError:
         return Response(dumps({"error": "max_results must be an integer"}), mimetype="application/json"), 400
+    if max_results < 1:
+        return Response(dumps({"error": "max_results must be at least 1"}), mimetype="application/json"), 400
+    try:
+        max_distance_km = float(request.args["max_distance_km"]) if "max_distance_km" in request.args else None
+    except ValueError:
+        return Response(dumps({"error": "max_distance_km must be a number"}), mimetype="application/json"), 400
 
     if not shortage_hospital or not shortage_city or not blood_type:
         return Response(dumps({"error": "Missing required parameters"}), mimetype="application/json"), 400
 
-    matches = match_surplus_for_shortage(db, shortage_hospital, shortage_city, blood_type, max_results)
-    return Response(dumps(matches), mimetype="application/json"), 200
+    mode = request.args.get("mode", "exact")
+    if mode not in ("exact", "compatible"):
+        return Response(dumps({"error": "mode must be 'exact' or 'compatible'"}), mimetype="application/json"), 400
+
+    if mode == "compatible":
+        matches = match_compatible_surplus_for_shortage(db, shortage_hospital, shortage_city, blood_type, max_results,
+                                                        max_distance_km, distance_matrix=get_distance_matrix())
+    else:
+        matches = match_surplus_for_shortage(db, shortage_hospital, shortage_city, blood_type, max_results,
+                                             max_distance_km, distance_matrix=get_distance_matrix())
+    return json_response(matches, request.accept_mimetypes)
 
 @app.route("/hospital/matching/shortage", methods=["GET"])
 def matching_shortage():
@@ -61,6 +234,7 @@ def matching_shortage():
       - surplus_city: Its city.
       - blood_type: Blood type in surplus.
       - max_results: (Optional) Maximum number of matches (default 5).
+      - max_distance_km: (Optional) Only return hospitals within this radius.
       
     Returns JSON: list of shortage hospital matches.
     """
@@ -71,12 +245,19 @@ def matching_shortage():
         max_results = int(request.args.get("max_results", 5))
     except ValueError:
         return Response(dumps({"error": "max_results must be an integer"}), mimetype="application/json"), 400
+    if max_results < 1:
+        return Response(dumps({"error": "max_results must be at least 1"}), mimetype="application/json"), 400
+    try:
+        max_distance_km = float(request.args["max_distance_km"]) if "max_distance_km" in request.args else None
+    except ValueError:
+        return Response(dumps({"error": "max_distance_km must be a number"}), mimetype="application/json"), 400
 
     if not surplus_hospital or not surplus_city or not blood_type:
         return Response(dumps({"error": "Missing required parameters"}), mimetype="application/json"), 400
 
-    matches = match_shortage_for_surplus(db, surplus_hospital, surplus_city, blood_type, max_results)
-    return Response(dumps(matches), mimetype="application/json"), 200
+    matches = match_shortage_for_surplus(db, surplus_hospital, surplus_city, blood_type, max_results, max_distance_km,
+                                         distance_matrix=get_distance_matrix())
+    return json_response(matches, request.accept_mimetypes)
 
 @app.route("/donor/matching/shortage", methods=["GET"])
 def donor_matching_shortage():
@@ -89,6 +270,8 @@ def donor_matching_shortage():
       - shortage_city: Its city.
       - blood_type: Blood type of interest.
       - max_results: (Optional) Maximum number of donor matches (default 5).
+      - mode: (Optional) "exact" (default) or "compatible" to include every red-cell
+              compatible donor type, ranked by distance and scarcity.
     """
     shortage_hospital = request.args.get("shortage_hospital")
     shortage_city = request.args.get("shortage_city")
@@ -97,12 +280,24 @@ def donor_matching_shortage():
         max_results = int(request.args.get("max_results", 5))
     except ValueError:
         return Response(dumps({"error": "max_results must be an integer"}), mimetype="application/json"), 400
+    if max_results < 1:
+        return Response(dumps({"error": "max_results must be at least 1"}), mimetype="application/json"), 400
 
     if not shortage_hospital or not shortage_city or not blood_type:
         return Response(dumps({"error": "Missing required parameters"}), mimetype="application/json"), 400
 
-    matches = match_donors_for_shortage(db, shortage_hospital, shortage_city, blood_type, max_results)
-    return Response(dumps(matches), mimetype="application/json"), 200
+    mode = request.args.get("mode", "exact")
+    if mode not in ("exact", "compatible"):
+        return Response(dumps({"error": "mode must be 'exact' or 'compatible'"}), mimetype="application/json"), 400
+
+    donor_index.ensure_fresh(db)
+    if mode == "compatible":
+        matches = match_compatible_donors_for_shortage(db, shortage_hospital, shortage_city, blood_type, max_results,
+                                                       donor_index=donor_index)
+    else:
+        matches = match_donors_for_shortage(db, shortage_hospital, shortage_city, blood_type, max_results,
+                                            donor_index=donor_index)
+    return json_response(matches, request.accept_mimetypes)
 
 @app.route("/donor/matching/surplus", methods=["GET"])
 def donor_matching_surplus():
@@ -123,28 +318,120 @@ def donor_matching_surplus():
         max_results = int(request.args.get("max_results", 5))
     except ValueError:
         return Response(dumps({"error": "max_results must be an integer"}), mimetype="application/json"), 400
+    if max_results < 1:
+        return Response(dumps({"error": "max_results must be at least 1"}), mimetype="application/json"), 400
 
     if not surplus_hospital or not surplus_city or not blood_type:
         return Response(dumps({"error": "Missing required parameters"}), mimetype="application/json"), 400
 
-    matches = match_donors_for_surplus(db, surplus_hospital, surplus_city, blood_type, max_results)
-    return Response(dumps(matches), mimetype="application/json"), 200
+    donor_index.ensure_fresh(db)
+    matches = match_donors_for_surplus(db, surplus_hospital, surplus_city, blood_type, max_results,
+                                       donor_index=donor_index)
+    return json_response(matches, request.accept_mimetypes)
+
+@app.route("/hospital/rebalance/plan", methods=["GET"])
+def rebalance_plan_endpoint():
+    """
+    Computes a national transfer plan that moves surplus bags to shortage hospitals
+    with minimum total transport distance.
+    
+    Expects query parameters:
+      - target_units: (Optional) Bags per blood type each hospital should end up with (default 10).
+      - candidates: (Optional) Nearest surplus hospitals considered per shortage hospital (default 8).
+      - max_distance_km: (Optional) Longest transfer allowed.
+      - blood_type: (Optional, repeatable) Restrict the plan to these blood types.
+    
+    Returns JSON: {"transfers": [...], "unmet": [...], "totalUnits": ..., "totalUnitKm": ...}
+    """
+    try:
+        target_units = int(request.args.get("target_units", DEFAULT_TARGET_UNITS))
+        candidates = int(request.args.get("candidates", DEFAULT_CANDIDATES))
+    except ValueError:
+        return Response(dumps({"error": "target_units and candidates must be integers"}), mimetype="application/json"), 400
+    if candidates < 1:
+        return Response(dumps({"error": "candidates must be at least 1"}), mimetype="application/json"), 400
+    if target_units < 0:
+        return Response(dumps({"error": "target_units must not be negative"}), mimetype="application/json"), 400
+    try:
+        max_distance_km = float(request.args["max_distance_km"]) if "max_distance_km" in request.args else None
+    except ValueError:
+        return Response(dumps({"error": "max_distance_km must be a number"}), mimetype="application/json"), 400
+    blood_types = request.args.getlist("blood_type") or None
+
+    plan = build_rebalance_plan(db, target_units, candidates, max_distance_km, blood_types)
+    return Response(dumps(plan), mimetype="application/json"), 200
 
 @app.route("/hospital/data", methods=["GET"])
 def hospital_data_endpoint():
      """
      Returns aggregated hospital data as JSON.
+     Responses carry an ETag; send it back in If-None-Match to get 304 when nothing changed.
+     Send "Accept: application/x-ndjson" (one hospital per line) or
+     "Accept: application/json; stream=chunked" to stream the result.
+     Optional query parameters bbox, bloodType, fields, limit and after narrow the
+     result (see hospital_data_filters); fields=coordinates is rejected with 400 here,
+     use /hospital/data/loc for coordinates.
      """
-     data = get_complete_hospital_data(db)
-     return Response(dumps(data), mimetype="application/json"), 200
+     filters, error = hospital_data_filters()
+     if error:
+         return Response(dumps({"error": error}), mimetype="application/json"), 400
+     if filters:
+         return filtered_json_response("data", False, filters)
+     return cached_json_response("data", lambda: get_complete_hospital_data(db),
+                                 lambda: iter_hospital_data(db))
 
 @app.route("/hospital/dataLoc", methods=["GET"])
+@app.route("/hospital/data/loc", methods=["GET"])
 def hospital_dataLoc_endpoint():
      """
-     Returns aggregated hospital data as JSON.
+     Returns aggregated hospital data, including coordinates, as JSON.
+     Responses carry an ETag; send it back in If-None-Match to get 304 when nothing changed.
+     Supports the same streamed modes and query parameters as /hospital/data.
+     """
+     filters, error = hospital_data_filters(with_location=True)
+     if error:
+         return Response(dumps({"error": error}), mimetype="application/json"), 400
+     if filters:
+         return filtered_json_response("dataLoc", True, filters)
+     return cached_json_response("dataLoc", lambda: get_complete_hospital_data_with_location(db),
+                                 lambda: iter_hospital_data(db, with_location=True))
+
+@app.route("/hospital/stream", methods=["GET"])
+def hospital_stream_endpoint():
+     """
+     Server-Sent Events feed of live donorStats changes:
+       event: hospital   data: one changed hospital in the /hospital/data/loc shape
+       event: resync     data: {}  (refetch /hospital/data/loc once)
+     Needs MongoDB change streams (a replica set); answers 503 otherwise.
+     """
+     if not broadcaster.running:
+         return Response(dumps({"error": "Live updates are unavailable (change streams need a replica set)."}),
+                         mimetype="application/json"), 503
+     subscriber = broadcaster.subscribe()
+     response = Response(stream_with_context(broadcaster.events(subscriber)), mimetype="text/event-stream")
+     response.headers["Cache-Control"] = "no-cache"
+     response.headers["X-Accel-Buffering"] = "no"
+     return response
+
+@app.route("/hospital/tiles/<int:z>/<int:x>/<int:y>", methods=["GET"])
+def hospital_tile_endpoint(z, x, y):
+     """
+     Returns clustered hospital aggregates for one Web Mercator map tile:
+       {"z": ..., "x": ..., "y": ..., "hospitalCount": ..., "shortageCount": ...,
+        "clusters": [{"lat", "lon", "hospitalCount", "shortageCount", "bloodData": [...]}, ...]}
+     Tiles are cached per zoom level and carry an ETag tied to the donorStats version.
      """
-     data = get_complete_hospital_data_with_location(db)
-     return Response(dumps(data), mimetype="application/json"), 200
+     if z > MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+         return Response(dumps({"error": f"No such tile (zoom is 0-{MAX_ZOOM})."}), mimetype="application/json"), 404
+     version = get_data_version(db)
+     etag = f"tile-{z}-{x}-{y}-{version}"
+     if request.if_none_match.contains(etag):
+         response = Response(status=304)
+     else:
+         response = Response(dumps(tile_cache.get_tile(db, z, x, y, version)), mimetype="application/json")
+     response.set_etag(etag)
+     response.headers["Cache-Control"] = "no-cache"
+     return response
 
 @app.route("/hospital/create", methods=["POST"])
 def create_hospital_endpoint():
@@ -171,9 +458,86 @@ def create_hospital_endpoint():
     new_hosp = add_hospital(db, data)
     if not new_hosp:
         return Response(dumps({"error": "Hospital creation failed."}), mimetype="application/json"), 500
-    update_secondary_data(db)
+    # Holding the lock means a matrix still being built is extended once it is ready.
+    with distance_matrix_lock:
+        if distance_matrix is not None:
+            distance_matrix.add_hospital(new_hosp["lid"], new_hosp["name"], new_hosp["city"], new_hosp["coordinates"])
     return Response(dumps({"message": f"Hospital '{new_hosp['name']}' created successfully.", "hospital": new_hosp}), mimetype="application/json"), 201
 
+@app.route("/hospital/create/bulk", methods=["POST"])
+def create_hospitals_bulk_endpoint():
+    """
+    Creates many hospitals at once, with a single donorStats write and one incremental
+    distance matrix update.
+    Expects JSON payload:
+      {
+         "hospitals": [
+           {"name": "Example Hospital", "city": "City, State",
+            "coordinates": {"lat": 40.7128, "lon": -74.0060}, "password": "yourPassword",
+            "flagSettings": {...}},   // flagSettings optional, as for /hospital/create
+           ...
+         ]
+      }
+    Returns JSON: {"results": [{"index": 0, "name": ..., "city": ..., "status": "ok", "lid": ...}, ...]}
+    with one entry per hospital, in order. Auth0 signups finish in the background.
+    """
+    data = request.get_json(force=True)
+    hospitals = data.get("hospitals")
+    if not isinstance(hospitals, list) or not all(isinstance(hosp, dict) for hosp in hospitals):
+        return Response(dumps({"error": "hospitals must be a list of objects."}), mimetype="application/json"), 400
+    missing = [i for i, hosp in enumerate(hospitals) if "coordinates" not in hosp]
+    if missing:
+        return Response(dumps({"error": f"Missing coordinates for hospital(s) at index {missing}."}),
+                        mimetype="application/json"), 400
+
+    results, _ = add_hospitals(db, hospitals)
+    created = [hosp for hosp, result in zip(hospitals, results) if result["status"] == "ok"]
+    with distance_matrix_lock:
+        if distance_matrix is not None and created:
+            distance_matrix.add_hospitals(created)
+    return Response(dumps({"results": results}), mimetype="application/json"), 200
+
+def session_token(data):
+    """
+    Session token from an "Authorization: Bearer <token>" header or a "token" field.
+    """
+    header = request.headers.get("Authorization", "")
+    if header.startswith("Bearer "):
+        return header[len("Bearer "):].strip()
+    return data.get("token")
+
+def write_error_status(error):
+    """
+    HTTP status for an error message from update_hospital_inventory / update_inventory_flag.
+    """
+    if error == HOSPITAL_NOT_FOUND:
+        return 404
+    if error == AUTHENTICATION_FAILED:
+        return 401
+    return 409  # Not enough blood bags to remove.
+
+@app.route("/hospital/login", methods=["POST"])
+def login_endpoint():
+    """
+    Checks a hospital's password once and returns a session token for later writes.
+    Expects JSON payload:
+      {
+         "hospital": "Example Hospital",
+         "city": "City, State",
+         "password": "yourPassword"
+      }
+    Returns JSON: {"token": "..."}; send it as "Authorization: Bearer <token>" (or a
+    "token" field) instead of the password on inventory and flag updates.
+    """
+    data = request.get_json(force=True)
+    required = ["hospital", "city", "password"]
+    if not all(field in data for field in required):
+        return Response(dumps({"error": "Missing required fields."}), mimetype="application/json"), 400
+    token = login_hospital(db, data["hospital"], data["city"], data["password"])
+    if not token:
+        return Response(dumps({"error": "Invalid hospital or password."}), mimetype="application/json"), 401
+    return Response(dumps({"token": token}), mimetype="application/json"), 200
+
 @app.route("/hospital/inventory/update", methods=["POST"])
 def update_inventory_endpoint():
     """
@@ -184,22 +548,57 @@ def update_inventory_endpoint():
          "city": "City, State",
          "bloodType": "A+",
          "delta_count": 5,   // positive to add; negative to remove
-         "password": "yourPassword"
+         "password": "yourPassword"   // or a session token from /hospital/login
       }
+    Answers {"error": ...} with 401 (authentication failed), 404 (unknown hospital)
+    or 409 (not enough bags to remove).
     """
     data = request.get_json(force=True)
-    required = ["hospital", "city", "bloodType", "delta_count", "password"]
-    if not all(field in data for field in required):
+    token = session_token(data)
+    required = ["hospital", "city", "bloodType", "delta_count"]
+    if not all(field in data for field in required) or ("password" not in data and not token):
         return Response(dumps({"error": "Missing required fields."}), mimetype="application/json"), 400
     try:
         delta = int(data["delta_count"])
     except ValueError:
         return Response(dumps({"error": "delta_count must be an integer."}), mimetype="application/json"), 400
 
-    update_hospital_inventory(db, data["hospital"], data["city"], data["bloodType"], delta, password=data["password"])
-    update_secondary_data(db)
+    error = update_hospital_inventory(db, data["hospital"], data["city"], data["bloodType"], delta,
+                                      password=data.get("password"), token=token)
+    if error:
+        return Response(dumps({"error": error}), mimetype="application/json"), write_error_status(error)
     return Response(dumps({"message": "Inventory updated successfully."}), mimetype="application/json"), 200
 
+@app.route("/hospital/inventory/batch", methods=["POST"])
+def update_inventory_batch_endpoint():
+    """
+    Applies many inventory updates at once, with a single donorStats refresh at the end.
+    Expects JSON payload:
+      {
+         "operations": [
+           {"hospital": "Example Hospital", "city": "City, State", "bloodType": "A+",
+            "delta_count": 5, "password": "yourPassword"},   // password/token optional per operation
+           ...
+         ],
+         "token": "..."   // optional; also accepted as "Authorization: Bearer <token>"
+      }
+    Returns JSON: {"results": [{"index": 0, ..., "status": "ok", "applied": 5}, ...]}
+    with one entry per operation, in order.
+    """
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict):
+        return Response(dumps({"error": "Body must be a JSON object."}), mimetype="application/json"), 400
+    operations = data.get("operations")
+    if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+        return Response(dumps({"error": "operations must be a list of objects."}), mimetype="application/json"), 400
+    invalid = [i for i, op in enumerate(operations)
+               if not isinstance(op.get("hospital"), str) or not isinstance(op.get("city"), str)]
+    if invalid:
+        return Response(dumps({"error": f"hospital and city must be strings (operations at index {invalid})."}),
+                        mimetype="application/json"), 400
+    results = update_inventory_batch(db, operations, token=session_token(data))
+    return Response(dumps({"results": results}), mimetype="application/json"), 200
+
 @app.route("/hospital/flag/update", methods=["POST"])
 def update_flag_endpoint():
     """
@@ -211,18 +610,21 @@ def update_flag_endpoint():
          "bloodType": "A+",
          "surplus": true,         // optional
          "shortage": false,       // optional
-         "password": "yourPassword"
+         "password": "yourPassword"   // or a session token from /hospital/login
       }
+    Answers {"error": ...} with 401 (authentication failed) or 404 (unknown hospital).
     """
     data = request.get_json(force=True)
-    required = ["hospital", "city", "bloodType", "password"]
-    if not all(field in data for field in required):
+    token = session_token(data)
+    required = ["hospital", "city", "bloodType"]
+    if not all(field in data for field in required) or ("password" not in data and not token):
         return Response(dumps({"error": "Missing required fields."}), mimetype="application/json"), 400
 
-    update_inventory_flag(db, data["hospital"], data["city"], data["bloodType"],
-                          surplus=data.get("surplus"), shortage=data.get("shortage"),
-                          password=data["password"])
-    update_secondary_data(db)
+    error = update_inventory_flag(db, data["hospital"], data["city"], data["bloodType"],
+                                  surplus=data.get("surplus"), shortage=data.get("shortage"),
+                                  password=data.get("password"), token=token)
+    if error:
+        return Response(dumps({"error": error}), mimetype="application/json"), write_error_status(error)
     return Response(dumps({"message": "Inventory flags updated successfully."}), mimetype="application/json"), 200
 
 #######################################
@@ -255,6 +657,8 @@ def add_donor_endpoint():
 
     from hospital_managment import add_donor_and_update
     add_donor_and_update(db, donor_data)
+    if not donor_index.watching:
+        donor_index.invalidate()
     return Response(dumps({"message": "Donor added successfully."}), mimetype="application/json"), 201
 
 @app.route("/donor/remove", methods=["POST"])
@@ -271,6 +675,8 @@ def remove_donor_endpoint():
         return Response(dumps({"error": "Missing donor_id."}), mimetype="application/json"), 400
     from hospital_managment import remove_donor_and_update
     remove_donor_and_update(db, data["donor_id"])
+    if not donor_index.watching:
+        donor_index.invalidate()
     return Response(dumps({"message": "Donor removed successfully."}), mimetype="application/json"), 200
 
 
@@ -86,13 +86,12 @@ def search():
         return jsonify({"error": "Error querying Elasticsearch"}), 500
 
 # Optional: Endpoint to trigger data generation (for development/setup)
-from pymongo import MongoClient
+from database import get_db, get_client
 from datetime import datetime, timedelta
 import random
 
 def wipe_database(db_name="americanRedCrossDB"):
-    client = MongoClient("mongodb://localhost:27017")
-    client.drop_database(db_name)
+    get_client().drop_database(db_name)
     print(f"Database '{db_name}' has been dropped.")
 
 def generate_sample_hospitals(db, count=20):
@@ -216,8 +215,7 @@ def randomize_flags(db):
     print("Randomized flag settings updated.")
 
 def generate_all_sample_data():
-    client = MongoClient("mongodb://localhost:27017")
-    db = client["americanRedCrossDB"]
+    db = get_db()
     wipe_database("americanRedCrossDB")
     generate_sample_hospitals(db, count=20)
     generate_sample_donors(db, count=100)
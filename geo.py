@@ -0,0 +1,29 @@
+# geo.py
+from pymongo import GEOSPHERE
+from database import get_db
+
+def geo_point(coordinates):
+    """
+    Converts a {"lat": ..., "lon": ...} dict into a GeoJSON point
+    ({"type": "Point", "coordinates": [lon, lat]}) as used by the 2dsphere index.
+    """
+    return {"type": "Point", "coordinates": [coordinates["lon"], coordinates["lat"]]}
+
+def ensure_geo_index(db):
+    """
+    Backfills the GeoJSON 'location' field on hospitals that only have 'coordinates'
+    and makes sure the 'location' 2dsphere index exists. Safe to run repeatedly.
+    """
+    db.locations.update_many(
+        {"location": {"$exists": False}, "coordinates.lat": {"$exists": True}, "coordinates.lon": {"$exists": True}},
+        [{"$set": {"location": {"type": "Point", "coordinates": ["$coordinates.lon", "$coordinates.lat"]}}}]
+    )
+    db.locations.create_index([("location", GEOSPHERE)])
+
+def main():
+    db = get_db()
+    ensure_geo_index(db)
+    print("GeoJSON locations backfilled and 2dsphere index ensured.")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,145 @@
 # hospital_data.py
-from pymongo import MongoClient
+import base64
+import json
+from database import get_db
+from donor_stats import COMPLETE_BLOOD_TYPES
+
+def _entry_for(array_field, root=""):
+    """
+    Expression for the element of array_field whose bloodType is $$bt (or null).
+    """
+    return {"$arrayElemAt": [
+        {"$filter": {
+            "input": {"$ifNull": [f"${root}{array_field}", []]},
+            "as": "entry",
+            "cond": {"$eq": ["$$entry.bloodType", "$$bt"]}
+        }},
+        0
+    ]}
+
+def blood_data_expression(blood_types=None, root=""):
+    """
+    Builds the bloodData list on the server: one element per blood type (all of
+    COMPLETE_BLOOD_TYPES by default, in that order), defaulting to 0 CC and unset
+    flags when the record has no entry for it. root prefixes the field paths, e.g.
+    "fullDocument." inside a change stream.
+    """
+    return {
+        "$map": {
+            "input": blood_types or COMPLETE_BLOOD_TYPES,
+            "as": "bt",
+            "in": {"$let": {
+                "vars": {"inv": _entry_for("inventoryStats", root), "stat": _entry_for("bloodTypeStats", root)},
+                "in": {
+                    "bloodType": "$$bt",
+                    "totalBloodCC": {"$ifNull": ["$$inv.totalBloodCC", 0]},
+                    "surplus": {"$ifNull": ["$$stat.surplus", False]},
+                    "shortage": {"$ifNull": ["$$stat.shortage", False]}
+                }
+            }}
+        }
+    }
+
+BLOOD_DATA_EXPRESSION = blood_data_expression()
+
+#######################################
+# Filtering and Pagination
+#######################################
+
+DATA_FIELDS = ["hospital", "city", "coordinates", "bloodData"]
+MAX_PAGE_SIZE = 5000
+
+def encode_cursor(doc):
+    """
+    Keyset cursor for the page that follows doc: the (hospital, city) pair that
+    donorStats results are sorted by, as an opaque URL-safe token.
+    """
+    raw = json.dumps([doc.get("hospital"), doc.get("city")]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(token):
+    """
+    Inverse of encode_cursor. Raises ValueError for a malformed token, including one
+    whose values are not both strings (they end up in a $match filter).
+    """
+    try:
+        value = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {token}") from e
+    if not isinstance(value, list) or len(value) != 2 or not all(isinstance(part, str) for part in value):
+        raise ValueError(f"Invalid cursor: {token}")
+    return value[0], value[1]
+
+def bbox_filter(bbox):
+    """
+    Filter for records whose coordinates lie in bbox = (min_lon, min_lat, max_lon, max_lat).
+    A box with min_lon > max_lon crosses the antimeridian. Served by the
+    (coordinates.lat, coordinates.lon) index on donorStats.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    lat = {"coordinates.lat": {"$gte": min_lat, "$lte": max_lat}}
+    if min_lon <= max_lon:
+        return {**lat, "coordinates.lon": {"$gte": min_lon, "$lte": max_lon}}
+    return {**lat, "$or": [{"coordinates.lon": {"$gte": min_lon}}, {"coordinates.lon": {"$lte": max_lon}}]}
+
+def after_filter(after):
+    """
+    Filter for records sorted after the (hospital, city) pair. Raises ValueError unless
+    after is a pair of strings, so a crafted value can never inject query operators.
+    """
+    if (not isinstance(after, (list, tuple)) or len(after) != 2
+            or not all(isinstance(part, str) for part in after)):
+        raise ValueError("after must be a (hospital, city) pair of strings.")
+    hospital, city = after
+    return {"$or": [{"hospital": {"$gt": hospital}}, {"hospital": hospital, "city": {"$gt": city}}]}
+
+def hospital_data_pipeline(with_location=False, bbox=None, blood_type=None, fields=None, limit=None, after=None):
+    """
+    Aggregation pipeline behind the hospital data endpoints.
+      - bbox: (min_lon, min_lat, max_lon, max_lat); only hospitals inside it.
+      - blood_type: bloodData holds only this blood type.
+      - fields: subset of DATA_FIELDS to return ("hospital" and "city" are always kept).
+      - limit / after: keyset pagination over (hospital, city); after is the
+        (hospital, city) pair of the last record of the previous page.
+    """
+    conditions = []
+    if bbox:
+        conditions.append(bbox_filter(bbox))
+    if after:
+        conditions.append(after_filter(after))
+    pipeline = []
+    if conditions:
+        pipeline.append({"$match": conditions[0] if len(conditions) == 1 else {"$and": conditions}})
+    if limit or after:
+        # Sorting on the unique (hospital, city) index keeps pages stable.
+        pipeline.append({"$sort": {"hospital": 1, "city": 1}})
+    if limit:
+        pipeline.append({"$limit": limit})
+
+    projection = {"_id": 0, "hospital": 1, "city": 1}
+    wanted = set(fields or DATA_FIELDS)
+    if "bloodData" in wanted:
+        projection["bloodData"] = blood_data_expression([blood_type] if blood_type else None)
+    if with_location and "coordinates" in wanted:
+        projection["coordinates"] = {"$ifNull": ["$coordinates", {}]}
+    pipeline.append({"$project": projection})
+    return pipeline
+
+def iter_hospital_data(db, with_location=False, batch_size=1000, **filters):
+    """
+    Returns a cursor over the normalized donorStats records (see the functions below
+    for the document shape). The documents are shaped by the server, so callers can
+    stream them without holding the whole result in memory. filters are passed on to
+    hospital_data_pipeline().
+    """
+    return db.donorStats.aggregate(hospital_data_pipeline(with_location, **filters), batchSize=batch_size)
 
 def get_complete_hospital_data_with_location(db):
     """
     Retrieves aggregated data from the secondary collection 'donorStats'
     and ensures each hospital's data includes all eight blood types.
-    Additionally, it looks up the hospital's coordinates from the locations collection.
+    Coordinates are read from donorStats, where they are denormalized
+    (see donor_stats.backfill_coordinates for older records).
     Returns a list of dictionaries with:
       {
         "hospital": <name>,
@@ -17,39 +151,7 @@ def get_complete_hospital_data_with_location(db):
         ]
       }
     """
-    complete_blood_types = ["O+", "A+", "B+", "AB+", "O-", "A-", "B-", "AB-"]
-    records = list(db.donorStats.find())
-    results = []
-    
-    for rec in records:
-        hospital_name = rec.get("hospital")
-        city = rec.get("city")
-        # Retrieve hospital's coordinates from the locations collection.
-        loc = db.locations.find_one({"name": hospital_name, "city": city})
-        coordinates = loc.get("coordinates") if loc and "coordinates" in loc else {}
-        
-        inv_lookup = {inv.get("bloodType"): inv.get("totalBloodCC", 0)
-                      for inv in rec.get("inventoryStats", [])}
-        flag_lookup = {bt.get("bloodType"): {"surplus": bt.get("surplus", False),
-                                             "shortage": bt.get("shortage", False)}
-                       for bt in rec.get("bloodTypeStats", [])}
-        
-        blood_data = []
-        for bt in complete_blood_types:
-            blood_data.append({
-                "bloodType": bt,
-                "totalBloodCC": inv_lookup.get(bt, 0),
-                "surplus": flag_lookup.get(bt, {}).get("surplus", False),
-                "shortage": flag_lookup.get(bt, {}).get("shortage", False)
-            })
-        
-        results.append({
-            "hospital": hospital_name,
-            "city": city,
-            "coordinates": coordinates,
-            "bloodData": blood_data
-        })
-    return results
+    return list(iter_hospital_data(db, with_location=True))
 
 def get_complete_hospital_data(db):
     """
@@ -67,42 +169,10 @@ def get_complete_hospital_data(db):
       }
     If a blood type is missing, it defaults to amount 0 and flags False.
     """
-    complete_blood_types = ["O+", "A+", "B+", "AB+", "O-", "A-", "B-", "AB-"]
-    # Retrieve all aggregated records from donorStats.
-    records = list(db.donorStats.find())
-    results = []
-    
-    for rec in records:
-        hospital_name = rec.get("hospital")
-        city = rec.get("city")
-        
-        # Build lookups for inventory amounts and flag settings.
-        inv_lookup = {inv.get("bloodType"): inv.get("totalBloodCC", 0)
-                      for inv in rec.get("inventoryStats", [])}
-        flag_lookup = {bt.get("bloodType"): {"surplus": bt.get("surplus", False),
-                                             "shortage": bt.get("shortage", False)}
-                       for bt in rec.get("bloodTypeStats", [])}
-        
-        # Create a complete list for every blood type.
-        blood_data = []
-        for bt in complete_blood_types:
-            blood_data.append({
-                "bloodType": bt,
-                "totalBloodCC": inv_lookup.get(bt, 0),
-                "surplus": flag_lookup.get(bt, {}).get("surplus", False),
-                "shortage": flag_lookup.get(bt, {}).get("shortage", False)
-            })
-        
-        results.append({
-            "hospital": hospital_name,
-            "city": city,
-            "bloodData": blood_data
-        })
-    return results
+    return list(iter_hospital_data(db))
 
 def main():
-    client = MongoClient("mongodb://localhost:27017")
-    db = client["americanRedCrossDB"]
+    db = get_db()
     
     hospital_data = get_complete_hospital_data(db)
     for hosp in hospital_data:
@@ -1,169 +1,458 @@
 # hospital_matching.py
-from pymongo import MongoClient
+from database import get_db
 import math
+import numpy as np
+from geo import geo_point
+from compatibility import COMPATIBLE_DONOR_TYPES, scarcity_penalty_km, rank_score
+
+EARTH_RADIUS_KM = 6371  # Earth's radius in kilometers
 
 def haversine_distance(lat1, lon1, lat2, lon2):
     """
     Computes the Haversine distance (in kilometers) between two latitude/longitude points.
     """
-    R = 6371  # Earth's radius in kilometers
+    R = EARTH_RADIUS_KM
     dlat = math.radians(lat2 - lat1)
     dlon = math.radians(lon2 - lon1)
     a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
     return R * c
 
+def haversine_distances(lat, lon, lats, lons):
+    """
+    Vectorized Haversine distance (in kilometers) from (lat, lon) to every point in the
+    lats/lons arrays. Inputs broadcast, so a column of origins against a row of
+    candidates yields a full distance matrix.
+    """
+    lat1 = np.radians(lat)
+    lat2 = np.radians(lats)
+    dlat = lat2 - lat1
+    dlon = np.radians(lons) - np.radians(lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def top_k_indices(distances, k):
+    """
+    Returns the indices of the k smallest finite distances, nearest first.
+    Uses argpartition, so only the selected k entries get sorted.
+    """
+    n = len(distances)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=int)
+    idx = np.argpartition(distances, k - 1)[:k] if k < n else np.arange(n)
+    idx = idx[np.argsort(distances[idx], kind="stable")]
+    return idx[np.isfinite(distances[idx])]
+
+def _load_hospital_arrays(db):
+    """
+    Reads every hospital with coordinates once and returns
+    (names, cities, lats, lons, key_to_row) where key_to_row maps (name, city) to a row.
+    """
+    names, cities, lats, lons = [], [], [], []
+    for loc in db.locations.find({"coordinates": {"$exists": True}},
+                                 {"_id": 0, "name": 1, "city": 1, "coordinates": 1}):
+        names.append(loc.get("name"))
+        cities.append(loc.get("city"))
+        lats.append(loc["coordinates"]["lat"])
+        lons.append(loc["coordinates"]["lon"])
+    key_to_row = {(name, city): row for row, (name, city) in enumerate(zip(names, cities))}
+    return names, cities, np.array(lats, dtype=float), np.array(lons, dtype=float), key_to_row
+
 # ----- Hospital Matching Functions -----
 
-def match_surplus_for_shortage(db, shortage_hospital, shortage_city, blood_type, max_results=5):
+def _nearest_flagged_hospitals(db, origin, blood_type, flag, max_results=5, max_distance_km=None):
+    """
+    Runs a single $geoNear aggregation over 'locations' (2dsphere index on 'location'),
+    joins each candidate to its donorStats record and keeps only hospitals whose
+    bloodTypeStats entry for blood_type has the given flag ("surplus" or "shortage") set.
+    Candidates are streamed in distance order, so only the nearest max_results are joined.
+    """
+    near = origin.get("location") or geo_point(origin["coordinates"])
+    geo_near = {
+        "near": near,
+        "key": "location",
+        "distanceField": "distance_m",
+        "spherical": True,
+        "query": {"_id": {"$ne": origin["_id"]}}
+    }
+    if max_distance_km is not None:
+        geo_near["maxDistance"] = max_distance_km * 1000
+    pipeline = [
+        {"$geoNear": geo_near},
+        {"$lookup": {
+            "from": "donorStats",
+            "let": {"hospital": "$name", "city": "$city"},
+            "pipeline": [
+                {"$match": {
+                    "$expr": {"$and": [{"$eq": ["$hospital", "$$hospital"]}, {"$eq": ["$city", "$$city"]}]},
+                    "bloodTypeStats": {"$elemMatch": {"bloodType": blood_type, flag: True}}
+                }},
+                {"$project": {"_id": 1}}
+            ],
+            "as": "stats"
+        }},
+        {"$match": {"stats": {"$ne": []}}},
+        {"$limit": max_results},
+        {"$project": {
+            "_id": 0,
+            "hospital": "$name",
+            "city": "$city",
+            "distance_km": {"$round": [{"$divide": ["$distance_m", 1000]}, 2]}
+        }}
+    ]
+    return list(db.locations.aggregate(pipeline))
+
+def _distances_from(db, origin, keys, max_distance_km=None):
+    """
+    {(hospital, city): distance_km} from origin to the given hospitals (within
+    max_distance_km, if given), with one $geoNear restricted to them: no per-location
+    join, and the pipeline never reads more than len(keys) locations.
+    """
+    keys = list(keys)
+    geo_near = {
+        "near": origin.get("location") or geo_point(origin["coordinates"]),
+        "key": "location",
+        "distanceField": "distance_m",
+        "spherical": True,
+        "query": {"_id": {"$ne": origin["_id"]}, "$or": [{"name": hospital, "city": city} for hospital, city in keys]}
+    }
+    if max_distance_km is not None:
+        geo_near["maxDistance"] = max_distance_km * 1000
+    pipeline = [
+        {"$geoNear": geo_near},
+        {"$limit": len(keys)},
+        {"$project": {"_id": 0, "name": 1, "city": 1, "distance_m": 1}}
+    ]
+    return {(loc["name"], loc["city"]): loc["distance_m"] / 1000 for loc in db.locations.aggregate(pipeline)}
+
+def match_surplus_for_shortage(db, shortage_hospital, shortage_city, blood_type, max_results=5, max_distance_km=None,
+                               distance_matrix=None):
     """
     For a hospital with a shortage of a given blood type, finds up to max_results hospitals
-    (other than the shortage hospital) that have a surplus for that blood type.
+    (other than the shortage hospital) that have a surplus for that blood type, nearest first.
+    If max_distance_km is given, only hospitals within that radius are returned.
     Returns a list of dictionaries:
       { "hospital": <name>, "city": <city>, "distance_km": <distance> }
+    If a HospitalDistanceMatrix is passed as distance_matrix, the precomputed neighbor
+    list of the shortage hospital is used instead of a $geoNear query.
     """
+    if distance_matrix is not None:
+        snapshot = distance_matrix.snapshot
+        bitmap = snapshot.flag_bitmap(db, blood_type, "surplus")
+        matches = snapshot.nearest_flagged(shortage_hospital, shortage_city, bitmap, max_results, max_distance_km)
+        if matches is not None:
+            return matches
+
     # Get shortage hospital location.
     sh_loc = db.locations.find_one({"name": shortage_hospital, "city": shortage_city})
     if not sh_loc or "coordinates" not in sh_loc:
         print("Shortage hospital location not found!")
         return []
-    sh_lat = sh_loc["coordinates"]["lat"]
-    sh_lon = sh_loc["coordinates"]["lon"]
-
-    surplus_records = list(db.donorStats.find({
-        "bloodTypeStats": {"$elemMatch": {"bloodType": blood_type, "surplus": True}}
-    }))
-
-    matching_hospitals = []
-    for record in surplus_records:
-        if record["hospital"] == shortage_hospital and record["city"] == shortage_city:
-            continue  # skip the same hospital
-        sp_loc = db.locations.find_one({"name": record["hospital"], "city": record["city"]})
-        if not sp_loc or "coordinates" not in sp_loc:
-            continue
-        distance = haversine_distance(sh_lat, sh_lon, sp_loc["coordinates"]["lat"], sp_loc["coordinates"]["lon"])
-        matching_hospitals.append({
-            "hospital": record["hospital"],
-            "city": record["city"],
-            "distance_km": round(distance, 2)
-        })
-    matching_hospitals.sort(key=lambda x: x["distance_km"])
-    return matching_hospitals[:max_results]
+    return _nearest_flagged_hospitals(db, sh_loc, blood_type, "surplus", max_results, max_distance_km)
 
-def match_shortage_for_surplus(db, surplus_hospital, surplus_city, blood_type, max_results=5):
+def match_shortage_for_surplus(db, surplus_hospital, surplus_city, blood_type, max_results=5, max_distance_km=None,
+                               distance_matrix=None):
     """
     For a hospital with a surplus of a given blood type, finds up to max_results hospitals
-    (other than the surplus hospital) that have a shortage for that blood type.
+    (other than the surplus hospital) that have a shortage for that blood type, nearest first.
+    If max_distance_km is given, only hospitals within that radius are returned.
     Returns a list of dictionaries:
       { "hospital": <name>, "city": <city>, "distance_km": <distance> }
+    If a HospitalDistanceMatrix is passed as distance_matrix, the precomputed neighbor
+    list of the surplus hospital is used instead of a $geoNear query.
     """
+    if distance_matrix is not None:
+        snapshot = distance_matrix.snapshot
+        bitmap = snapshot.flag_bitmap(db, blood_type, "shortage")
+        matches = snapshot.nearest_flagged(surplus_hospital, surplus_city, bitmap, max_results, max_distance_km)
+        if matches is not None:
+            return matches
+
     sp_loc = db.locations.find_one({"name": surplus_hospital, "city": surplus_city})
     if not sp_loc or "coordinates" not in sp_loc:
         print("Surplus hospital location not found!")
         return []
-    sp_lat = sp_loc["coordinates"]["lat"]
-    sp_lon = sp_loc["coordinates"]["lon"]
-
-    shortage_records = list(db.donorStats.find({
-        "bloodTypeStats": {"$elemMatch": {"bloodType": blood_type, "shortage": True}}
-    }))
-
-    matching_hospitals = []
-    for record in shortage_records:
-        if record["hospital"] == surplus_hospital and record["city"] == surplus_city:
-            continue  # skip same hospital
-        sh_loc = db.locations.find_one({"name": record["hospital"], "city": record["city"]})
-        if not sh_loc or "coordinates" not in sh_loc:
-            continue
-        distance = haversine_distance(sp_lat, sp_lon, sh_loc["coordinates"]["lat"], sh_loc["coordinates"]["lon"])
-        matching_hospitals.append({
-            "hospital": record["hospital"],
-            "city": record["city"],
-            "distance_km": round(distance, 2)
-        })
-    matching_hospitals.sort(key=lambda x: x["distance_km"])
-    return matching_hospitals[:max_results]
+    return _nearest_flagged_hospitals(db, sp_loc, blood_type, "shortage", max_results, max_distance_km)
 
 # ----- Donor Matching Functions -----
 
-def match_donors_for_shortage(db, shortage_hospital, shortage_city, blood_type, max_results=5):
+def match_donors_for_shortage(db, shortage_hospital, shortage_city, blood_type, max_results=5, donor_index=None):
     """
     For a hospital with a shortage of donors for a given blood type, find donors (from other hospitals)
     with that blood type sorted by distance from the shortage hospital.
     
     Returns a list of donor info dictionaries:
       { "pid": <donor id>, "firstName": <first>, "lastName": <last>, "hospital": <hospital>, "city": <city>, "distance_km": <distance> }
+    If a DonorSpatialIndex is passed as donor_index, it answers the query without scanning persons.
     """
-    # Get shortage hospital location.
-    sh_loc = db.locations.find_one({"name": shortage_hospital, "city": shortage_city})
-    if not sh_loc or "coordinates" not in sh_loc:
+    if donor_index is not None:
+        matches = donor_index.nearest_donors(shortage_hospital, shortage_city, blood_type, max_results)
+        if matches is None:
+            print("Shortage hospital location not found!")
+            return []
+        return matches
+
+    matches = _batch_donor_matches(db, [(shortage_hospital, shortage_city, blood_type)], max_results)[0]
+    if matches is None:
         print("Shortage hospital location not found!")
         return []
-    sh_lat = sh_loc["coordinates"]["lat"]
-    sh_lon = sh_loc["coordinates"]["lon"]
-
-    # Query donors with the specified blood type.
-    donors = list(db.persons.find({"role": "donor", "donorDetails.bloodType": blood_type}))
-    matched_donors = []
-    for donor in donors:
-        # Exclude donors from the shortage hospital (optional).
-        if donor.get("hospital") == shortage_hospital and donor.get("city") == shortage_city:
-            continue
-        donor_loc = db.locations.find_one({"name": donor.get("hospital"), "city": donor.get("city")})
-        if not donor_loc or "coordinates" not in donor_loc:
-            continue
-        distance = haversine_distance(sh_lat, sh_lon, donor_loc["coordinates"]["lat"], donor_loc["coordinates"]["lon"])
-        matched_donors.append({
-            "pid": donor.get("pid"),
-            "firstName": donor.get("firstName"),
-            "lastName": donor.get("lastName"),
-            "hospital": donor.get("hospital"),
-            "city": donor.get("city"),
-            "distance_km": round(distance, 2)
-        })
-    matched_donors.sort(key=lambda x: x["distance_km"])
-    return matched_donors[:max_results]
-
-def match_donors_for_surplus(db, surplus_hospital, surplus_city, blood_type, max_results=5):
+    return matches
+
+def match_donors_for_surplus(db, surplus_hospital, surplus_city, blood_type, max_results=5, donor_index=None):
     """
     For a hospital with a surplus (or simply for matching purposes), find donors (from other hospitals)
     with the specified blood type sorted by distance from the surplus hospital.
     
     Returns a list of donor info dictionaries:
       { "pid": <donor id>, "firstName": <first>, "lastName": <last>, "hospital": <hospital>, "city": <city>, "distance_km": <distance> }
+    If a DonorSpatialIndex is passed as donor_index, it answers the query without scanning persons.
     """
-    sp_loc = db.locations.find_one({"name": surplus_hospital, "city": surplus_city})
-    if not sp_loc or "coordinates" not in sp_loc:
+    if donor_index is not None:
+        matches = donor_index.nearest_donors(surplus_hospital, surplus_city, blood_type, max_results)
+        if matches is None:
+            print("Surplus hospital location not found!")
+            return []
+        return matches
+
+    matches = _batch_donor_matches(db, [(surplus_hospital, surplus_city, blood_type)], max_results)[0]
+    if matches is None:
         print("Surplus hospital location not found!")
         return []
-    sp_lat = sp_loc["coordinates"]["lat"]
-    sp_lon = sp_loc["coordinates"]["lon"]
-
-    donors = list(db.persons.find({"role": "donor", "donorDetails.bloodType": blood_type}))
-    matched_donors = []
-    for donor in donors:
-        # Exclude donors from the surplus hospital.
-        if donor.get("hospital") == surplus_hospital and donor.get("city") == surplus_city:
+    return matches
+
+# ----- Compatibility-Aware Matching Functions -----
+
+def match_compatible_surplus_for_shortage(db, shortage_hospital, shortage_city, blood_type, max_results=5,
+                                          max_distance_km=None, distance_matrix=None):
+    """
+    For a hospital with a shortage of blood_type, finds up to max_results surplus offers
+    of any red-cell compatible donor type (e.g. A+, A-, O+ and O- for an A+ shortage).
+    All compatible types are fetched with one donorStats query; offers are ranked by
+    distance, the scarcity of the donor type and the available totalBloodCC
+    (see compatibility.rank_score; lower is better).
+    Returns a list of dictionaries:
+      { "hospital": <name>, "city": <city>, "bloodType": <donor type>, "totalBloodCC": <cc>,
+        "distance_km": <distance>, "score": <score> }
+    """
+    donor_types = COMPATIBLE_DONOR_TYPES.get(blood_type)
+    if not donor_types:
+        return []
+    # One donorStats query for every compatible type; distances come from the matrix or,
+    # without one, from a $geoNear over just these hospitals.
+    query = {"bloodTypeStats": {"$elemMatch": {"bloodType": {"$in": donor_types}, "surplus": True}}}
+    projection = {"_id": 0, "hospital": 1, "city": 1, "bloodTypeStats": 1, "inventoryStats": 1}
+    snapshot = distance_matrix.snapshot if distance_matrix is not None else None
+    records = []
+    if snapshot is not None and (shortage_hospital, shortage_city) in snapshot.key_to_row:
+        origin = snapshot.key_to_row[(shortage_hospital, shortage_city)]
+        origin_distances = snapshot.row_distances(origin).astype(float)
+        for rec in db.donorStats.find(query, projection):
+            row = snapshot.key_to_row.get((rec.get("hospital"), rec.get("city")))
+            if row is not None and row != origin:
+                rec["distance_km"] = float(origin_distances[row])
+                records.append(rec)
+    else:
+        sh_loc = db.locations.find_one({"name": shortage_hospital, "city": shortage_city})
+        if not sh_loc or "coordinates" not in sh_loc:
+            print("Shortage hospital location not found!")
+            return []
+        flagged = {(rec.get("hospital"), rec.get("city")): rec for rec in db.donorStats.find(query, projection)}
+        if flagged:
+            for key, distance_km in _distances_from(db, sh_loc, flagged, max_distance_km).items():
+                flagged[key]["distance_km"] = distance_km
+                records.append(flagged[key])
+
+    offers = []
+    for rec in records:
+        inventory = {inv.get("bloodType"): inv.get("totalBloodCC", 0) for inv in rec.get("inventoryStats") or []}
+        for bt in rec.get("bloodTypeStats") or []:
+            if bt.get("surplus") and bt.get("bloodType") in donor_types:
+                offers.append((rec["distance_km"], rec["hospital"], rec["city"], bt["bloodType"],
+                               inventory.get(bt["bloodType"], 0)))
+    if not offers:
+        return []
+
+    distances = np.array([offer[0] for offer in offers], dtype=float)
+    scores = np.array([rank_score(offer[0], offer[3], offer[4]) for offer in offers])
+    if max_distance_km is not None:
+        scores[distances > max_distance_km] = np.inf
+    return [{
+        "hospital": offers[i][1],
+        "city": offers[i][2],
+        "bloodType": offers[i][3],
+        "totalBloodCC": offers[i][4],
+        "distance_km": round(float(distances[i]), 2),
+        "score": round(float(scores[i]), 2)
+    } for i in top_k_indices(scores, max_results)]
+
+def match_compatible_donors_for_shortage(db, shortage_hospital, shortage_city, blood_type, max_results=5,
+                                         donor_index=None):
+    """
+    For a hospital with a shortage of blood_type, finds up to max_results donors from
+    other hospitals whose type is red-cell compatible, ranked by distance plus the
+    scarcity penalty of their type (so nearby common types beat a far-away O-).
+    Returns a list of donor info dictionaries:
+      { "pid": ..., "firstName": ..., "lastName": ..., "hospital": ..., "city": ...,
+        "bloodType": <donor type>, "distance_km": <distance>, "score": <score> }
+    """
+    donor_types = COMPATIBLE_DONOR_TYPES.get(blood_type)
+    if not donor_types:
+        return []
+    penalties = {bt: scarcity_penalty_km(bt) for bt in donor_types}
+    if donor_index is not None:
+        matches = donor_index.ranked_donors(shortage_hospital, shortage_city, penalties, max_results)
+        if matches is None:
+            print("Shortage hospital location not found!")
+            return []
+        return matches
+
+    _, _, lats, lons, key_to_row = _load_hospital_arrays(db)
+    origin = key_to_row.get((shortage_hospital, shortage_city))
+    if origin is None:
+        print("Shortage hospital location not found!")
+        return []
+    hospital_distances = haversine_distances(lats[origin], lons[origin], lats, lons)
+    hospital_distances[origin] = np.inf
+
+    donors, rows = [], []
+    projection = {"_id": 0, "pid": 1, "firstName": 1, "lastName": 1, "hospital": 1, "city": 1,
+                  "donorDetails.bloodType": 1}
+    for donor in db.persons.find({"role": "donor", "donorDetails.bloodType": {"$in": donor_types}}, projection):
+        row = key_to_row.get((donor.get("hospital"), donor.get("city")))
+        if row is not None:
+            donors.append(donor)
+            rows.append(row)
+    if not donors:
+        return []
+    distances = hospital_distances[np.array(rows, dtype=int)]
+    scores = distances + np.array([penalties[donor["donorDetails"]["bloodType"]] for donor in donors])
+    return [{
+        "pid": donors[i].get("pid"),
+        "firstName": donors[i].get("firstName"),
+        "lastName": donors[i].get("lastName"),
+        "hospital": donors[i].get("hospital"),
+        "city": donors[i].get("city"),
+        "bloodType": donors[i]["donorDetails"]["bloodType"],
+        "distance_km": round(float(distances[i]), 2),
+        "score": round(float(scores[i]), 2)
+    } for i in top_k_indices(scores, max_results)]
+
+# ----- Batch Matching Functions -----
+
+def _batch_hospital_matches(db, requests, flag, max_results):
+    """
+    Answers many (hospital, city, blood_type) requests against hospitals whose flag
+    ("surplus" or "shortage") is set, reading locations and donorStats once.
+    Returns one result list per request (None when the requesting hospital is unknown).
+    """
+    names, cities, lats, lons, key_to_row = _load_hospital_arrays(db)
+    blood_types = {blood_type for _, _, blood_type in requests}
+    flagged = {bt: np.zeros(len(names), dtype=bool) for bt in blood_types}
+    query = {"bloodTypeStats": {"$elemMatch": {"bloodType": {"$in": list(blood_types)}, flag: True}}}
+    for rec in db.donorStats.find(query, {"_id": 0, "hospital": 1, "city": 1, "bloodTypeStats": 1}):
+        row = key_to_row.get((rec.get("hospital"), rec.get("city")))
+        if row is None:
             continue
-        donor_loc = db.locations.find_one({"name": donor.get("hospital"), "city": donor.get("city")})
-        if not donor_loc or "coordinates" not in donor_loc:
+        for bt in rec.get("bloodTypeStats", []):
+            if bt.get(flag) and bt.get("bloodType") in flagged:
+                flagged[bt["bloodType"]][row] = True
+
+    results = []
+    for hospital, city, blood_type in requests:
+        origin = key_to_row.get((hospital, city))
+        if origin is None:
+            results.append(None)
             continue
-        distance = haversine_distance(sp_lat, sp_lon, donor_loc["coordinates"]["lat"], donor_loc["coordinates"]["lon"])
-        matched_donors.append({
-            "pid": donor.get("pid"),
-            "firstName": donor.get("firstName"),
-            "lastName": donor.get("lastName"),
-            "hospital": donor.get("hospital"),
-            "city": donor.get("city"),
-            "distance_km": round(distance, 2)
-        })
-    matched_donors.sort(key=lambda x: x["distance_km"])
-    return matched_donors[:max_results]
+        candidates = np.flatnonzero(flagged[blood_type])
+        candidates = candidates[candidates != origin]
+        distances = haversine_distances(lats[origin], lons[origin], lats[candidates], lons[candidates])
+        results.append([
+            {"hospital": names[candidates[i]], "city": cities[candidates[i]],
+             "distance_km": round(float(distances[i]), 2)}
+            for i in top_k_indices(distances, max_results)
+        ])
+    return results
+
+def _batch_donor_matches(db, requests, max_results):
+    """
+    Answers many (hospital, city, blood_type) donor requests, reading locations and
+    the donors of the requested blood types once. Distances are computed per hospital
+    and shared by all donors of that hospital.
+    Returns one result list per request (None when the requesting hospital is unknown).
+    """
+    names, cities, lats, lons, key_to_row = _load_hospital_arrays(db)
+    blood_types = {blood_type for _, _, blood_type in requests}
+    donors = {bt: [] for bt in blood_types}
+    donor_rows = {bt: [] for bt in blood_types}
+    projection = {"_id": 0, "pid": 1, "firstName": 1, "lastName": 1, "hospital": 1, "city": 1,
+                  "donorDetails.bloodType": 1}
+    for donor in db.persons.find({"role": "donor", "donorDetails.bloodType": {"$in": list(blood_types)}}, projection):
+        row = key_to_row.get((donor.get("hospital"), donor.get("city")))
+        if row is None:
+            continue
+        bt = donor["donorDetails"]["bloodType"]
+        donors[bt].append(donor)
+        donor_rows[bt].append(row)
+    donor_rows = {bt: np.array(rows, dtype=int) for bt, rows in donor_rows.items()}
+
+    results = []
+    for hospital, city, blood_type in requests:
+        origin = key_to_row.get((hospital, city))
+        if origin is None:
+            results.append(None)
+            continue
+        hospital_distances = haversine_distances(lats[origin], lons[origin], lats, lons)
+        # Donors of the requesting hospital itself are excluded.
+        hospital_distances[origin] = np.inf
+        distances = hospital_distances[donor_rows[blood_type]]
+        matches = []
+        for i in top_k_indices(distances, max_results):
+            donor = donors[blood_type][i]
+            matches.append({
+                "pid": donor.get("pid"),
+                "firstName": donor.get("firstName"),
+                "lastName": donor.get("lastName"),
+                "hospital": donor.get("hospital"),
+                "city": donor.get("city"),
+                "distance_km": round(float(distances[i]), 2)
+            })
+        results.append(matches)
+    return results
+
+def match_surplus_for_shortage_batch(db, requests, max_results=5):
+    """
+    Batch version of match_surplus_for_shortage.
+    requests is a list of (shortage_hospital, shortage_city, blood_type) tuples;
+    returns a list of match lists in the same order.
+    """
+    return [matches or [] for matches in _batch_hospital_matches(db, requests, "surplus", max_results)]
+
+def match_shortage_for_surplus_batch(db, requests, max_results=5):
+    """
+    Batch version of match_shortage_for_surplus.
+    requests is a list of (surplus_hospital, surplus_city, blood_type) tuples;
+    returns a list of match lists in the same order.
+    """
+    return [matches or [] for matches in _batch_hospital_matches(db, requests, "shortage", max_results)]
+
+def match_donors_for_shortage_batch(db, requests, max_results=5):
+    """
+    Batch version of match_donors_for_shortage.
+    requests is a list of (shortage_hospital, shortage_city, blood_type) tuples;
+    returns a list of donor match lists in the same order.
+    """
+    return [matches or [] for matches in _batch_donor_matches(db, requests, max_results)]
+
+def match_donors_for_surplus_batch(db, requests, max_results=5):
+    """
+    Batch version of match_donors_for_surplus.
+    requests is a list of (surplus_hospital, surplus_city, blood_type) tuples;
+    returns a list of donor match lists in the same order.
+    """
+    return [matches or [] for matches in _batch_donor_matches(db, requests, max_results)]
 
 def main():
-    from pymongo import MongoClient
-    client = MongoClient("mongodb://localhost:27017")
-    db = client["americanRedCrossDB"]
+    db = get_db()
 
     blood_type = "A+"
     
@@ -0,0 +1,136 @@
+# indexes.py
+import argparse
+import sys
+from database import get_db
+from donor_stats import create_stats_indexes
+from geo import ensure_geo_index
+from unique_index import create_unique_index
+
+#######################################
+# Index Definitions
+#######################################
+
+# Secondary indexes behind every hot-path query, as (keys, options) per collection.
+# donorStats indexes live in donor_stats.create_stats_indexes (the rebuild creates them
+# on its staging collection) and the 2dsphere index on locations in geo.ensure_geo_index.
+INDEXES = {
+    "locations": [
+        ([("name", 1), ("city", 1)], {"unique": True}),
+        ([("lid", 1)], {"unique": True})
+    ],
+    "persons": [
+        ([("role", 1), ("donorDetails.bloodType", 1)], {}),
+        ([("pid", 1)], {})
+    ],
+    "bloodBags": [
+        ([("bbid", 1)], {"unique": True})
+    ],
+    "globalInventory": [
+        ([("lid", 1), ("available", 1)], {}),
+        ([("bbid", 1)], {})
+    ]
+}
+
+def ensure_indexes(db):
+    """
+    Creates every index the application relies on. create_index is a no-op for
+    indexes that already exist, so this is safe to run at every startup and after
+    every data load.
+    """
+    for collection, specs in INDEXES.items():
+        for keys, options in specs:
+            if options.get("unique"):
+                create_unique_index(db[collection], keys, options)
+            else:
+                db[collection].create_index(keys, **options)
+    create_stats_indexes(db.donorStats)
+    ensure_geo_index(db)
+
+#######################################
+# COLLSCAN Check
+#######################################
+
+# Representative hot-path queries: (name, collection, "find" filter or "aggregate" pipeline).
+HOT_QUERIES = [
+    ("locations by name/city", "locations", "find", {"name": "Example Hospital", "city": "Boston, MA"}),
+    ("locations by lid", "locations", "find", {"lid": "L0001"}),
+    ("donors by blood type", "persons", "find", {"role": "donor", "donorDetails.bloodType": {"$in": ["O-", "O+"]}}),
+    ("donor by pid", "persons", "find", {"pid": "P0000001", "role": "donor"}),
+    ("donorStats by hospital/city", "donorStats", "find", {"hospital": "Example Hospital", "city": "Boston, MA"}),
+    ("donorStats surplus flag", "donorStats", "find",
+     {"bloodTypeStats": {"$elemMatch": {"bloodType": {"$in": ["O-"]}, "surplus": True}}}),
+    ("donorStats shortage flag", "donorStats", "find",
+     {"bloodTypeStats": {"$elemMatch": {"bloodType": {"$in": ["O-"]}, "shortage": True}}}),
+    ("donorStats bounding box", "donorStats", "find",
+     {"coordinates.lat": {"$gte": 30, "$lte": 45}, "coordinates.lon": {"$gte": -100, "$lte": -70}}),
+    ("bloodBags by bbid", "bloodBags", "find", {"bbid": "NEW1"}),
+    ("inventory by bbid", "globalInventory", "find", {"bbid": "NEW1"}),
+    ("available bags of a hospital", "globalInventory", "aggregate", [
+        {"$match": {"lid": 1, "available": True}},
+        {"$lookup": {"from": "bloodBags", "localField": "bbid", "foreignField": "bbid", "as": "bag"}},
+        {"$unwind": "$bag"},
+        {"$match": {"bag.bloodType": "O-"}},
+        {"$limit": 5}
+    ]),
+    ("nearest hospitals", "locations", "aggregate", [
+        {"$geoNear": {"near": {"type": "Point", "coordinates": [-71.06, 42.36]}, "key": "location",
+                      "distanceField": "distance_m", "spherical": True}},
+        {"$limit": 5}
+    ])
+]
+
+def _plan_problems(node, problems):
+    """
+    Walks an explain document and records every collection scan, including the ones
+    inside $lookup sub-plans, and every $lookup that joins without an index.
+    """
+    if isinstance(node, dict):
+        if node.get("stage") == "COLLSCAN":
+            problems.add("COLLSCAN")
+        if node.get("strategy") == "NestedLoopJoin":
+            problems.add("$lookup without index (NestedLoopJoin)")
+        if "$lookup" in node and node.get("collectionScans", 0):
+            problems.add("$lookup without index (collectionScans)")
+        for value in node.values():
+            _plan_problems(value, problems)
+    elif isinstance(node, list):
+        for value in node:
+            _plan_problems(value, problems)
+    return problems
+
+def explain_query(db, collection, kind, query):
+    if kind == "find":
+        return db.command("explain", {"find": collection, "filter": query}, verbosity="queryPlanner")
+    return db.command("explain", {"aggregate": collection, "pipeline": query, "cursor": {}},
+                      verbosity="executionStats")
+
+def find_collscans(db):
+    """
+    Explains every query in HOT_QUERIES and returns [(name, [problems])] for the ones
+    that would scan a whole collection. An empty list means every hot path is indexed.
+    """
+    failures = []
+    for name, collection, kind, query in HOT_QUERIES:
+        problems = _plan_problems(explain_query(db, collection, kind, query), set())
+        if problems:
+            failures.append((name, sorted(problems)))
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Create all indexes, then check hot-path queries for collection scans.")
+    parser.add_argument("--check-only", action="store_true", help="Only run the COLLSCAN check.")
+    args = parser.parse_args()
+
+    db = get_db()
+    if not args.check_only:
+        ensure_indexes(db)
+        print("Indexes are up to date.")
+    failures = find_collscans(db)
+    for name, problems in failures:
+        print(f"FAIL {name}: {', '.join(problems)}")
+    if failures:
+        sys.exit(1)
+    print(f"All {len(HOT_QUERIES)} hot-path queries use an index.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# inventory.py
+from bson import ObjectId
+from sequences import reserve_sequence
+from transactions import run_in_transaction
+
+NEW_BAG_CC = 450  # Every bag added through the app is a 450cc whole-blood donation.
+
+#######################################
+# Adding Bags
+#######################################
+
+def add_bags(db, additions):
+    """
+    Adds new whole-blood bags. additions is a list of (lid, bloodType, count) with
+    count > 0; all bbids come from one sequence reservation and each collection gets
+    a single insert_many. Returns the cc added for each entry, in order.
+    """
+    total = sum(count for _, _, count in additions)
+    if not total:
+        return [0 for _ in additions]
+    # Bags are never deleted, so the bag count is a safe floor for the counter on its first use.
+    numbers = iter(reserve_sequence(db, "bbid", total, floor=db.bloodBags.estimated_document_count()))
+    new_blood_bags = []
+    new_inventory = []
+    added = []
+    for lid, blood_type, count in additions:
+        for _ in range(count):
+            new_bbid = "NEW" + str(next(numbers))
+            new_blood_bags.append({
+                "bbid": new_bbid,
+                "donationType": "Whole Blood",
+                "quantityCC": NEW_BAG_CC,
+                "bloodType": blood_type,
+                "available": True
+            })
+            new_inventory.append({"bbid": new_bbid, "lid": lid, "available": True})
+        added.append(NEW_BAG_CC * count)
+    db.bloodBags.insert_many(new_blood_bags, ordered=False)
+    db.globalInventory.insert_many(new_inventory, ordered=False)
+    return added
+
+#######################################
+# Retiring Bags
+#######################################
+
+def _select_bags(db, lid, blood_type, limit, session):
+    # Filter this hospital's inventory (lid/available index) before joining the bags,
+    # and stop as soon as enough bags of the requested type are found.
+    pipeline = [
+        {"$match": {"lid": lid, "available": True}},
+        {"$lookup": {"from": "bloodBags", "localField": "bbid", "foreignField": "bbid", "as": "bag"}},
+        {"$unwind": "$bag"},
+        {"$match": {"bag.bloodType": blood_type}},
+        {"$limit": limit},
+        {"$project": {"_id": 1, "bag.bbid": 1, "bag.quantityCC": 1}}
+    ]
+    return list(db.globalInventory.aggregate(pipeline, session=session))
+
+def _claim_bags(db, lid, blood_type, count, session):
+    """
+    Marks count available inventory rows of this hospital and blood type as taken
+    ({"available": False, "retireClaim": <claim id>}). The update only matches rows that
+    are still available, so a bag another request retired between the selection and the
+    write is never counted twice; when that happens (no transactions on a standalone
+    mongod) the shortfall is selected again. Returns (claim, {_id: (bbid, quantityCC)}),
+    or (None, number of bags available) after releasing its claims if there are too few.
+    """
+    claim = ObjectId()
+    claimed = {}
+    while len(claimed) < count:
+        candidates = _select_bags(db, lid, blood_type, count - len(claimed), session)
+        if len(candidates) < count - len(claimed):
+            if claimed:
+                db.globalInventory.update_many(
+                    {"_id": {"$in": list(claimed)}, "retireClaim": claim},
+                    {"$set": {"available": True}, "$unset": {"retireClaim": ""}}, session=session)
+            return None, len(claimed) + len(candidates)
+        ids = [rec["_id"] for rec in candidates]
+        result = db.globalInventory.update_many(
+            {"_id": {"$in": ids}, "available": True},
+            {"$set": {"available": False, "retireClaim": claim}}, session=session)
+        if result.modified_count < len(ids):
+            won = {rec["_id"] for rec in db.globalInventory.find(
+                {"_id": {"$in": ids}, "retireClaim": claim}, {"_id": 1}, session=session)}
+            candidates = [rec for rec in candidates if rec["_id"] in won]
+        for rec in candidates:
+            claimed[rec["_id"]] = (rec["bag"]["bbid"], rec["bag"].get("quantityCC", 0))
+    return claim, claimed
+
+def retire_bags(db, removals):
+    """
+    Retires bags in one transaction. removals is a list of (lid, bloodType, count) with
+    count > 0, applied in order, so several entries for the same hospital and blood type
+    take different bags. Each entry is all or nothing. Returns one (removed_cc, available)
+    pair per entry: removed_cc is the cc of the rows actually retired, or None when fewer
+    than count bags were available (available says how many).
+    """
+    def retire(session):
+        outcomes = []
+        claims = {}
+        for lid, blood_type, count in removals:
+            claim, claimed = _claim_bags(db, lid, blood_type, count, session)
+            if claim is None:
+                outcomes.append((None, claimed))
+                continue
+            claims[claim] = claimed
+            outcomes.append((sum(quantity for _, quantity in claimed.values()), count))
+        if claims:
+            ids = [_id for claimed in claims.values() for _id in claimed]
+            db.globalInventory.delete_many(
+                {"_id": {"$in": ids}, "retireClaim": {"$in": list(claims)}}, session=session)
+            db.bloodBags.update_many(
+                {"bbid": {"$in": [bbid for claimed in claims.values() for bbid, _ in claimed.values()]},
+                 "available": True},
+                {"$set": {"available": False}}, session=session)
+        return outcomes
+    return run_in_transaction(db, retire)
@@ -0,0 +1,159 @@
+# live_updates.py
+import json
+import queue
+import threading
+from pymongo.errors import PyMongoError
+from donor_stats import STAGING_PREFIX
+from hospital_data import blood_data_expression
+
+HEARTBEAT_SECONDS = 15
+QUEUE_SIZE = 256  # Events buffered per subscriber before it is told to resync.
+
+#######################################
+# Change Stream Tailer
+#######################################
+
+class DonorStatsBroadcaster:
+    """
+    One change stream tailer per process that fans donorStats changes out to any
+    number of subscribers (e.g. /hospital/stream clients). Every changed record is
+    pushed as a "hospital" event in the /hospital/data/loc shape; anything that
+    cannot be expressed per hospital (a full rebuild swapping the collection in, a
+    subscriber falling too far behind) becomes a "resync" event, telling the client
+    to refetch the full data once.
+
+    Change streams need a replica set; on a standalone mongod the tailer stops and
+    running stays False.
+    """
+
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._queue_size = queue_size
+        self._thread = None
+        self.running = False
+
+    #######################################
+    # Subscribers
+    #######################################
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=self._queue_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event, data):
+        """
+        Queues (event, data) for every subscriber. A subscriber whose queue is full
+        has its backlog replaced by a single resync event, or by the shutdown sentinel
+        (None, None) itself, which is always delivered.
+        """
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event, data))
+            except queue.Full:
+                while True:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        break
+                subscriber.put_nowait(("resync", {}) if event is not None else (None, None))
+
+    #######################################
+    # Change Events
+    #######################################
+
+    @staticmethod
+    def pipeline():
+        """
+        Matches donorStats events (including the rename that swaps a rebuilt collection
+        in) and shapes each full document into the /hospital/data/loc record on the server.
+        """
+        return [
+            {"$match": {"$or": [{"ns.coll": "donorStats"},
+                                {"ns.coll": {"$regex": f"^{STAGING_PREFIX}"}, "operationType": "rename"}]}},
+            {"$addFields": {
+                "fullDocument.bloodData": blood_data_expression(root="fullDocument."),
+                "fullDocument.coordinates": {"$ifNull": ["$fullDocument.coordinates", {}]}
+            }}
+        ]
+
+    def apply_change(self, change):
+        """
+        Turns one change stream event into a subscriber event.
+        """
+        operation = change.get("operationType")
+        if operation in ("insert", "update", "replace"):
+            doc = change.get("fullDocument")
+            if doc:
+                self.publish("hospital", {
+                    "hospital": doc.get("hospital"),
+                    "city": doc.get("city"),
+                    "coordinates": doc.get("coordinates", {}),
+                    "bloodData": doc.get("bloodData", [])
+                })
+        elif operation in ("delete", "drop", "rename", "dropDatabase", "invalidate"):
+            self.publish("resync", {})
+
+    def start(self, db):
+        """
+        Starts the shared tailer thread (once per process). running is set before the
+        thread starts, so a request arriving right after start() does not see it unset.
+        The stream is reopened after an invalidate; a server error stops the tailer and
+        closes every subscriber.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self._thread
+
+            def run():
+                try:
+                    while True:
+                        with db.watch(self.pipeline(), full_document="updateLookup") as stream:
+                            for change in stream:
+                                self.apply_change(change)
+                        self.publish("resync", {})
+                except PyMongoError as e:
+                    print(f"donorStats change stream unavailable: {e}")
+                finally:
+                    self.running = False
+                    self.publish(None, None)
+
+            self.running = True
+            self._thread = threading.Thread(target=run, name="donor-stats-broadcast", daemon=True)
+            self._thread.start()
+            return self._thread
+
+    #######################################
+    # Server-Sent Events
+    #######################################
+
+    def events(self, subscriber, heartbeat_seconds=HEARTBEAT_SECONDS):
+        """
+        Yields one subscriber's events as Server-Sent Events text, with a comment line
+        as heartbeat when nothing happened for heartbeat_seconds. Unsubscribes when the
+        client disconnects or the tailer stops (also if it stopped before this subscriber
+        was added and so never received the sentinel).
+        """
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event, data = subscriber.get(timeout=heartbeat_seconds)
+                except queue.Empty:
+                    if not self.running:
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    return
+                yield f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
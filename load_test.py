@@ -0,0 +1,350 @@
+# load_test.py
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from longData import BASE_URL, TEST_PASSWORD, BLOOD_TYPES
+
+# Load generator for a running flaskApp.py (e.g. `python flaskApp.py` against a local
+# mongod loaded with longData.py). Unlike the loaders it reuses connections from one
+# shared session and keeps 'concurrency' requests in flight, so it measures the server.
+
+#######################################
+# Request Mix
+#######################################
+
+def _hospital(rng, hospitals):
+    return rng.choice(hospitals)
+
+def _match_params(rng, hospitals, role):
+    hosp = _hospital(rng, hospitals)
+    return {f"{role}_hospital": hosp["hospital"], f"{role}_city": hosp["city"], "blood_type": rng.choice(BLOOD_TYPES)}
+
+def _tile(rng, hospitals):
+    hosp = _hospital(rng, hospitals)
+    coordinates = hosp.get("coordinates") or {"lat": 0.0, "lon": 0.0}
+    zoom = rng.randint(3, 10)
+    n = 2 ** zoom
+    lat = math.radians(max(min(coordinates["lat"], 85.0), -85.0))
+    x = int((coordinates["lon"] + 180.0) / 360.0 * n)
+    y = int((1.0 - math.log(math.tan(lat) + 1.0 / math.cos(lat)) / math.pi) / 2.0 * n)
+    return f"/hospital/tiles/{zoom}/{min(max(x, 0), n - 1)}/{min(max(y, 0), n - 1)}"
+
+# Each entry: name -> build(rng, hospitals, state) returning (method, path, params, json_body).
+READS = {
+    "GET /hospital/data": lambda rng, hospitals, state: ("GET", "/hospital/data", None, None),
+    "GET /hospital/data/loc": lambda rng, hospitals, state: ("GET", "/hospital/data/loc", None, None),
+    "GET /hospital/data?bloodType": lambda rng, hospitals, state: (
+        "GET", "/hospital/data", {"bloodType": rng.choice(BLOOD_TYPES), "limit": 100}, None),
+    "GET /hospital/matching/surplus": lambda rng, hospitals, state: (
+        "GET", "/hospital/matching/surplus",
+        _match_params(rng, hospitals, "shortage"), None),
+    "GET /hospital/matching/shortage": lambda rng, hospitals, state: (
+        "GET", "/hospital/matching/shortage",
+        _match_params(rng, hospitals, "surplus"), None),
+    "GET /donor/matching/shortage": lambda rng, hospitals, state: (
+        "GET", "/donor/matching/shortage",
+        _match_params(rng, hospitals, "shortage"), None),
+    "GET /donor/matching/surplus": lambda rng, hospitals, state: (
+        "GET", "/donor/matching/surplus",
+        _match_params(rng, hospitals, "surplus"), None),
+    "GET /hospital/rebalance/plan": lambda rng, hospitals, state: (
+        "GET", "/hospital/rebalance/plan", {"blood_type": rng.choice(BLOOD_TYPES)}, None),
+    "GET /hospital/tiles": lambda rng, hospitals, state: ("GET", _tile(rng, hospitals), None, None)
+}
+
+# Authenticated writes only target hospitals that logged in (state["tokens"]).
+def _logged_in(rng, state):
+    return rng.choice(state["logged_in"])
+
+def _inventory_update(rng, hospitals, state):
+    hosp = _logged_in(rng, state)
+    return ("POST", "/hospital/inventory/update", None, {
+        "hospital": hosp["hospital"], "city": hosp["city"], "bloodType": rng.choice(BLOOD_TYPES),
+        "delta_count": rng.choice([-1, 1, 2]), "token": state["tokens"][(hosp["hospital"], hosp["city"])]})
+
+def _inventory_batch(rng, hospitals, state):
+    hosp = _logged_in(rng, state)
+    return ("POST", "/hospital/inventory/batch", None, {
+        "operations": [{"hospital": hosp["hospital"], "city": hosp["city"], "bloodType": bt,
+                        "delta_count": rng.choice([-1, 1, 2])} for bt in BLOOD_TYPES],
+        "token": state["tokens"][(hosp["hospital"], hosp["city"])]})
+
+def _flag_update(rng, hospitals, state):
+    hosp = _logged_in(rng, state)
+    return ("POST", "/hospital/flag/update", None, {
+        "hospital": hosp["hospital"], "city": hosp["city"], "bloodType": rng.choice(BLOOD_TYPES),
+        "surplus": rng.choice([True, False]), "shortage": rng.choice([True, False]),
+        "token": state["tokens"][(hosp["hospital"], hosp["city"])]})
+
+def _new_hospital(rng, hospitals):
+    # A fresh hospital next to an existing one; the name is unique per run and request.
+    hosp = _hospital(rng, hospitals)
+    coordinates = hosp.get("coordinates") or {"lat": 0.0, "lon": 0.0}
+    return {"name": f"Load Test Hospital {rng.randint(0, 10 ** 12):012d}", "city": hosp["city"],
+            "coordinates": {"lat": coordinates["lat"], "lon": coordinates["lon"]},
+            "password": TEST_PASSWORD}
+
+def _hospital_create(rng, hospitals, state):
+    return ("POST", "/hospital/create", None, _new_hospital(rng, hospitals))
+
+def _hospital_create_bulk(rng, hospitals, state):
+    return ("POST", "/hospital/create/bulk", None, {"hospitals": [_new_hospital(rng, hospitals) for _ in range(5)]})
+
+def _donor_add(rng, hospitals, state):
+    hosp = _hospital(rng, hospitals)
+    donor_id = f"LT{rng.randint(0, 10 ** 9):09d}"
+    with state["lock"]:
+        state["donors"].append(donor_id)
+    blood_type = rng.choice(BLOOD_TYPES)
+    return ("POST", "/donor/add", None, {
+        "donor_id": donor_id, "pid": donor_id, "first_name": "Load", "last_name": "Test",
+        "age": rng.randint(18, 65), "blood_type": blood_type,
+        "hospital": hosp["hospital"], "city": hosp["city"], "role": "donor",
+        "donorDetails": {"bloodType": blood_type},
+        "location": {"city": hosp["city"], "state": "Unknown",
+                     "coordinates": hosp.get("coordinates") or {"lat": 0, "lon": 0}}})
+
+def _donor_remove(rng, hospitals, state):
+    with state["lock"]:
+        donor_id = state["donors"].pop(rng.randrange(len(state["donors"]))) if state["donors"] else None
+    if donor_id is None:
+        return _donor_add(rng, hospitals, state)
+    return ("POST", "/donor/remove", None, {"donor_id": donor_id})
+
+WRITES = {
+    "POST /hospital/inventory/update": _inventory_update,
+    "POST /hospital/inventory/batch": _inventory_batch,
+    "POST /hospital/flag/update": _flag_update,
+    "POST /donor/add": _donor_add,
+    "POST /donor/remove": _donor_remove,
+    "POST /hospital/create": _hospital_create,
+    "POST /hospital/create/bulk": _hospital_create_bulk
+}
+
+# Writes whose body says whether they worked: an "error" field, or per-item results.
+CHECKED_BODIES = {"POST /hospital/inventory/update", "POST /hospital/flag/update", "POST /hospital/create",
+                  "POST /hospital/inventory/batch", "POST /hospital/create/bulk"}
+
+def response_ok(name, response):
+    """
+    A request counts as successful when it answered below 400 and, for the writes in
+    CHECKED_BODIES, the body carries no error: no "error" field, and for the batch
+    endpoints no operation that failed authentication or (bulk create) was rejected.
+    Inventory removals that find too few bags (409) are expected under load and still count.
+    """
+    if name == "POST /hospital/inventory/update" and response.status_code == 409:
+        return True
+    if response.status_code >= 400:
+        return False
+    if name not in CHECKED_BODIES:
+        return True
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+    if not isinstance(body, dict) or "error" in body:
+        return False
+    results = body.get("results", [])
+    if name == "POST /hospital/create/bulk":
+        return all(result.get("status") == "ok" for result in results)
+    return not any(result.get("error") == "Authentication failed." for result in results)
+
+#######################################
+# Load Generator
+#######################################
+
+class LoadGenerator:
+    """
+    Keeps 'concurrency' worker threads busy against base_url with one shared
+    requests.Session (its connection pool sized to the worker count). Each request
+    picks a write with probability write_ratio, otherwise a read, uniformly among the
+    endpoints of that kind. With a target rate the workers share one send schedule
+    (request i goes out at start + i / rate) and latency is measured from that
+    scheduled time, so a server that falls behind is charged for the queueing it
+    causes; without one they send back to back.
+
+    Inventory and flag writes use session tokens from /hospital/login: up to
+    login_limit hospitals log in with password (or with the entries of credentials,
+    a list of {"hospital", "city", "password"}) before the run.
+    """
+
+    def __init__(self, base_url, concurrency=16, rate=None, write_ratio=0.1, password=TEST_PASSWORD, seed=None,
+                 credentials=None, login_limit=20):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.rate = rate
+        self.write_ratio = write_ratio
+        self.seed = seed
+        self.password = password
+        self.credentials = credentials
+        self.login_limit = login_limit
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.state = {"lock": threading.Lock(), "donors": [], "tokens": {}, "logged_in": []}
+        self._lock = threading.Lock()
+        self._sent = 0
+        self._samples = []  # (endpoint, latency_s, ok)
+
+    def load_hospitals(self):
+        response = self.session.get(f"{self.base_url}/hospital/data/loc", timeout=60)
+        response.raise_for_status()
+        hospitals = [hosp for hosp in response.json() if hosp.get("hospital") and hosp.get("city")]
+        if not hospitals:
+            raise SystemExit("No hospitals found; load data first (e.g. python longData.py).")
+        return hospitals
+
+    def login(self, hospitals):
+        """
+        Logs hospitals in through /hospital/login and keeps their session tokens.
+        Raises SystemExit when writes are requested but no hospital could log in.
+        """
+        if self.credentials:
+            attempts = [(entry["hospital"], entry["city"], entry["password"]) for entry in self.credentials]
+        else:
+            sample = random.Random(self.seed).sample(hospitals, min(self.login_limit, len(hospitals)))
+            attempts = [(hosp["hospital"], hosp["city"], self.password) for hosp in sample]
+        by_key = {(hosp["hospital"], hosp["city"]): hosp for hosp in hospitals}
+        for hospital, city, password in attempts:
+            response = self.session.post(f"{self.base_url}/hospital/login", timeout=60,
+                                         json={"hospital": hospital, "city": city, "password": password})
+            if response.status_code == 200:
+                self.state["tokens"][(hospital, city)] = response.json()["token"]
+                self.state["logged_in"].append(by_key.get((hospital, city), {"hospital": hospital, "city": city}))
+        if self.write_ratio > 0 and not self.state["logged_in"]:
+            raise SystemExit(f"None of {len(attempts)} hospital(s) could log in; pass --credentials or --password, "
+                             "or run with --write-ratio 0.")
+        print(f"{len(self.state['logged_in'])} of {len(attempts)} hospital(s) logged in for writes.")
+
+    def _next_slot(self, start, deadline, max_requests):
+        """
+        Claims the next request number; returns its scheduled send time or None when done.
+        """
+        with self._lock:
+            if (max_requests is not None and self._sent >= max_requests) or time.perf_counter() >= deadline:
+                return None
+            number = self._sent
+            self._sent += 1
+        return start + number / self.rate if self.rate else start
+
+    def _worker(self, worker_id, hospitals, start, deadline, max_requests):
+        rng = random.Random(None if self.seed is None else self.seed + worker_id)
+        samples = []
+        while True:
+            send_at = self._next_slot(start, deadline, max_requests)
+            if send_at is None:
+                break
+            delay = send_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            endpoints = WRITES if rng.random() < self.write_ratio else READS
+            name = rng.choice(list(endpoints))
+            method, path, params, body = endpoints[name](rng, hospitals, self.state)
+            # With a schedule, time from when the request should have gone out (no coordinated omission).
+            began = send_at if self.rate else time.perf_counter()
+            try:
+                response = self.session.request(method, self.base_url + path, params=params, json=body, timeout=60)
+                ok = response_ok(name, response)
+            except requests.RequestException:
+                ok = False
+            samples.append((name, time.perf_counter() - began, ok))
+        with self._lock:
+            self._samples.extend(samples)
+
+    def run(self, duration=30.0, max_requests=None):
+        """
+        Runs until duration seconds have passed or max_requests were sent and returns
+        the report (see summarize).
+        """
+        hospitals = self.load_hospitals()
+        if self.write_ratio > 0:
+            self.login(hospitals)
+        self._sent = 0
+        self._samples = []
+        start = time.perf_counter()
+        deadline = start + duration
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="load") as pool:
+            workers = [pool.submit(self._worker, worker_id, hospitals, start, deadline, max_requests)
+                       for worker_id in range(self.concurrency)]
+        for worker in workers:
+            worker.result()  # Re-raises anything that killed a worker.
+        return summarize(self._samples, time.perf_counter() - start)
+
+def summarize(samples, elapsed):
+    """
+    Per-endpoint latency percentiles (ms) and throughput (requests/s):
+      {"elapsed_s": ..., "total": {...}, "endpoints": {name: {"requests": ..., "errors": ...,
+       "throughput_rps": ..., "p50_ms": ..., "p95_ms": ..., "p99_ms": ..., "max_ms": ...}}}
+    """
+    def stats(latencies, errors):
+        ms = np.array(latencies) * 1000.0
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if len(ms) else (0.0, 0.0, 0.0)
+        return {
+            "requests": len(ms),
+            "errors": errors,
+            "throughput_rps": round(len(ms) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(float(p50), 2),
+            "p95_ms": round(float(p95), 2),
+            "p99_ms": round(float(p99), 2),
+            "max_ms": round(float(ms.max()), 2) if len(ms) else 0.0
+        }
+
+    by_endpoint = {}
+    for name, latency, ok in samples:
+        entry = by_endpoint.setdefault(name, ([], [0]))
+        entry[0].append(latency)
+        entry[1][0] += 0 if ok else 1
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "total": stats([latency for _, latency, _ in samples], sum(1 for _, _, ok in samples if not ok)),
+        "endpoints": {name: stats(latencies, errors[0]) for name, (latencies, errors) in sorted(by_endpoint.items())}
+    }
+
+def print_report(report):
+    header = f"{'endpoint':40} {'reqs':>7} {'errs':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["endpoints"].items()) + [("TOTAL", report["total"])]
+    for name, s in rows:
+        print(f"{name:40} {s['requests']:>7} {s['errors']:>5} {s['throughput_rps']:>8.1f} "
+              f"{s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f}")
+    print(f"\n{report['total']['requests']} requests in {report['elapsed_s']:.1f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load generator for flaskApp.py.")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight (worker threads).")
+    parser.add_argument("--rate", type=float, default=None, help="Target requests/s across all workers (default: as fast as possible).")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run.")
+    parser.add_argument("--requests", type=int, default=None, help="Stop after this many requests.")
+    parser.add_argument("--write-ratio", type=float, default=0.1, help="Fraction of requests that are writes.")
+    parser.add_argument("--password", default=TEST_PASSWORD, help="Password hospitals log in with before writing.")
+    parser.add_argument("--credentials", help="JSON file with [{\"hospital\", \"city\", \"password\"}, ...] to log in with instead.")
+    parser.add_argument("--login-limit", type=int, default=20, help="Hospitals to log in with --password (default 20).")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", help="Also write the report to this file.")
+    args = parser.parse_args()
+
+    credentials = None
+    if args.credentials:
+        with open(args.credentials) as f:
+            credentials = json.load(f)
+    generator = LoadGenerator(args.base_url, concurrency=args.concurrency, rate=args.rate,
+                              write_ratio=args.write_ratio, password=args.password, seed=args.seed,
+                              credentials=credentials, login_limit=args.login_limit)
+    report = generator.run(duration=args.duration, max_requests=args.requests)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
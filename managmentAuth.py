@@ -1,9 +1,26 @@
 # hospital_managment.py
-from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from database import get_db
 from datetime import datetime
 import math
+import os
 import random
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from donor_stats import (
+    update_secondary_data,
+    ensure_stats_record,
+    ensure_stats_records,
+    apply_donor_delta,
+    apply_inventory_delta,
+    apply_inventory_deltas,
+    apply_flag_update,
+    COMPLETE_BLOOD_TYPES,
+)
+from sequences import reserve_sequence
+from inventory import add_bags, retire_bags
+from geo import geo_point
+from session_tokens import hash_password, issue_token, verify_password, verify_token
 
 #######################################
 # Auth0 Configuration and Helper Functions (Integrated)
@@ -87,147 +104,64 @@ def register_auth0_user(username, password):
         else:
             print("Failed to register user:", response.json())
 
-#######################################
-# Aggregation & Update Functions (Internal)
-#######################################
+# Signups queued by add_hospitals run here, so bulk onboarding never waits on Auth0.
+AUTH0_WORKERS = int(os.environ.get("AUTH0_WORKERS", 4))
+_auth0_pool = ThreadPoolExecutor(max_workers=AUTH0_WORKERS, thread_name_prefix="auth0")
 
-def aggregate_donor_data_by_location(db):
-    pipeline = [
-        {"$match": {"role": "donor"}},
-        {"$group": {
-            "_id": {"hospital": "$hospital", "city": "$city", "bloodType": "$donorDetails.bloodType"},
-            "donorCount": {"$sum": 1}
-        }},
-        {"$group": {
-            "_id": {"hospital": "$_id.hospital", "city": "$_id.city"},
-            "bloodTypeStats": {"$push": {
-                "bloodType": "$_id.bloodType",
-                "donorCount": "$donorCount",
-                "surplus": False,
-                "shortage": False
-            }}
-        }},
-        {"$project": {
-            "_id": 0,
-            "hospital": "$_id.hospital",
-            "city": "$_id.city",
-            "bloodTypeStats": 1
-        }}
-    ]
-    return list(db.persons.aggregate(pipeline))
+def queue_auth0_registration(username, password):
+    """
+    Queues register_auth0_user on the background pool and returns its future.
+    Failures are printed instead of raised, like the synchronous call.
+    """
+    def run():
+        try:
+            register_auth0_user(username, password)
+            return True
+        except requests.RequestException as e:
+            print(f"Failed to register Auth0 user {username}: {e}")
+            return False
+    return _auth0_pool.submit(run)
 
-def aggregate_inventory_by_location(db):
-    pipeline = [
-        {"$lookup": {"from": "bloodBags", "localField": "bbid", "foreignField": "bbid", "as": "bag"}},
-        {"$unwind": "$bag"},
-        {"$lookup": {"from": "locations", "localField": "lid", "foreignField": "lid", "as": "loc"}},
-        {"$unwind": "$loc"},
-        {"$match": {"available": True}},
-        {"$group": {
-            "_id": {"hospital": "$loc.name", "city": "$loc.city", "bloodType": "$bag.bloodType"},
-            "totalBloodCC": {"$sum": "$bag.quantityCC"}
-        }},
-        {"$group": {
-            "_id": {"hospital": "$_id.hospital", "city": "$_id.city"},
-            "inventoryStats": {"$push": {
-                "bloodType": "$_id.bloodType",
-                "totalBloodCC": "$totalBloodCC"
-            }}
-        }},
-        {"$project": {"_id": 0, "hospital": "$_id.hospital", "city": "$_id.city", "inventoryStats": 1}}
-    ]
-    return list(db.globalInventory.aggregate(pipeline))
+# Error messages of the authenticated writes (also used per operation by update_inventory_batch).
+HOSPITAL_NOT_FOUND = "Hospital not found."
+AUTHENTICATION_FAILED = "Authentication failed."
 
-def merge_secondary_data(donor_stats, inventory_stats):
+def check_password(hosp_doc, password):
     """
-    Merges the donor_stats and inventory_stats based on hospital and city.
-    This version safely checks for the keys "hospital" and "city" in each document.
+    The one credential store behind password auth and login_hospital, in both this
+    module and hospital_managment: hospitals stored with a bcrypt passwordHash
+    (hospital_managment.add_hospital, sampleData.py) are checked against it on the
+    bounded bcrypt pool, every other hospital against Auth0.
     """
-    inv_lookup = {}
-    for doc in inventory_stats:
-        hospital = doc.get("hospital")
-        city = doc.get("city")
-        if hospital is not None and city is not None:
-            inv_lookup[(hospital, city)] = doc.get("inventoryStats", [])
-    
-    merged = []
-    for stat in donor_stats:
-        hospital = stat.get("hospital")
-        city = stat.get("city")
-        key = (hospital, city)
-        # If keys don't exist, default to an empty list.
-        stat["inventoryStats"] = inv_lookup.get(key, [])
-        merged.append(stat)
-    return merged
-
-def create_secondary_collection(db, merged_data):
-    db.donorStats.drop()
-    db.donorStats.insert_many(merged_data)
-
-def update_secondary_data(db):
-    donor_stats = aggregate_donor_data_by_location(db)
-    inventory_stats = aggregate_inventory_by_location(db)
-    merged_data = merge_secondary_data(donor_stats, inventory_stats)
-    
-    complete_blood_types = ["O+", "A+", "B+", "AB+", "O-", "A-", "B-", "AB-"]
-    hospitals = list(db.locations.find())
-    
-    # Build lookup only for records that have both 'hospital' and 'city'
-    merged_dict = {
-        (rec.get("hospital"), rec.get("city")): rec
-        for rec in merged_data
-        if rec.get("hospital") is not None and rec.get("city") is not None
-    }
-    
-    # Preserve existing flags if any
-    existing_flags = {}
-    for rec in db.donorStats.find():
-        key = (rec.get("hospital"), rec.get("city"))
-        if not key[0] or not key[1]:
-            continue
-        flags = {}
-        for bt in rec.get("bloodTypeStats", []):
-            flags[bt.get("bloodType")] = (bt.get("surplus", False), bt.get("shortage", False))
-        existing_flags[key] = flags
-    
-    for hosp in hospitals:
-        key = (hosp.get("name"), hosp.get("city"))
-        if key not in merged_dict:
-            merged_dict[key] = {"hospital": hosp.get("name"), "city": hosp.get("city"),
-                                "bloodTypeStats": [], "inventoryStats": []}
-        record = merged_dict[key]
-        new_bt_stats = []
-        # Use flagSettings from hospital document if available
-        flag_settings = hosp.get("flagSettings", {})  # e.g. {"A+": {"surplus": True, "shortage": False}, ...}
-        for bt in complete_blood_types:
-            computed = next((item for item in record.get("bloodTypeStats", []) if item.get("bloodType") == bt), None)
-            donorCount = computed.get("donorCount") if computed else 0
-            if bt in flag_settings:
-                flags = (flag_settings[bt].get("surplus", False), flag_settings[bt].get("shortage", False))
-            else:
-                flags = existing_flags.get(key, {}).get(bt, (False, False))
-            new_bt_stats.append({
-                "bloodType": bt,
-                "donorCount": donorCount,
-                "surplus": flags[0],
-                "shortage": flags[1]
-            })
-        record["bloodTypeStats"] = new_bt_stats
-        
-        new_inv_stats = []
-        for bt in complete_blood_types:
-            computed_inv = next((item for item in record.get("inventoryStats", []) if item.get("bloodType") == bt), None)
-            totalBloodCC = computed_inv.get("totalBloodCC") if computed_inv else 0
-            new_inv_stats.append({
-                "bloodType": bt,
-                "totalBloodCC": totalBloodCC
-            })
-        record["inventoryStats"] = new_inv_stats
-
-    completed_merged_data = list(merged_dict.values())
-    create_secondary_collection(db, completed_merged_data)
-    print("Secondary collection 'donorStats' updated with complete data.")
+    if password is None:
+        return False
+    if "passwordHash" in hosp_doc:
+        return verify_password(password, hosp_doc["passwordHash"])
+    return bool(verify_auth0_user(hosp_doc.get("name"), password))
 
+def authenticate_hospital(hosp_doc, password=None, token=None):
+    """
+    Accepts either a session token from login_hospital (one HMAC check) or the
+    hospital's password (check_password). hosp_doc is the hospital's locations record.
+    """
+    if token is not None:
+        return verify_token(token, hosp_doc.get("name"), hosp_doc.get("city"))
+    return check_password(hosp_doc, password)
+
+def login_hospital(db, hospital, city, password):
+    """
+    Checks the hospital's password once (check_password) and returns a session token
+    for later writes, or None if the hospital is unknown or the password is wrong.
+    """
+    hosp_doc = db.locations.find_one({"name": hospital, "city": city},
+                                     {"name": 1, "city": 1, "passwordHash": 1})
+    if not hosp_doc:
+        print("Hospital not found!")
+        return None
+    if not check_password(hosp_doc, password):
+        print("Authentication failed: Incorrect password.")
+        return None
+    return issue_token(hospital, city)
 
 #######################################
 # Donor and Inventory Management Functions (with Auth0 integration)
@@ -239,75 +173,62 @@ def add_donor(db, donor_data):
     print(f"Donor with pid {donor_data['pid']} added. Inserted ID: {result.inserted_id}")
 
 def remove_donor(db, pid):
-    result = db.persons.delete_one({"pid": pid, "role": "donor"})
-    if result.deleted_count > 0:
+    removed = db.persons.find_one_and_delete({"pid": pid, "role": "donor"})
+    if removed:
         print(f"Donor with pid {pid} removed.")
     else:
         print(f"No donor with pid {pid} found.")
+    return removed
 
 def add_donor_and_update(db, donor_data):
     add_donor(db, donor_data)
-    update_secondary_data(db)
+    apply_donor_delta(db, donor_data.get("hospital"), donor_data.get("city"),
+                      donor_data.get("donorDetails", {}).get("bloodType"), 1)
 
 def remove_donor_and_update(db, pid):
-    remove_donor(db, pid)
-    update_secondary_data(db)
+    removed = remove_donor(db, pid)
+    if removed:
+        apply_donor_delta(db, removed.get("hospital"), removed.get("city"),
+                          removed.get("donorDetails", {}).get("bloodType"), -1)
 
-def update_hospital_inventory(db, hospital, city, bloodType, delta_count, password):
+def update_hospital_inventory(db, hospital, city, bloodType, delta_count, password=None, token=None):
+    """
+    Adds (delta_count > 0) or retires (delta_count < 0) bags of one blood type.
+    Returns None on success, otherwise the error message (HOSPITAL_NOT_FOUND,
+    AUTHENTICATION_FAILED or a "Not enough blood bags" message).
+    """
     hosp_doc = db.locations.find_one({"name": hospital, "city": city})
     if not hosp_doc:
         print("Hospital not found!")
-        return
-    auth_response = verify_auth0_user(hospital, password)
-    if not auth_response:
+        return HOSPITAL_NOT_FOUND
+    if not authenticate_hospital(hosp_doc, password, token):
         print("Authentication failed: Incorrect password.")
-        return
+        return AUTHENTICATION_FAILED
 
     lid = hosp_doc["lid"]
+    delta_cc = 0
+    error = None
     if delta_count > 0:
-        for i in range(delta_count):
-            new_bbid = "NEW" + str(db.bloodBags.count_documents({}) + 1)
-            new_blood_bag = {
-                "bbid": new_bbid,
-                "donationType": "Whole Blood",
-                "quantityCC": 450,
-                "bloodType": bloodType,
-                "available": True
-            }
-            db.bloodBags.insert_one(new_blood_bag)
-            new_inventory = {
-                "bbid": new_bbid,
-                "lid": lid,
-                "available": True
-            }
-            db.globalInventory.insert_one(new_inventory)
+        delta_cc = add_bags(db, [(lid, bloodType, delta_count)])[0]
         print(f"Added {delta_count} blood bag(s) of type {bloodType} to {hospital} in {city}.")
     elif delta_count < 0:
-        count_to_remove = -delta_count
-        pipeline = [
-            {"$lookup": {"from": "bloodBags", "localField": "bbid", "foreignField": "bbid", "as": "bag"}},
-            {"$unwind": "$bag"},
-            {"$match": {"lid": lid, "available": True, "bag.bloodType": bloodType}}
-        ]
-        available_bags = list(db.globalInventory.aggregate(pipeline))
-        if len(available_bags) < count_to_remove:
-            print(f"Not enough blood bags to remove. Available: {len(available_bags)}")
+        removed_cc, available = retire_bags(db, [(lid, bloodType, -delta_count)])[0]
+        if removed_cc is None:
+            error = f"Not enough blood bags to remove. Available: {available}"
+            print(error)
         else:
-            for bag_record in available_bags[:count_to_remove]:
-                db.globalInventory.delete_one({"_id": bag_record["_id"]})
-                db.bloodBags.update_one({"bbid": bag_record["bag"]["bbid"]}, {"$set": {"available": False}})
-            print(f"Removed {count_to_remove} blood bag(s) of type {bloodType} from {hospital} in {city}.")
+            delta_cc = -removed_cc
+            print(f"Removed {-delta_count} blood bag(s) of type {bloodType} from {hospital} in {city}.")
     else:
         print("No change requested (delta_count is 0).")
     
-    update_secondary_data(db)
+    if delta_cc:
+        apply_inventory_delta(db, hospital, city, bloodType, delta_cc)
     
     pipeline_inventory = [
+        {"$match": {"lid": lid, "available": True}},
         {"$lookup": {"from": "bloodBags", "localField": "bbid", "foreignField": "bbid", "as": "bag"}},
         {"$unwind": "$bag"},
-        {"$lookup": {"from": "locations", "localField": "lid", "foreignField": "lid", "as": "loc"}},
-        {"$unwind": "$loc"},
-        {"$match": {"loc.name": hospital, "loc.city": city, "available": True}},
         {"$group": {"_id": "$bag.bloodType", "totalBloodCC": {"$sum": "$bag.quantityCC"}}},
         {"$project": {"_id": 0, "bloodType": "$_id", "totalBloodCC": 1}}
     ]
@@ -315,55 +236,254 @@ def update_hospital_inventory(db, hospital, city, bloodType, delta_count, passwo
     print("Current Inventory by Blood Type:")
     for inv in current_inventory:
         print(inv)
+    return error
 
-def update_inventory_flag(db, hospital, city, blood_type, surplus=None, shortage=None, password=None):
+def update_inventory_batch(db, operations, token=None):
+    """
+    Applies many inventory changes in one request. operations is a list of
+      {"hospital": ..., "city": ..., "bloodType": ..., "delta_count": ..., "password" or "token": ...}
+    where token, when given, covers operations that carry no credentials of their own.
+    Each hospital is authenticated once, new bags are written with one insert_many per
+    collection, all removals are retired in one transaction (inventory.retire_bags, which
+    only counts bags that were still available when it wrote) and donorStats is
+    refreshed with a single bulk write at the end. Returns one result per operation, in order:
+      {"index": ..., "hospital": ..., "city": ..., "bloodType": ..., "delta_count": ...,
+       "status": "ok" | "error", "applied": <bags added/removed> | "error": <message>}
+    """
+    results = []
+    valid = []  # (result, lid, delta_count) for every operation that passed the checks
+    keys = {(op.get("hospital"), op.get("city")) for op in operations}
+    hosp_docs = {}
+    if keys:
+        query = {"$or": [{"name": hospital, "city": city} for hospital, city in keys]}
+        for loc in db.locations.find(query, {"name": 1, "city": 1, "lid": 1, "passwordHash": 1}):
+            hosp_docs[(loc.get("name"), loc.get("city"))] = loc
+
+    authenticated = {}
+    for index, op in enumerate(operations):
+        hospital, city, blood_type = op.get("hospital"), op.get("city"), op.get("bloodType")
+        result = {"index": index, "hospital": hospital, "city": city, "bloodType": blood_type,
+                  "delta_count": op.get("delta_count")}
+        results.append(result)
+        try:
+            delta_count = int(op.get("delta_count"))
+        except (TypeError, ValueError):
+            result.update(status="error", error="delta_count must be an integer.")
+            continue
+        if blood_type not in COMPLETE_BLOOD_TYPES:
+            result.update(status="error", error="Unknown blood type.")
+            continue
+        if (hospital, city) not in hosp_docs:
+            result.update(status="error", error=HOSPITAL_NOT_FOUND)
+            continue
+        password = op.get("password")
+        op_token = op.get("token") or (None if password else token)
+        auth_key = (hospital, city, password, op_token)
+        if auth_key not in authenticated:
+            authenticated[auth_key] = authenticate_hospital(hosp_docs[(hospital, city)], password, op_token)
+        if not authenticated[auth_key]:
+            result.update(status="error", error=AUTHENTICATION_FAILED)
+            continue
+        if delta_count == 0:
+            result.update(status="ok", applied=0)
+            continue
+        valid.append((result, hosp_docs[(hospital, city)]["lid"], delta_count))
+
+    deltas = {}  # (hospital, city, bloodType) -> delta_cc
+
+    # Additions: one bbid reservation and one insert_many per collection for the whole batch.
+    additions = [(result, lid, delta_count) for result, lid, delta_count in valid if delta_count > 0]
+    added = add_bags(db, [(lid, result["bloodType"], delta_count) for result, lid, delta_count in additions])
+    for (result, _, delta_count), delta_cc in zip(additions, added):
+        key = (result["hospital"], result["city"], result["bloodType"])
+        deltas[key] = deltas.get(key, 0) + delta_cc
+        result.update(status="ok", applied=delta_count)
+
+    # Removals: every retired bag in a single transaction, operations in order.
+    removals = [(result, lid, -delta_count) for result, lid, delta_count in valid if delta_count < 0]
+    if removals:
+        retired = retire_bags(db, [(lid, result["bloodType"], count) for result, lid, count in removals])
+        for (result, _, count), (removed_cc, available) in zip(removals, retired):
+            if removed_cc is None:
+                result.update(status="error", error=f"Not enough blood bags to remove. Available: {available}")
+                continue
+            key = (result["hospital"], result["city"], result["bloodType"])
+            deltas[key] = deltas.get(key, 0) - removed_cc
+            result.update(status="ok", applied=-count)
+
+    apply_inventory_deltas(db, deltas)
+    failed = sum(1 for result in results if result["status"] == "error")
+    print(f"Inventory batch: {len(results) - failed} operation(s) applied, {failed} failed.")
+    return results
+
+def update_inventory_flag(db, hospital, city, blood_type, surplus=None, shortage=None, password=None, token=None):
+    """
+    Sets the surplus/shortage flags of one blood type. Returns None on success,
+    otherwise HOSPITAL_NOT_FOUND or AUTHENTICATION_FAILED.
+    """
     hosp_doc = db.locations.find_one({"name": hospital, "city": city})
     if not hosp_doc:
         print("Hospital not found!")
-        return
-    if password is None or not verify_auth0_user(hospital, password):
+        return HOSPITAL_NOT_FOUND
+    if not authenticate_hospital(hosp_doc, password, token):
         print("Authentication failed: Incorrect password.")
-        return
+        return AUTHENTICATION_FAILED
 
-    update_doc = {}
+    # Record the flags on the hospital document too, so a full reconcile keeps them.
+    settings_doc = {}
     if surplus is not None:
-        update_doc["bloodTypeStats.$[elem].surplus"] = surplus
+        settings_doc[f"flagSettings.{blood_type}.surplus"] = surplus
     if shortage is not None:
-        update_doc["bloodTypeStats.$[elem].shortage"] = shortage
-    if update_doc:
-        result = db.donorStats.update_one(
-            {"hospital": hospital, "city": city},
-            {"$set": update_doc},
-            array_filters=[{"elem.bloodType": blood_type}]
-        )
-        if result.modified_count > 0:
-            print(f"Updated flags for {hospital}, {city}, blood type {blood_type}.")
-        else:
-            print(f"No matching record found to update flags for {hospital}, {city}, blood type {blood_type}.")
+        settings_doc[f"flagSettings.{blood_type}.shortage"] = shortage
+    if settings_doc:
+        db.locations.update_one({"_id": hosp_doc["_id"]}, {"$set": settings_doc})
+        apply_flag_update(db, hospital, city, blood_type, surplus=surplus, shortage=shortage)
+        print(f"Updated flags for {hospital}, {city}, blood type {blood_type}.")
+
+def assign_lids(db, hospitals):
+    """
+    Gives every hospital without a lid one from the "lid" sequence, with a single
+    reservation. Explicit "L<number>" lids move the counter past them first, so the
+    sequence never hands out a lid a caller already chose.
+    """
+    explicit = [int(hosp["lid"][1:]) for hosp in hospitals
+                if hosp.get("lid", "")[:1] == "L" and hosp["lid"][1:].isdigit()]
+    floor = max([db.locations.estimated_document_count()] + explicit)
+    numbers = iter(reserve_sequence(db, "lid", sum(1 for hosp in hospitals if "lid" not in hosp), floor=floor))
+    for hosp in hospitals:
+        if "lid" not in hosp:
+            hosp["lid"] = "L{:04d}".format(next(numbers))
 
 def add_hospital(db, hospital_data):
-    if "lid" not in hospital_data:
-        count = db.locations.count_documents({})
-        hospital_data["lid"] = "L{:04d}".format(count + 1)
+    assign_lids(db, [hospital_data])
     if "locationCode" not in hospital_data:
         hospital_data["locationCode"] = "HOSP"
+    if "coordinates" in hospital_data and "location" not in hospital_data:
+        hospital_data["location"] = geo_point(hospital_data["coordinates"])
     if "password" not in hospital_data:
         print("No password provided; hospital not added.")
         return None
+    _store_test_password(hospital_data)
+    try:
+        db.locations.insert_one(hospital_data)
+    except DuplicateKeyError:
+        print(f"Hospital '{hospital_data['name']}' in {hospital_data['city']} or lid {hospital_data['lid']} already exists.")
+        return None
     # Register with Auth0 using hospital name as username.
     register_auth0_user(hospital_data["name"], hospital_data["password"])
-    # For testing, we insert the hospital document.
-    db.locations.insert_one(hospital_data)
+    ensure_stats_record(db, hospital_data["name"], hospital_data["city"], hospital_data.get("flagSettings"),
+                        hospital_data.get("coordinates"))
     print(f"Hospital '{hospital_data['name']}' added with lid {hospital_data['lid']}.")
     return hospital_data
 
+def _store_test_password(hospital_data):
+    # TEST_MODE registers nobody with Auth0, so keep a bcrypt hash of the password on the
+    # hospital instead; check_password accepts it, and the hospital can log in and write.
+    if TEST_MODE:
+        hospital_data["passwordHash"] = hash_password(hospital_data["password"])
+
+def _hospital_error(hospital_data):
+    """
+    Validates one add_hospitals entry; returns an error message or None.
+    """
+    name, city = hospital_data.get("name"), hospital_data.get("city")
+    if not isinstance(name, str) or not isinstance(city, str) or not name or not city:
+        return "name and city must be non-empty strings."
+    if not isinstance(hospital_data.get("password"), str):
+        return "No password provided; hospital not added."
+    if "lid" in hospital_data and not isinstance(hospital_data["lid"], str):
+        return "lid must be a string."
+    if "coordinates" in hospital_data:
+        coordinates = hospital_data["coordinates"]
+        if not isinstance(coordinates, dict):
+            return "coordinates must be an object with lat and lon."
+        lat, lon = coordinates.get("lat"), coordinates.get("lon")
+        if (not isinstance(lat, (int, float)) or not isinstance(lon, (int, float))
+                or isinstance(lat, bool) or isinstance(lon, bool)
+                or not -90 <= lat <= 90 or not -180 <= lon <= 180):
+            return "coordinates need numeric lat (-90..90) and lon (-180..180)."
+    return None
+
+def add_hospitals(db, hospitals_data):
+    """
+    Onboards many hospitals at once. Each entry looks like the add_hospital payload
+    (name, city, password, optional lid, coordinates and flagSettings). Every entry is
+    validated before anything is written; lids come from one sequence reservation, all
+    locations are written with one insert_many, Auth0 signups are queued in the
+    background and the donorStats records are created with a single bulk write.
+    Returns (results, registrations):
+      results: one entry per hospital, in order:
+        {"index": ..., "name": ..., "city": ..., "status": "ok", "lid": ...} or
+        {"index": ..., "name": ..., "city": ..., "status": "error", "error": <message>}
+      registrations: the futures of the queued Auth0 signups (wait on them in scripts).
+    """
+    results = []
+    candidates = []
+    for index, hospital_data in enumerate(hospitals_data):
+        result = {"index": index, "name": hospital_data.get("name"), "city": hospital_data.get("city")}
+        results.append(result)
+        error = _hospital_error(hospital_data)
+        if error:
+            result.update(status="error", error=error)
+        else:
+            candidates.append((result, hospital_data))
+
+    keys = {(hosp["name"], hosp["city"]) for _, hosp in candidates}
+    lids = {hosp["lid"] for _, hosp in candidates if "lid" in hosp}
+    existing, used_lids = set(), set()
+    if keys:
+        query = {"$or": [{"name": name, "city": city} for name, city in keys]}
+        existing = {(loc.get("name"), loc.get("city"))
+                    for loc in db.locations.find(query, {"_id": 0, "name": 1, "city": 1})}
+    if lids:
+        used_lids = {loc.get("lid") for loc in db.locations.find({"lid": {"$in": list(lids)}}, {"_id": 0, "lid": 1})}
+    accepted = []
+    batch_lids = set()
+    for result, hospital_data in candidates:
+        key = (hospital_data["name"], hospital_data["city"])
+        if key in existing:
+            result.update(status="error", error="Hospital already exists.")
+        elif hospital_data.get("lid") in used_lids:
+            result.update(status="error", error="lid is already in use.")
+        elif hospital_data.get("lid") in batch_lids:
+            result.update(status="error", error="Duplicate lid in this request.")
+        else:
+            existing.add(key)
+            if "lid" in hospital_data:
+                batch_lids.add(hospital_data["lid"])
+            accepted.append((result, hospital_data))
+    if not accepted:
+        return results, []
+
+    assign_lids(db, [hospital_data for _, hospital_data in accepted])
+    for result, hospital_data in accepted:
+        hospital_data.setdefault("locationCode", "HOSP")
+        if "coordinates" in hospital_data and "location" not in hospital_data:
+            hospital_data["location"] = geo_point(hospital_data["coordinates"])
+        _store_test_password(hospital_data)
+        result.update(status="ok", lid=hospital_data["lid"])
+    failed = set()
+    try:
+        db.locations.insert_many([hospital_data for _, hospital_data in accepted], ordered=False)
+    except BulkWriteError as e:
+        # A concurrent onboarding took the same lid or (name, city): both indexes are unique
+        # (indexes.INDEXES), unless duplicates already in the data forced the fallback.
+        for error in e.details.get("writeErrors", []):
+            failed.add(error["index"])
+            accepted[error["index"]][0].update(status="error", error=error.get("errmsg", "Insert failed."))
+            accepted[error["index"]][0].pop("lid", None)
+    new_hospitals = [hospital_data for i, (_, hospital_data) in enumerate(accepted) if i not in failed]
+    registrations = [queue_auth0_registration(hosp["name"], hosp["password"]) for hosp in new_hospitals]
+    ensure_stats_records(db, new_hospitals)
+    print(f"Onboarded {len(new_hospitals)} hospital(s); {len(results) - len(new_hospitals)} rejected.")
+    return results, registrations
+
 def search_secondary(db, hospital, city):
     result = db.donorStats.find_one({"hospital": hospital, "city": city})
     return result
 
 def main():
-    client = MongoClient("mongodb://localhost:27017")
-    db = client["americanRedCrossDB"]
+    db = get_db()
 
     update_secondary_data(db)
     
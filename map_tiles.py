@@ -0,0 +1,152 @@
+# map_tiles.py
+import math
+import threading
+import numpy as np
+from donor_stats import COMPLETE_BLOOD_TYPES, get_data_version
+from hospital_data import iter_hospital_data
+
+MAX_ZOOM = 18
+CLUSTER_LEVELS = 2  # Each tile is split into a (2**CLUSTER_LEVELS)^2 grid of clusters.
+MAX_LATITUDE = 85.05112878  # Web Mercator cut-off.
+
+#######################################
+# Tile Math
+#######################################
+
+def tile_coordinates(lats, lons, zoom):
+    """
+    Web Mercator (slippy map) tile x/y of every lat/lon at the given zoom, as int arrays.
+    """
+    n = 2 ** zoom
+    lat_r = np.radians(np.clip(lats, -MAX_LATITUDE, MAX_LATITUDE))
+    x = np.floor((np.asarray(lons) + 180.0) / 360.0 * n)
+    y = np.floor((1.0 - np.log(np.tan(lat_r) + 1.0 / np.cos(lat_r)) / math.pi) / 2.0 * n)
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+#######################################
+# Snapshot and Clustering
+#######################################
+
+def load_snapshot(db):
+    """
+    Reads every donorStats record with coordinates (one aggregation) into arrays:
+      names, cities, lats, lons, cc[hospital, bloodType], shortage[hospital, bloodType]
+    """
+    names, cities, lats, lons, cc, shortage = [], [], [], [], [], []
+    for rec in iter_hospital_data(db, with_location=True):
+        coordinates = rec.get("coordinates") or {}
+        if "lat" not in coordinates or "lon" not in coordinates:
+            continue
+        names.append(rec.get("hospital"))
+        cities.append(rec.get("city"))
+        lats.append(coordinates["lat"])
+        lons.append(coordinates["lon"])
+        cc.append([bt.get("totalBloodCC", 0) for bt in rec.get("bloodData", [])])
+        shortage.append([bt.get("shortage", False) for bt in rec.get("bloodData", [])])
+    n_types = len(COMPLETE_BLOOD_TYPES)
+    return {
+        "names": names,
+        "cities": cities,
+        "lats": np.array(lats, dtype=float),
+        "lons": np.array(lons, dtype=float),
+        "cc": np.array(cc, dtype=np.int64).reshape(-1, n_types),
+        "shortage": np.array(shortage, dtype=bool).reshape(-1, n_types)
+    }
+
+def build_zoom_tiles(snapshot, zoom):
+    """
+    Clusters all hospitals for one zoom level in a single vectorized pass and returns
+    {(x, y): tile} for every non-empty tile. A tile looks like:
+      {
+        "hospitalCount": ..., "shortageCount": ...,
+        "clusters": [
+          {"lat": ..., "lon": ..., "hospitalCount": ..., "shortageCount": ...,
+           "bloodData": [{"bloodType": ..., "totalBloodCC": ..., "shortageCount": ...}, ...],
+           "hospital": ..., "city": ...},   # hospital/city only for single-hospital clusters
+          ...
+        ]
+      }
+    shortageCount counts hospitals with a shortage flag on at least one blood type.
+    """
+    lats, lons = snapshot["lats"], snapshot["lons"]
+    if len(lats) == 0:
+        return {}
+    cell_x, cell_y = tile_coordinates(lats, lons, zoom + CLUSTER_LEVELS)
+    cells, inverse = np.unique(np.stack([cell_x, cell_y], axis=1), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    n_cells = len(cells)
+
+    counts = np.bincount(inverse, minlength=n_cells)
+    lat_mean = np.bincount(inverse, weights=lats, minlength=n_cells) / counts
+    lon_mean = np.bincount(inverse, weights=lons, minlength=n_cells) / counts
+    any_shortage = np.bincount(inverse, weights=snapshot["shortage"].any(axis=1), minlength=n_cells)
+    cc = np.zeros((n_cells, len(COMPLETE_BLOOD_TYPES)), dtype=np.int64)
+    np.add.at(cc, inverse, snapshot["cc"])
+    shortage = np.zeros((n_cells, len(COMPLETE_BLOOD_TYPES)), dtype=np.int64)
+    np.add.at(shortage, inverse, snapshot["shortage"])
+    first_row = np.full(n_cells, -1, dtype=np.int64)
+    first_row[inverse[::-1]] = np.arange(len(inverse))[::-1]
+
+    tiles = {}
+    for cell in range(n_cells):
+        key = (int(cells[cell, 0]) >> CLUSTER_LEVELS, int(cells[cell, 1]) >> CLUSTER_LEVELS)
+        tile = tiles.setdefault(key, {"hospitalCount": 0, "shortageCount": 0, "clusters": []})
+        cluster = {
+            "lat": round(float(lat_mean[cell]), 6),
+            "lon": round(float(lon_mean[cell]), 6),
+            "hospitalCount": int(counts[cell]),
+            "shortageCount": int(any_shortage[cell]),
+            "bloodData": [
+                {"bloodType": bt, "totalBloodCC": int(cc[cell, i]), "shortageCount": int(shortage[cell, i])}
+                for i, bt in enumerate(COMPLETE_BLOOD_TYPES)
+            ]
+        }
+        if counts[cell] == 1:
+            row = first_row[cell]
+            cluster["hospital"] = snapshot["names"][row]
+            cluster["city"] = snapshot["cities"][row]
+        tile["clusters"].append(cluster)
+        tile["hospitalCount"] += cluster["hospitalCount"]
+        tile["shortageCount"] += cluster["shortageCount"]
+    return tiles
+
+#######################################
+# Tile Cache
+#######################################
+
+class TileCache:
+    """
+    Clustered map tiles, precomputed one whole zoom level at a time from a donorStats
+    snapshot. Every zoom level (and the snapshot) is stamped with the donorStats data
+    version, so any write makes the next tile request rebuild its zoom level.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = (None, None)  # (version, snapshot)
+        self._zooms = {}               # zoom -> (version, {(x, y): tile})
+
+    def _zoom_tiles(self, db, zoom, version):
+        with self._lock:
+            entry = self._zooms.get(zoom)
+            if entry and entry[0] == version:
+                return entry[1]
+            if self._snapshot[0] != version:
+                self._snapshot = (version, load_snapshot(db))
+            tiles = build_zoom_tiles(self._snapshot[1], zoom)
+            self._zooms = {z: e for z, e in self._zooms.items() if e[0] == version}
+            self._zooms[zoom] = (version, tiles)
+            return tiles
+
+    def get_tile(self, db, zoom, x, y, version=None):
+        """
+        Returns the tile at zoom/x/y (an empty tile when no hospital falls inside it).
+        """
+        version = get_data_version(db) if version is None else version
+        tile = self._zoom_tiles(db, zoom, version).get((x, y))
+        return {"z": zoom, "x": x, "y": y, **(tile or {"hospitalCount": 0, "shortageCount": 0, "clusters": []})}
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = (None, None)
+            self._zooms = {}
@@ -1,22 +1,27 @@
 # readDataApp.py
-from flask import Flask, jsonify
-from pymongo import MongoClient
-from hospital_data import get_complete_hospital_data, get_complete_hospital_data_with_location
+from flask import Flask, jsonify, request
+from database import get_db
+from hospital_data import get_complete_hospital_data, get_complete_hospital_data_with_location, iter_hospital_data
+from streaming import stream_format, streaming_response
 # Optionally, if you have a donors retrieval function:
 # from donors_db import get_all_donors
 
 app = Flask(__name__)
 
 # Connect to MongoDB
-client = MongoClient("mongodb://localhost:27017")
-db = client["americanRedCrossDB"]
+db = get_db()
 
 @app.route("/hospital/data", methods=["GET"])
 def hospital_data_endpoint():
     """
     Returns aggregated hospital data as JSON.
     This endpoint returns data from the secondary collection.
+    Send "Accept: application/x-ndjson" or "Accept: application/json; stream=chunked"
+    to stream it.
     """
+    fmt = stream_format(request.accept_mimetypes)
+    if fmt:
+        return streaming_response(iter_hospital_data(db), fmt)
     data = get_complete_hospital_data(db)
     return jsonify(data)
 
@@ -25,6 +30,9 @@ def hospital_data_with_location_endpoint():
     """
     Returns aggregated hospital data including coordinates.
     """
+    fmt = stream_format(request.accept_mimetypes)
+    if fmt:
+        return streaming_response(iter_hospital_data(db, with_location=True), fmt)
     data = get_complete_hospital_data_with_location(db)
     return jsonify(data)
 
@@ -32,8 +40,12 @@ def hospital_data_with_location_endpoint():
 @app.route("/donor/data", methods=["GET"])
 def donor_data_endpoint():
     """
-    Returns all donor documents as JSON.
+    Returns all donor documents as JSON, or streamed from the cursor when the
+    Accept header asks for NDJSON or a chunked array.
     """
+    fmt = stream_format(request.accept_mimetypes)
+    if fmt:
+        return streaming_response(db.donors.find(batch_size=1000), fmt)
     donors = list(db.donors.find())
     return jsonify(donors)
 
@@ -4,7 +4,10 @@ import random
 
 # Base URL for your Flask app endpoints (adjust if needed)
 BASE_URL = "http://localhost:5001"
+# Hospitals are created with this password; with managmentAuth.TEST_MODE on, creation
+# stores its bcrypt hash, so the inventory batches below authenticate with it.
 TEST_PASSWORD = "testPassword"
+BATCH_HOSPITALS = 50  # Hospitals per /hospital/inventory/batch request.
 BLOOD_TYPES = ["O+", "A+", "B+", "AB+", "O-", "A-", "B-", "AB-"]
 
 # List of real cities with coordinates
@@ -40,37 +43,50 @@ def generate_flag_settings():
                  "shortage": random.choice([True, False])}
             for bt in BLOOD_TYPES}
 
-def create_hospital(hospital_data):
+def create_hospitals(hospitals_data):
     """
-    Sends a POST request to /hospital/create endpoint with hospital_data.
-    Returns the created hospital data if successful, or None.
+    Sends one POST request to the /hospital/create/bulk endpoint with all hospitals.
+    Returns the hospitals that were created (each with its lid), or [] on failure.
     """
-    url = f"{BASE_URL}/hospital/create"
-    response = requests.post(url, json=hospital_data)
-    if response.status_code == 201:
-        print(f"Created hospital: {hospital_data['name']} in {hospital_data['city']}")
-        return response.json().get("hospital")
-    else:
-        print(f"Failed to create hospital {hospital_data['name']}: {response.text}")
-        return None
+    url = f"{BASE_URL}/hospital/create/bulk"
+    response = requests.post(url, json={"hospitals": hospitals_data})
+    if response.status_code != 200:
+        print(f"Failed to create hospitals: {response.text}")
+        return []
+    created = []
+    for hospital_data, result in zip(hospitals_data, response.json().get("results", [])):
+        if result.get("status") == "ok":
+            print(f"Created hospital: {hospital_data['name']} in {hospital_data['city']}")
+            created.append({**hospital_data, "lid": result.get("lid")})
+        else:
+            print(f"Failed to create hospital {hospital_data['name']}: {result.get('error')}")
+    return created
 
-def update_inventory(hospital, city, blood_type, delta_count):
+def update_inventory(hospital_deltas, chunk_size=BATCH_HOSPITALS):
     """
-    Sends a POST request to /hospital/inventory/update to update blood inventory.
+    Sends the inventory changes for many hospitals to the /hospital/inventory/batch
+    endpoint, chunk_size hospitals per request. hospital_deltas is a list of
+    (hospital, {bloodType: delta_count}); each operation carries the hospital's password
+    (TEST_PASSWORD, which the hospitals were created with), so the server checks it once
+    per hospital.
     """
-    url = f"{BASE_URL}/hospital/inventory/update"
-    payload = {
-        "hospital": hospital,
-        "city": city,
-        "bloodType": blood_type,
-        "delta_count": delta_count,
-        "password": TEST_PASSWORD
-    }
-    response = requests.post(url, json=payload)
-    if response.status_code == 200:
-        print(f"Updated inventory for {hospital} ({city}) - {blood_type}: delta {delta_count}")
-    else:
-        print(f"Failed to update inventory for {hospital} ({city}) - {blood_type}: {response.text}")
+    url = f"{BASE_URL}/hospital/inventory/batch"
+    for start in range(0, len(hospital_deltas), chunk_size):
+        operations = [
+            {"hospital": hosp["name"], "city": hosp["city"], "bloodType": bt, "delta_count": delta,
+             "password": TEST_PASSWORD}
+            for hosp, deltas in hospital_deltas[start:start + chunk_size]
+            for bt, delta in deltas.items()
+        ]
+        response = requests.post(url, json={"operations": operations})
+        if response.status_code != 200:
+            print(f"Failed to update inventory: {response.text}")
+            continue
+        for op, result in zip(operations, response.json().get("results", [])):
+            if result.get("status") == "ok":
+                print(f"Updated inventory for {op['hospital']} ({op['city']}) - {op['bloodType']}: delta {op['delta_count']}")
+            else:
+                print(f"Failed to update inventory for {op['hospital']} ({op['city']}) - {op['bloodType']}: {result.get('error')}")
 
 def generate_hospitals(total_hospitals=250):
     """
@@ -79,28 +95,24 @@ def generate_hospitals(total_hospitals=250):
       - A random city is chosen from CITIES.
       - The hospital name is constructed using the city name and an index.
       - Randomized flag settings are generated.
-      - The /hospital/create endpoint is called.
-      - For each blood type, a random number (0 to 20) is added to the inventory.
+    All hospitals are then created with one call to the /hospital/create/bulk endpoint,
+    and for each blood type a random number (0 to 20) is added to every hospital's inventory.
     """
-    created_hospitals = []
+    hospitals_data = []
     for i in range(1, total_hospitals + 1):
         city_info = random.choice(CITIES)
         hospital_name = f"{city_info['city']} Hospital {i}"
         flag_settings = generate_flag_settings()
-        hospital_data = {
+        hospitals_data.append({
             "name": hospital_name,
             "city": city_info["city"],
             "coordinates": {"lat": city_info["lat"], "lon": city_info["lon"]},
             "password": TEST_PASSWORD,
             "flagSettings": flag_settings
-        }
-        created = create_hospital(hospital_data)
-        if created:
-            created_hospitals.append(created)
-            # Update inventory for each blood type with a random delta (0 to 20)
-            for bt in BLOOD_TYPES:
-                delta = random.randint(0, 20)
-                update_inventory(hospital_name, city_info["city"], bt, delta)
+        })
+    created_hospitals = create_hospitals(hospitals_data)
+    # For each blood type, add a random number (0 to 20) of blood bags to every hospital.
+    update_inventory([(hosp, {bt: random.randint(0, 20) for bt in BLOOD_TYPES}) for hosp in created_hospitals])
     return created_hospitals
 
 def main():
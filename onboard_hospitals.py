@@ -0,0 +1,47 @@
+# onboard_hospitals.py
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import wait
+from database import get_db
+from distance_matrix import load_or_build, DEFAULT_MATRIX_DIR
+from managmentAuth import add_hospitals
+
+def load_hospitals(path):
+    """
+    Reads the hospitals to onboard from a JSON file holding either a list of
+    /hospital/create payloads or {"hospitals": [...]}.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("hospitals", [])
+    return data
+
+def main():
+    parser = argparse.ArgumentParser(description="Onboard many hospitals straight into the database.")
+    parser.add_argument("path", help="JSON file with the hospitals to create.")
+    args = parser.parse_args()
+
+    db = get_db()
+    results, registrations = add_hospitals(db, load_hospitals(args.path))
+    for result in results:
+        if result["status"] != "ok":
+            print(f"FAIL #{result['index']} {result['name']} ({result['city']}): {result['error']}")
+    created = sum(1 for result in results if result["status"] == "ok")
+
+    # Let the queued Auth0 signups finish before the process exits.
+    wait(registrations)
+    failed_signups = sum(1 for future in registrations if not future.result())
+    print(f"Created {created} of {len(results)} hospital(s); {failed_signups} Auth0 signup(s) failed.")
+
+    # A saved distance matrix would miss the new hospitals; merge them in once for all of them.
+    if created and os.path.isdir(DEFAULT_MATRIX_DIR):
+        load_or_build(db).save()
+        print(f"Updated distance matrix in '{DEFAULT_MATRIX_DIR}'.")
+    if created < len(results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
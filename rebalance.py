@@ -0,0 +1,158 @@
+# rebalance.py
+import argparse
+import itertools
+import json
+import numpy as np
+from database import get_db
+from scipy.optimize import linprog
+from scipy.sparse import coo_matrix
+from donor_stats import COMPLETE_BLOOD_TYPES
+from donor_index import KDTree, to_unit_vector, km_to_chord, chord_to_km
+
+BAG_CC = 450
+DEFAULT_TARGET_UNITS = 10  # Bags of each blood type a hospital should hold after rebalancing.
+DEFAULT_CANDIDATES = 8     # Nearest surplus hospitals considered per shortage hospital.
+
+#######################################
+# Supply and Demand
+#######################################
+
+def load_supply_and_demand(db, target_units=DEFAULT_TARGET_UNITS, blood_types=None):
+    """
+    Reads all donorStats flags and inventory plus hospital coordinates (one query each)
+    and returns {bloodType: (supply, demand)}, where supply and demand are lists of
+    (hospital, city, lat, lon, units).
+
+    A hospital flagged 'surplus' can give away the bags it holds above target_units;
+    a hospital flagged 'shortage' needs the bags it is missing below target_units.
+    """
+    blood_types = blood_types or COMPLETE_BLOOD_TYPES
+    coordinates = {}
+    for loc in db.locations.find({"coordinates": {"$exists": True}}, {"_id": 0, "name": 1, "city": 1, "coordinates": 1}):
+        coordinates[(loc.get("name"), loc.get("city"))] = (loc["coordinates"]["lat"], loc["coordinates"]["lon"])
+
+    sides = {bt: ([], []) for bt in blood_types}
+    projection = {"_id": 0, "hospital": 1, "city": 1, "bloodTypeStats": 1, "inventoryStats": 1}
+    for rec in db.donorStats.find({}, projection):
+        key = (rec.get("hospital"), rec.get("city"))
+        if key not in coordinates:
+            continue
+        lat, lon = coordinates[key]
+        inventory = {inv.get("bloodType"): inv.get("totalBloodCC", 0) for inv in rec.get("inventoryStats", [])}
+        for bt in rec.get("bloodTypeStats", []):
+            blood_type = bt.get("bloodType")
+            if blood_type not in sides:
+                continue
+            units = int(inventory.get(blood_type, 0) // BAG_CC)
+            supply, demand = sides[blood_type]
+            if bt.get("surplus") and units > target_units:
+                supply.append((key[0], key[1], lat, lon, units - target_units))
+            elif bt.get("shortage") and units < target_units:
+                demand.append((key[0], key[1], lat, lon, target_units - units))
+    return sides
+
+#######################################
+# Transportation Problem
+#######################################
+
+def candidate_edges(supply, demand, candidates=DEFAULT_CANDIDATES, max_distance_km=None):
+    """
+    Connects every shortage hospital to its nearest surplus hospitals using a KD-tree,
+    so the problem has O(len(demand) * candidates) edges instead of a dense matrix.
+    Returns a list of (supply_index, demand_index, distance_km).
+    """
+    tree = KDTree((to_unit_vector(s[2], s[3]), i) for i, s in enumerate(supply))
+    max_chord = km_to_chord(max_distance_km) if max_distance_km is not None else None
+    edges = []
+    for d_index, d in enumerate(demand):
+        for chord, s_index in itertools.islice(tree.nearest(to_unit_vector(d[2], d[3])), candidates):
+            if max_chord is not None and chord > max_chord:
+                break
+            edges.append((s_index, d_index, chord_to_km(chord)))
+    return edges
+
+def solve_transportation(supply, demand, edges):
+    """
+    Solves min sum(distance * units) over the candidate edges as a sparse LP (HiGHS),
+    subject to each surplus hospital shipping at most its supply. Unmet demand is a
+    slack variable priced above any edge, so as much demand as possible is covered
+    first. The constraint matrix is totally unimodular, so the optimum is integral.
+    Returns (flows per edge, unmet units per shortage hospital).
+    """
+    n_edges, n_demand = len(edges), len(demand)
+    if n_edges == 0:
+        return np.zeros(0, dtype=int), np.array([d[4] for d in demand], dtype=int)
+    s_idx = np.array([e[0] for e in edges])
+    d_idx = np.array([e[1] for e in edges])
+    cost = np.array([e[2] for e in edges])
+    unmet_penalty = cost.max() + 1.0
+    c = np.concatenate([cost, np.full(n_demand, unmet_penalty)])
+
+    a_ub = coo_matrix((np.ones(n_edges), (s_idx, np.arange(n_edges))), shape=(len(supply), n_edges + n_demand))
+    b_ub = np.array([s[4] for s in supply], dtype=float)
+    rows = np.concatenate([d_idx, np.arange(n_demand)])
+    cols = np.arange(n_edges + n_demand)
+    a_eq = coo_matrix((np.ones(n_edges + n_demand), (rows, cols)), shape=(n_demand, n_edges + n_demand))
+    b_eq = np.array([d[4] for d in demand], dtype=float)
+
+    result = linprog(c, A_ub=a_ub.tocsr(), b_ub=b_ub, A_eq=a_eq.tocsr(), b_eq=b_eq,
+                     bounds=(0, None), method="highs")
+    if not result.success:
+        raise RuntimeError(f"Rebalancing solver failed: {result.message}")
+    x = np.rint(result.x).astype(int)
+    return x[:n_edges], x[n_edges:]
+
+def build_rebalance_plan(db, target_units=DEFAULT_TARGET_UNITS, candidates=DEFAULT_CANDIDATES,
+                         max_distance_km=None, blood_types=None):
+    """
+    Builds a national transfer plan that moves surplus bags to shortage hospitals with
+    minimum total transport distance, one transportation problem per blood type.
+    Returns:
+      {
+        "transfers": [{"bloodType", "fromHospital", "fromCity", "toHospital", "toCity",
+                       "units", "distance_km"}, ...],
+        "unmet": [{"bloodType", "hospital", "city", "units"}, ...],
+        "totalUnits": <units moved>,
+        "totalUnitKm": <sum of units * distance_km>
+      }
+    """
+    plan = {"transfers": [], "unmet": [], "totalUnits": 0, "totalUnitKm": 0.0}
+    for blood_type, (supply, demand) in load_supply_and_demand(db, target_units, blood_types).items():
+        if not demand:
+            continue
+        edges = candidate_edges(supply, demand, candidates, max_distance_km) if supply else []
+        flows, unmet = solve_transportation(supply, demand, edges)
+        for (s_index, d_index, distance), units in zip(edges, flows):
+            if units <= 0:
+                continue
+            plan["transfers"].append({
+                "bloodType": blood_type,
+                "fromHospital": supply[s_index][0],
+                "fromCity": supply[s_index][1],
+                "toHospital": demand[d_index][0],
+                "toCity": demand[d_index][1],
+                "units": int(units),
+                "distance_km": round(distance, 2)
+            })
+            plan["totalUnits"] += int(units)
+            plan["totalUnitKm"] += units * distance
+        for d, units in zip(demand, unmet):
+            if units > 0:
+                plan["unmet"].append({"bloodType": blood_type, "hospital": d[0], "city": d[1], "units": int(units)})
+    plan["totalUnitKm"] = round(float(plan["totalUnitKm"]), 2)
+    return plan
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute a surplus-to-shortage transfer plan.")
+    parser.add_argument("--target-units", type=int, default=DEFAULT_TARGET_UNITS)
+    parser.add_argument("--candidates", type=int, default=DEFAULT_CANDIDATES)
+    parser.add_argument("--max-distance-km", type=float, default=None)
+    parser.add_argument("--blood-type", action="append", dest="blood_types")
+    args = parser.parse_args()
+
+    db = get_db()
+    plan = build_rebalance_plan(db, args.target_units, args.candidates, args.max_distance_km, args.blood_types)
+    print(json.dumps(plan, indent=2))
+
+if __name__ == "__main__":
+    main()
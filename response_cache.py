@@ -0,0 +1,30 @@
+# response_cache.py
+import threading
+
+class PayloadCache:
+    """
+    Holds serialized response bodies keyed by name, each stamped with the data version
+    it was built from. A body is rebuilt only when the current version differs, so all
+    requests between two writes share one serialization.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (version, body)
+
+    def get(self, key, version, build):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and entry[0] == version:
+            return entry[1]
+        body = build()
+        with self._lock:
+            self._entries[key] = (version, body)
+        return body
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
@@ -1,8 +1,10 @@
 # sampleData.py
-from pymongo import MongoClient
+from database import get_db, get_client
+from geo import geo_point, ensure_geo_index
+from indexes import ensure_indexes
+from session_tokens import hash_password as session_hash_password
 from datetime import datetime
 import random
-import bcrypt
 
 # Import necessary functions from hospital_managment.py
 from hospital_managment import (
@@ -16,14 +18,15 @@ from hospital_managment import (
     remove_donor_and_update
 )
 
+# Sample passwords are public test values, so hash them at bcrypt's minimum cost
+# instead of spending the production cost once per generated hospital.
+SAMPLE_BCRYPT_ROUNDS = 4
+
 def hash_password(plain_password):
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(plain_password.encode('utf-8'), salt)
-    return hashed.decode('utf-8')
+    return session_hash_password(plain_password, rounds=SAMPLE_BCRYPT_ROUNDS)
 
 def wipe_database(db_name="americanRedCrossDB"):
-    client = MongoClient("mongodb://localhost:27017")
-    client.drop_database(db_name)
+    get_client().drop_database(db_name)
     print(f"Database '{db_name}' has been wiped.")
 
 def generate_sample_hospitals(db):
@@ -44,7 +47,10 @@ def generate_sample_hospitals(db):
         # Hash the password and store as passwordHash.
         hosp["passwordHash"] = hash_password(hosp.pop("password"))
     db.locations.drop()
+    for hosp in hospitals:
+        hosp["location"] = geo_point(hosp["coordinates"])
     db.locations.insert_many(hospitals)
+    ensure_geo_index(db)
     print(f"Inserted {len(hospitals)} sample hospitals.")
 
 def generate_sample_donors(db):
@@ -206,12 +212,12 @@ def set_manual_flags(db):
     print("Manually set surplus/shortage flags for testing matching.")
 
 def generate_all_sample_data():
-    client = MongoClient("mongodb://localhost:27017")
-    db = client["americanRedCrossDB"]
+    db = get_db()
     wipe_database("americanRedCrossDB")
     generate_sample_hospitals(db)
     generate_sample_donors(db)
     generate_sample_inventory(db)
+    ensure_indexes(db)
     print("All sample data generated.")
     
     # Update the secondary collection so that every hospital has complete aggregated data.
@@ -0,0 +1,25 @@
+# sequences.py
+from pymongo import ReturnDocument
+
+def reserve_sequence(db, name, count, floor=0):
+    """
+    Atomically reserves a block of 'count' consecutive numbers from the counter
+    document 'name' in the 'counters' collection and returns them as a range.
+    The counter never hands out a number <= floor, which lets it start above ids
+    that were assigned before the counter existed.
+    """
+    doc = db.counters.find_one_and_update(
+        {"_id": name},
+        [{"$set": {"seq": {"$add": [{"$max": [{"$ifNull": ["$seq", 0]}, floor]}, count]}}}],
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    end = doc["seq"]
+    return range(end - count + 1, end + 1)
+
+def current_sequence(db, name):
+    """
+    Returns the last number handed out by the counter 'name' (0 if it was never used).
+    """
+    doc = db.counters.find_one({"_id": name})
+    return doc["seq"] if doc else 0
@@ -0,0 +1,95 @@
+# session_tokens.py
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+
+# Every worker must sign with the same SESSION_SECRET: with a per-process random key a
+# token only works against the worker that issued it. It is required whenever tokens
+# are issued or verified; SESSION_SECRET_DEV=1 allows a random key for a single-process
+# development server only.
+SESSION_SECRET = os.environ.get("SESSION_SECRET", "").encode()
+if not SESSION_SECRET and os.environ.get("SESSION_SECRET_DEV") == "1":
+    print("SESSION_SECRET is not set; signing session tokens with a random per-process key (development only).")
+    SESSION_SECRET = os.urandom(32)
+TOKEN_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", 8 * 3600))
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+BCRYPT_WORKERS = int(os.environ.get("BCRYPT_WORKERS", 2))
+
+#######################################
+# Session Tokens
+#######################################
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def require_session_secret():
+    """
+    Raises unless SESSION_SECRET (or SESSION_SECRET_DEV=1) is set. The app calls this at
+    startup; scripts that only hash passwords never need a secret.
+    """
+    if not SESSION_SECRET:
+        raise RuntimeError("SESSION_SECRET must be set (or SESSION_SECRET_DEV=1 for a single-process development server).")
+
+def _sign(payload):
+    require_session_secret()
+    return hmac.new(SESSION_SECRET, payload.encode(), hashlib.sha256).digest()
+
+def issue_token(hospital, city, ttl=TOKEN_TTL_SECONDS):
+    """
+    Returns a signed session token for (hospital, city), valid for ttl seconds:
+      <base64url JSON payload>.<base64url HMAC-SHA256 signature>
+    Verifying it costs one HMAC instead of a bcrypt check or an Auth0 round trip.
+    """
+    payload = _b64encode(json.dumps({"h": hospital, "c": city, "exp": int(time.time()) + ttl}).encode())
+    return f"{payload}.{_b64encode(_sign(payload))}"
+
+def verify_token(token, hospital, city):
+    """
+    True if token was issued by issue_token() for this (hospital, city) and has not expired.
+    """
+    try:
+        payload, signature = token.split(".", 1)
+        if not hmac.compare_digest(_b64decode(signature), _sign(payload)):
+            return False
+        claims = json.loads(_b64decode(payload))
+    except (AttributeError, ValueError):
+        return False
+    return claims.get("h") == hospital and claims.get("c") == city and claims.get("exp", 0) > time.time()
+
+#######################################
+# Bounded bcrypt Pool
+#######################################
+
+# bcrypt releases the GIL while hashing. The pool only caps how many cores password
+# checks can take at once (BCRYPT_WORKERS); it does not make them asynchronous: the
+# calling request thread still blocks until its hash is done, and waits longer when
+# more than BCRYPT_WORKERS checks are in flight. Log in once and use session tokens
+# to keep bcrypt off the hot path.
+_bcrypt_pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+
+def hash_password(plain_password, rounds=BCRYPT_ROUNDS):
+    """
+    Blocking: hashes on the bcrypt pool, but the calling thread waits for the result
+    (longer while more than BCRYPT_WORKERS hashes are queued).
+    """
+    def run():
+        return bcrypt.hashpw(plain_password.encode("utf-8"), bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+    return _bcrypt_pool.submit(run).result()
+
+def verify_password(plain_password, hashed_password):
+    """
+    Blocking: checks on the bcrypt pool, but the calling request thread waits for the
+    result (longer while more than BCRYPT_WORKERS checks are queued). Use session
+    tokens for repeated writes.
+    """
+    def run():
+        return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
+    return _bcrypt_pool.submit(run).result()
@@ -0,0 +1,67 @@
+# streaming.py
+from bson.json_util import dumps
+from flask import Response, stream_with_context
+
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/ndjson")
+JSON_MIMETYPE = "application/json"
+
+def stream_format(accept_mimetypes):
+    """
+    Picks the response mode from the request's Accept header (highest quality first):
+      - "ndjson" for application/x-ndjson (or application/ndjson): one document per line.
+      - "array"  for application/json; stream=chunked: a JSON array sent in chunks.
+      - None     otherwise: the usual fully buffered JSON body.
+    """
+    for value, quality in accept_mimetypes:
+        if quality <= 0:
+            continue
+        mimetype, _, params = value.partition(";")
+        mimetype = mimetype.strip().lower()
+        if mimetype in NDJSON_MIMETYPES:
+            return "ndjson"
+        if mimetype == JSON_MIMETYPE:
+            params = {p.split("=", 1)[0].strip().lower(): p.split("=", 1)[-1].strip().lower()
+                      for p in params.split(";") if p.strip()}
+            return "array" if params.get("stream") == "chunked" else None
+    return None
+
+def iter_ndjson(docs):
+    for doc in docs:
+        yield dumps(doc) + "\n"
+
+def iter_json_array(docs, chunk_size=100):
+    """
+    Serializes docs as one JSON array, yielding about chunk_size documents per chunk,
+    so memory use stays bounded no matter how many documents the cursor returns.
+    """
+    chunk = ["["]
+    first = True
+    for doc in docs:
+        if not first:
+            chunk.append(",")
+        chunk.append(dumps(doc))
+        first = False
+        if len(chunk) >= 2 * chunk_size:
+            yield "".join(chunk)
+            chunk = []
+    chunk.append("]")
+    yield "".join(chunk)
+
+def streaming_response(docs, fmt):
+    """
+    Wraps an iterable of documents (typically a pymongo cursor) in a chunked response
+    in the given stream_format().
+    """
+    if fmt == "ndjson":
+        return Response(stream_with_context(iter_ndjson(docs)), mimetype=NDJSON_MIMETYPES[0])
+    return Response(stream_with_context(iter_json_array(docs)), mimetype=JSON_MIMETYPE)
+
+def json_response(docs, accept_mimetypes, status=200):
+    """
+    Returns docs as a streamed response when the client asked for one, otherwise as a
+    single buffered JSON body.
+    """
+    fmt = stream_format(accept_mimetypes)
+    if fmt:
+        return streaming_response(docs, fmt), status
+    return Response(dumps(docs), mimetype=JSON_MIMETYPE), status
@@ -1,12 +1,11 @@
 import streamlit as st
-from pymongo import MongoClient
+from database import get_db
 import folium
 from streamlit_folium import folium_static
 
 # Function to connect to MongoDB and fetch data
 def get_hospital_data(blood_filter=None):
-    client = MongoClient("mongodb://localhost:27017")
-    db = client["americanRedCrossDB"]
+    db = get_db()
     
     # Build query based on the blood type filter (assuming backend already classifies)
     query = {}
@@ -36,11 +35,13 @@ def display_map(hospitals):
     # Create a base map centered on a location (e.g., USA)
     map = folium.Map(location=[37.0902, -95.7129], zoom_start=4)
 
-    # Add a marker for each hospital
+    # Add a marker for each hospital, using the coordinates stored in donorStats
     for hospital in hospitals:
-        lat, lon = get_lat_lon(hospital['city'])  # Assuming you have a function to fetch lat/lon for city
+        coordinates = hospital.get("coordinates")
+        if not coordinates:
+            continue
         folium.Marker(
-            [lat, lon],
+            [coordinates["lat"], coordinates["lon"]],
             popup=f"{hospital['hospital']} - {hospital['city']}",
         ).add_to(map)
 
@@ -0,0 +1,212 @@
+# synthetic_data.py
+import argparse
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from database import get_db
+from donor_stats import update_secondary_data
+from geo import geo_point
+from indexes import ensure_indexes
+from session_tokens import hash_password
+
+SYNTHETIC_DB = "gotbloodSynthetic"
+BATCH_SIZE = 50000
+SYNTHETIC_PASSWORD = "syntheticPass"
+
+# US blood type distribution (share of the population).
+BLOOD_TYPE_FREQUENCIES = {
+    "O+": 0.374, "A+": 0.357, "B+": 0.085, "AB+": 0.034,
+    "O-": 0.066, "A-": 0.063, "B-": 0.015, "AB-": 0.006
+}
+
+# Metro areas hospitals cluster around: (city, lat, lon, population in millions).
+METROS = [
+    ("New York, NY", 40.7128, -74.0060, 19.5), ("Los Angeles, CA", 34.0522, -118.2437, 12.9),
+    ("Chicago, IL", 41.8781, -87.6298, 9.4), ("Dallas, TX", 32.7767, -96.7970, 7.6),
+    ("Houston, TX", 29.7604, -95.3698, 7.1), ("Washington, DC", 38.9072, -77.0369, 6.3),
+    ("Philadelphia, PA", 39.9526, -75.1652, 6.2), ("Miami, FL", 25.7617, -80.1918, 6.1),
+    ("Atlanta, GA", 33.7490, -84.3880, 6.1), ("Boston, MA", 42.3601, -71.0589, 4.9),
+    ("Phoenix, AZ", 33.4484, -112.0740, 4.9), ("San Francisco, CA", 37.7749, -122.4194, 4.6),
+    ("Riverside, CA", 33.9806, -117.3755, 4.6), ("Detroit, MI", 42.3314, -83.0458, 4.3),
+    ("Seattle, WA", 47.6062, -122.3321, 4.0), ("Minneapolis, MN", 44.9778, -93.2650, 3.7),
+    ("San Diego, CA", 32.7157, -117.1611, 3.3), ("Tampa, FL", 27.9506, -82.4572, 3.2),
+    ("Denver, CO", 39.7392, -104.9903, 3.0), ("St. Louis, MO", 38.6270, -90.1994, 2.8),
+    ("Baltimore, MD", 39.2904, -76.6122, 2.8), ("Charlotte, NC", 35.2271, -80.8431, 2.7),
+    ("Orlando, FL", 28.5383, -81.3792, 2.7), ("San Antonio, TX", 29.4241, -98.4936, 2.6),
+    ("Portland, OR", 45.5152, -122.6784, 2.5), ("Sacramento, CA", 38.5816, -121.4944, 2.4),
+    ("Pittsburgh, PA", 40.4406, -79.9959, 2.4), ("Austin, TX", 30.2672, -97.7431, 2.4),
+    ("Las Vegas, NV", 36.1699, -115.1398, 2.3), ("Cincinnati, OH", 39.1031, -84.5120, 2.3),
+    ("Kansas City, MO", 39.0997, -94.5786, 2.2), ("Columbus, OH", 39.9612, -82.9988, 2.1),
+    ("Indianapolis, IN", 39.7684, -86.1581, 2.1), ("Cleveland, OH", 41.4993, -81.6944, 2.1),
+    ("San Jose, CA", 37.3382, -121.8863, 2.0), ("Nashville, TN", 36.1627, -86.7816, 2.0),
+    ("Jacksonville, FL", 30.3322, -81.6557, 1.6), ("Salt Lake City, UT", 40.7608, -111.8910, 1.3),
+    ("Albuquerque, NM", 35.0844, -106.6504, 0.9), ("Omaha, NE", 41.2565, -95.9345, 1.0)
+]
+METRO_SPREAD_DEGREES = 0.35  # Std. deviation of hospital positions around a metro center.
+
+FIRST_NAMES = ["Alice", "Bob", "Carol", "David", "Emma", "Frank", "Grace", "Henry", "Isabel", "Jack",
+               "Karen", "Liam", "Maria", "Noah", "Olivia", "Paul", "Quinn", "Rosa", "Sam", "Tina"]
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+              "Rodriguez", "Martinez", "Lopez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore"]
+
+#######################################
+# Vectorized Generators
+#######################################
+
+def _batches(total, batch_size):
+    for start in range(0, total, batch_size):
+        yield start, min(batch_size, total - start)
+
+def _blood_types(rng, count):
+    types = np.array(list(BLOOD_TYPE_FREQUENCIES))
+    return types[rng.choice(len(types), size=count, p=list(BLOOD_TYPE_FREQUENCIES.values()))]
+
+def generate_hospitals(rng, count, password_hash=None):
+    """
+    Returns (locations, capacity): count hospital documents clustered around METROS
+    (metros drawn by population, positions spread normally around the center) and
+    each hospital's relative size, which decides how many donors and bags it gets.
+    """
+    weights = np.array([m[3] for m in METROS])
+    metro = rng.choice(len(METROS), size=count, p=weights / weights.sum())
+    lats = np.array([m[1] for m in METROS])[metro] + rng.normal(0.0, METRO_SPREAD_DEGREES, count)
+    lons = np.array([m[2] for m in METROS])[metro] + rng.normal(0.0, METRO_SPREAD_DEGREES, count)
+    capacity = rng.lognormal(0.0, 0.75, count)
+    locations = []
+    for i, (m, lat, lon) in enumerate(zip(metro.tolist(), np.round(lats, 6).tolist(), np.round(lons, 6).tolist()), start=1):
+        coordinates = {"lat": lat, "lon": lon}
+        hosp = {
+            "lid": "L{:04d}".format(i),
+            "name": f"{METROS[m][0].split(',')[0]} Hospital {i}",
+            "city": METROS[m][0],
+            "locationCode": "HOSP",
+            "coordinates": coordinates,
+            "location": geo_point(coordinates)
+        }
+        if password_hash:
+            hosp["passwordHash"] = password_hash
+        locations.append(hosp)
+    return locations, capacity / capacity.sum()
+
+def generate_donors(rng, start, count, locations, hospital_p, today=None):
+    """
+    count donor documents (pids start+1 .. start+count), assigned to hospitals in
+    proportion to their size, with blood types drawn from BLOOD_TYPE_FREQUENCIES.
+    """
+    today = today or datetime(2025, 1, 1)
+    hospital = rng.choice(len(locations), size=count, p=hospital_p)
+    blood_types = _blood_types(rng, count).tolist()
+    ages = rng.integers(18, 76, count).tolist()
+    genders = rng.choice(np.array(["F", "M"]), size=count).tolist()
+    heights = np.clip(rng.normal(67, 4, count), 58, 80).round().astype(int).tolist()
+    weights = np.clip(rng.normal(175, 35, count), 110, 350).round().astype(int).tolist()
+    next_days = rng.integers(-30, 57, count).tolist()
+    first = rng.integers(0, len(FIRST_NAMES), count).tolist()
+    last = rng.integers(0, len(LAST_NAMES), count).tolist()
+    return [
+        {
+            "pid": "P{:07d}".format(start + i + 1),
+            "firstName": FIRST_NAMES[first[i]],
+            "lastName": LAST_NAMES[last[i]],
+            "age": ages[i],
+            "role": "donor",
+            "hospital": locations[h]["name"],
+            "city": locations[h]["city"],
+            "donorDetails": {
+                "bloodType": blood_types[i],
+                "weightLBS": weights[i],
+                "heightIN": heights[i],
+                "gender": genders[i],
+                "nextSafeDonation": today + timedelta(days=next_days[i])
+            }
+        }
+        for i, h in enumerate(hospital.tolist())
+    ]
+
+def generate_bags(rng, start, count, locations, hospital_p, available_ratio=0.9):
+    """
+    Returns (bloodBags, globalInventory) documents for count bags (bbids BB start+1 ..),
+    placed at hospitals in proportion to their size.
+    """
+    hospital = rng.choice(len(locations), size=count, p=hospital_p).tolist()
+    blood_types = _blood_types(rng, count).tolist()
+    quantities = rng.choice(np.array([450, 500]), size=count).tolist()
+    available = (rng.random(count) < available_ratio).tolist()
+    bags = []
+    inventory = []
+    for i in range(count):
+        bbid = "BB{:08d}".format(start + i + 1)
+        bags.append({"bbid": bbid, "donationType": "Whole Blood", "quantityCC": quantities[i],
+                     "bloodType": blood_types[i], "available": available[i]})
+        inventory.append({"bbid": bbid, "lid": locations[hospital[i]]["lid"], "available": available[i]})
+    return bags, inventory
+
+#######################################
+# Bulk Loader
+#######################################
+
+def generate_dataset(db, hospitals=1000, donors=100000, bags=500000, seed=42, batch_size=BATCH_SIZE,
+                     with_passwords=True, build_stats=True):
+    """
+    Replaces the data collections of db with a synthetic dataset of the given size.
+    Every batch is generated with NumPy from one seeded generator and written with
+    insert_many(ordered=False), so memory stays bounded by batch_size and the same
+    seed and batch_size always produce the same data. Indexes are created after the load and
+    donorStats is rebuilt once at the end. Returns the timings:
+      {"hospitals_s": ..., "donors_s": ..., "bags_s": ..., "indexes_s": ..., "stats_s": ..., "total_s": ...}
+    """
+    rng = np.random.default_rng(seed)
+    for name in ("locations", "persons", "bloodBags", "globalInventory", "donorStats", "counters"):
+        db[name].drop()
+    timings = {}
+    started = time.perf_counter()
+
+    # All synthetic hospitals share one password, hashed once at bcrypt's minimum cost.
+    password_hash = hash_password(SYNTHETIC_PASSWORD, rounds=4) if with_passwords else None
+    locations, hospital_p = generate_hospitals(rng, hospitals, password_hash)
+    db.locations.insert_many(locations, ordered=False)
+    timings["hospitals_s"] = time.perf_counter() - started
+
+    mark = time.perf_counter()
+    for start, count in _batches(donors, batch_size):
+        db.persons.insert_many(generate_donors(rng, start, count, locations, hospital_p), ordered=False)
+    timings["donors_s"] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    for start, count in _batches(bags, batch_size):
+        bag_docs, inventory_docs = generate_bags(rng, start, count, locations, hospital_p)
+        db.bloodBags.insert_many(bag_docs, ordered=False)
+        db.globalInventory.insert_many(inventory_docs, ordered=False)
+    timings["bags_s"] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    ensure_indexes(db)
+    timings["indexes_s"] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    if build_stats:
+        update_secondary_data(db)
+    timings["stats_s"] = time.perf_counter() - mark
+    timings["total_s"] = time.perf_counter() - started
+    return {key: round(value, 3) for key, value in timings.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load a seeded synthetic dataset.")
+    parser.add_argument("--db", default=SYNTHETIC_DB, help=f"Target database (default {SYNTHETIC_DB}); its data is replaced.")
+    parser.add_argument("--hospitals", type=int, default=1000)
+    parser.add_argument("--donors", type=int, default=100000)
+    parser.add_argument("--bags", type=int, default=500000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--skip-stats", action="store_true", help="Don't rebuild donorStats after loading.")
+    args = parser.parse_args()
+
+    timings = generate_dataset(get_db(args.db), args.hospitals, args.donors, args.bags, seed=args.seed,
+                               batch_size=args.batch_size, build_stats=not args.skip_stats)
+    print(f"Loaded {args.hospitals} hospitals, {args.donors} donors and {args.bags} blood bags "
+          f"into '{args.db}' in {timings['total_s']:.1f}s.")
+    for key, value in timings.items():
+        print(f"  {key}: {value:.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# test_live_updates.py
+import queue
+import mongomock
+from pymongo.errors import PyMongoError
+from donor_stats import empty_stats_record
+from live_updates import DonorStatsBroadcaster
+
+#######################################
+# Helpers
+#######################################
+
+class FakeStreamDB:
+    """
+    Stands in for a replica-set database: watch() replays the given change events
+    (mongomock has no change streams) and then fails the way a lost server does.
+    """
+
+    def __init__(self, changes):
+        self.changes = changes
+
+    def watch(self, pipeline, full_document=None):
+        changes = self.changes
+
+        class Stream:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def __iter__(self):
+                yield from changes
+                raise PyMongoError("stream closed")
+
+        return Stream()
+
+def stats_change(db, hospital, city):
+    """
+    A donorStats update event whose fullDocument went through the broadcaster's
+    $addFields stage, like the server would shape it.
+    """
+    db.donorStats.insert_one(empty_stats_record(hospital, city))
+    add_fields = DonorStatsBroadcaster.pipeline()[1]
+    shaped = list(db.donorStats.aggregate([
+        {"$match": {"hospital": hospital, "city": city}},
+        {"$project": {"_id": 0, "fullDocument": "$$ROOT"}},
+        add_fields
+    ]))
+    return {"operationType": "update", "fullDocument": shaped[0]["fullDocument"]}
+
+def drain(subscriber):
+    events = []
+    while True:
+        try:
+            events.append(subscriber.get_nowait())
+        except queue.Empty:
+            return events
+
+#######################################
+# Tests
+#######################################
+
+def test_publishes_hospital_events_then_sentinel_when_stream_fails():
+    db = mongomock.MongoClient().db
+    changes = [stats_change(db, "General Hospital 1", "New York, NY"), {"operationType": "rename"}]
+    broadcaster = DonorStatsBroadcaster()
+    subscriber = broadcaster.subscribe()
+
+    broadcaster.start(FakeStreamDB(changes)).join(timeout=5)
+
+    events = drain(subscriber)
+    assert [event for event, _ in events] == ["hospital", "resync", None]
+    hospital = events[0][1]
+    assert (hospital["hospital"], hospital["city"]) == ("General Hospital 1", "New York, NY")
+    assert hospital["coordinates"] == {}
+    assert [entry["bloodType"] for entry in hospital["bloodData"]][:2] == ["O+", "A+"]
+    assert all(entry["totalBloodCC"] == 0 for entry in hospital["bloodData"])
+    assert not broadcaster.running
+
+def test_full_queue_keeps_sentinel():
+    broadcaster = DonorStatsBroadcaster(queue_size=2)
+    subscriber = broadcaster.subscribe()
+    for _ in range(2):
+        broadcaster.publish("hospital", {})
+    broadcaster.publish("hospital", {})
+    assert drain(subscriber) == [("resync", {})]
+
+    for _ in range(2):
+        broadcaster.publish("hospital", {})
+    broadcaster.publish(None, None)
+    assert drain(subscriber) == [(None, None)]
+
+def test_events_end_after_tailer_stopped():
+    broadcaster = DonorStatsBroadcaster()
+    broadcaster.start(FakeStreamDB([])).join(timeout=5)
+    # Subscribed after the sentinel went out: the heartbeat check ends the stream.
+    subscriber = broadcaster.subscribe()
+    events = broadcaster.events(subscriber, heartbeat_seconds=0.01)
+    assert next(events) == "retry: 5000\n\n"
+    assert list(events) == []
+    assert subscriber not in broadcaster._subscribers
+
+def test_events_format_server_sent_events():
+    broadcaster = DonorStatsBroadcaster()
+    broadcaster.running = True
+    subscriber = broadcaster.subscribe()
+    broadcaster.publish("resync", {})
+    broadcaster.publish(None, None)
+    assert list(broadcaster.events(subscriber)) == ["retry: 5000\n\n", "event: resync\ndata: {}\n\n"]
@@ -0,0 +1,13 @@
+# transactions.py
+
+def run_in_transaction(db, callback):
+    """
+    Runs callback(session) inside a multi-document transaction and returns its result.
+    A standalone mongod (our local default) does not support transactions, so there
+    the callback is run directly with session=None.
+    """
+    client = db.client
+    if client.topology_description.topology_type_name == "Single":
+        return callback(None)
+    with client.start_session() as session:
+        return session.with_transaction(callback)
@@ -0,0 +1,45 @@
+# unique_index.py
+from pymongo.errors import OperationFailure
+
+def find_duplicates(collection, fields, limit=20):
+    """
+    Returns [(value, count)] for up to limit values of fields (one field name or a
+    list of them; a compound value is a dict) that more than one document holds.
+    """
+    if isinstance(fields, str):
+        fields = [fields]
+    group_id = f"${fields[0]}" if len(fields) == 1 else {field: f"${field}" for field in fields}
+    pipeline = [
+        {"$group": {"_id": group_id, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": limit}
+    ]
+    return [(doc["_id"], doc["count"]) for doc in collection.aggregate(pipeline, allowDiskUse=True)]
+
+def create_unique_index(collection, keys, options):
+    """
+    Creates a unique index. A non-unique index left on the same keys by an earlier
+    fallback is replaced once the data allows it. When existing data violates the
+    index, logs the duplicates and creates a plain index instead, so a bad record
+    never keeps the application from starting.
+    """
+    try:
+        collection.create_index(keys, **options)
+    except OperationFailure as e:
+        field = ", ".join(name for name, _ in keys)
+        duplicates = find_duplicates(collection, [name for name, _ in keys])
+        if not duplicates:
+            plain = [name for name, info in collection.index_information().items()
+                     if info["key"] == list(keys) and not info.get("unique")]
+            if plain:
+                collection.drop_index(plain[0])
+                collection.create_index(keys, **options)
+                return
+        print(f"Could not create unique index on {collection.name} ({field}): {e}")
+        for value, count in duplicates:
+            print(f"  {field} {value!r} is held by {count} documents")
+        print("Falling back to a non-unique index; resolve the duplicates and run `python indexes.py`.")
+        try:
+            collection.create_index(keys, **{key: value for key, value in options.items() if key != "unique"})
+        except OperationFailure:
+            pass  # An index on these keys already exists.